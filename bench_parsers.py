@@ -0,0 +1,211 @@
+"""
+bench_parsers.py - Micro-benchmarks for the parsing / diff / embedding hot paths.
+
+Replays the committed corpus (the `content` of every record in diseases.json,
+and every manual rebuilt to full text by fake_cdc.manual_text) through the
+pure functions a scraper run and a dashboard build spend their CPU in:
+
+    build_record        data_parser, one case-definition PDF text -> record
+    normalize_text      data_parser, the NFKC / punctuation / de-dup pass
+    clean_section_text  data_parser, footer / form-noise removal per section
+    parse_manual_text   manual_scraper, one manual text -> 11 sections
+    diff_small          scraper.diff_texts on case sections (synthetic edits)
+    diff_large          scraper.diff_texts on manual sections (synthetic edits)
+    embed_json          dashboard_common.embed_json of both data files
+
+The synthetic edit scripts are seeded (--seed), so every run diffs the same
+pairs: a few sentence insertions / deletions / rewrites and character edits
+per section, like a typical CDC revision.
+
+Each benchmark repeats full passes over its inputs for at least --min-time
+seconds and reports the best pass as ops/sec (one op = one input), plus the
+peak traced memory of one pass (tracemalloc, measured in a separate pass so it
+does not slow the timed ones).
+
+    python bench_parsers.py                          # print a table
+    python bench_parsers.py --save bench_baseline.json
+    python bench_parsers.py --compare bench_baseline.json --threshold 0.25
+
+With --compare, a benchmark whose ops/sec dropped, or whose peak memory grew,
+by more than --threshold (a fraction) against the baseline is flagged and the
+exit status is 1. Baselines are machine-specific: save one on the machine you
+compare on.
+"""
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tracemalloc
+
+from fake_cdc import load_corpus
+from data_parser import build_record, normalize_text, clean_section_text
+from manual_scraper import parse_manual_text
+from scraper import diff_texts
+from dashboard_common import embed_json
+
+logger = logging.getLogger(__name__)
+
+CASE_FIELDS = ["臨床條件", "檢驗條件", "流行病學條件", "通報定義", "疾病分類"]
+DEFAULT_THRESHOLD = 0.25
+
+# Text the synthetic edits insert: plausible revision sentences.
+_EDIT_SENTENCES = [
+    "經衛生福利部公告修正。", "應於24小時內通報。", "檢體應於採檢後儘速送驗；",
+    "接觸者應自主健康管理14日。", "（113年修訂）\n",
+]
+
+
+def _load_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return []
+
+
+def edit(text, rng, edits=3):
+    """text with a few seeded sentence- and character-level edits applied."""
+    chars = list(text)
+    for _ in range(edits):
+        pos = rng.randint(0, len(chars))
+        kind = rng.random()
+        if kind < 0.4:
+            chars[pos:pos] = rng.choice(_EDIT_SENTENCES)
+        elif kind < 0.7:
+            del chars[pos:pos + rng.randint(1, 40)]
+        else:
+            chars[pos:pos + rng.randint(1, 6)] = rng.choice(_EDIT_SENTENCES)[:rng.randint(1, 6)]
+    return "".join(chars)
+
+
+def build_suite(seed=0):
+    """[(name, function, inputs)]; function(item) is one op."""
+    rng = random.Random(seed)
+    cases, manuals = load_corpus()
+    case_texts = [d.text for d in cases]
+    manual_texts = [d.text for d in manuals]
+    case_records = [build_record(t) for t in case_texts]
+    manual_records = [parse_manual_text(t) for t in manual_texts]
+
+    case_sections = [r[k] for r in case_records for k in CASE_FIELDS if r.get(k)]
+    manual_sections = [s for r in manual_records for s in r.values() if s]
+    small_pairs = [(s, edit(s, rng)) for s in case_sections]
+    large_pairs = [(s, edit(s, rng)) for s in manual_sections if len(s) > 500]
+    payloads = [_load_json("diseases.json"), _load_json("disease_manuals.json")]
+
+    return [
+        ("build_record", build_record, case_texts),
+        ("normalize_text", normalize_text, case_texts + manual_texts),
+        ("clean_section_text", clean_section_text, case_sections + manual_sections),
+        ("parse_manual_text", parse_manual_text, manual_texts),
+        ("diff_small", lambda pair: diff_texts(*pair), small_pairs),
+        ("diff_large", lambda pair: diff_texts(*pair), large_pairs),
+        ("embed_json", embed_json, [p for p in payloads if p]),
+    ]
+
+
+def _one_pass(func, inputs):
+    start = time.perf_counter()
+    for item in inputs:
+        func(item)
+    return time.perf_counter() - start
+
+
+def measure(func, inputs, min_time=1.0):
+    """{'ops', 'passes', 'ops_per_sec', 'peak_kb'} for one benchmark."""
+    _one_pass(func, inputs)  # warm-up (regex / lru caches)
+    best, passes, spent = float("inf"), 0, 0.0
+    while spent < min_time or passes < 5:
+        seconds = _one_pass(func, inputs)
+        best = min(best, seconds)
+        spent += seconds
+        passes += 1
+
+    tracemalloc.start()
+    try:
+        _one_pass(func, inputs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "ops": len(inputs),
+        "passes": passes,
+        "ops_per_sec": round(len(inputs) / best, 2) if best > 0 else 0.0,
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Human-readable regressions of results against a saved baseline."""
+    regressions = []
+    for name, now in results.items():
+        then = baseline.get("results", {}).get(name)
+        if not then:
+            continue
+        if then["ops_per_sec"] and now["ops_per_sec"] < then["ops_per_sec"] * (1 - threshold):
+            regressions.append(f"{name}: {now['ops_per_sec']:.1f} ops/s "
+                               f"vs baseline {then['ops_per_sec']:.1f} ops/s")
+        if then["peak_kb"] and now["peak_kb"] > then["peak_kb"] * (1 + threshold):
+            regressions.append(f"{name}: peak {now['peak_kb']:.0f} KB "
+                               f"vs baseline {then['peak_kb']:.0f} KB")
+    return regressions
+
+
+def format_row(name, r, baseline=None):
+    row = (f"{name:<20} {r['ops']:>5} ops x {r['passes']:>3} passes  "
+           f"{r['ops_per_sec']:>10.1f} ops/s  peak {r['peak_kb']:>9.1f} KB")
+    then = (baseline or {}).get("results", {}).get(name)
+    if then and then["ops_per_sec"]:
+        row += f"  ({r['ops_per_sec'] / then['ops_per_sec'] - 1:+.0%} vs baseline)"
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmark the parsers, diff and JSON embedding.")
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds of timed passes per benchmark")
+    parser.add_argument("--only", action="append", default=None,
+                        help="run only benchmarks whose name contains this (repeatable)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic edit scripts")
+    parser.add_argument("--save", default=None, help="write the results as a baseline JSON")
+    parser.add_argument("--compare", default=None, help="baseline JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown / memory growth as a fraction (default 0.25)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = {}
+    for name, func, inputs in build_suite(args.seed):
+        if args.only and not any(o in name for o in args.only):
+            continue
+        if not inputs:
+            logger.warning("%s: no inputs in the corpus, skipped.", name)
+            continue
+        results[name] = measure(func, inputs, args.min_time)
+        print(format_row(name, results[name], baseline), flush=True)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "seed": args.seed, "results": results}, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
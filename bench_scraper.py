@@ -0,0 +1,143 @@
+"""
+bench_scraper.py - End-to-end scraper load benchmark against fake_cdc.py.
+
+Starts the local stand-in CDC site, points the scrapers at it through
+CDC_BASE_URL, and runs scraper.main and manual_scraper.main inside a scratch
+working directory (so the real diseases.json etc. are never touched). Run 1 is
+cold (empty caches); later runs reuse the same directory, so they measure the
+steady state with the text / HTTP / link caches warm.
+
+Per run and scraper it reports documents/sec, requests and bytes served, 304s,
+injected errors, and p50/p95 latency per pipeline stage (from the timings
+fetch_pipeline records on every job).
+
+    python bench_scraper.py --runs 2 --latency 0.05 --error-rate 0.02 --workers 8
+    python bench_scraper.py --json bench.json     # machine-readable results
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from collections import defaultdict
+
+import fake_cdc
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (0.0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(label, run, docs, wall, site_stats, timings):
+    return {
+        "scraper": label,
+        "run": run,
+        "docs": docs,
+        "seconds": round(wall, 3),
+        "docs_per_sec": round(docs / wall, 2) if wall else 0.0,
+        "requests": site_stats["requests"],
+        "bytes": site_stats["bytes"],
+        "not_modified": site_stats["not_modified"],
+        "errors_injected": site_stats["errors"],
+        "stages": {
+            stage: {"n": len(v), "p50_ms": round(percentile(v, 50) * 1000, 1),
+                    "p95_ms": round(percentile(v, 95) * 1000, 1)}
+            for stage, v in timings.items()
+        },
+    }
+
+
+def format_row(r):
+    stages = "  ".join(f"{s} p50={v['p50_ms']}ms p95={v['p95_ms']}ms"
+                       for s, v in r["stages"].items())
+    return (f"run {r['run']} {r['scraper']:<8} {r['docs']:>4} docs in {r['seconds']:>7.2f}s "
+            f"= {r['docs_per_sec']:>6.2f} docs/s | {r['requests']} req, "
+            f"{r['bytes'] / 1024:.0f} KB, {r['not_modified']} x 304, "
+            f"{r['errors_injected']} injected errors | {stages}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers against a local fake CDC site.")
+    fake_cdc.add_site_arguments(parser)
+    parser.add_argument("--runs", type=int, default=2, help="runs in the same workdir (1st is cold)")
+    parser.add_argument("--workers", type=int, default=None, help="SCRAPER_WORKERS for the run")
+    parser.add_argument("--rate", type=float, default=1000.0,
+                        help="SCRAPER_RATE / SCRAPER_MAX_RATE for the run "
+                             "(default effectively unthrottled)")
+    parser.add_argument("--only", choices=("cases", "manuals"), default=None)
+    parser.add_argument("--json", default=None, help="also write the results to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch workdir")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    site = fake_cdc.site_from_args(args)
+    results = []
+    workdir = tempfile.mkdtemp(prefix="bench_scraper_")
+    cwd = os.getcwd()
+
+    with fake_cdc.running(site) as base_url:
+        # Must be in place before the scraper modules (and cdc_common) are imported.
+        os.environ["CDC_BASE_URL"] = base_url
+        os.environ["SCRAPER_RATE"] = os.environ["SCRAPER_MAX_RATE"] = str(args.rate)
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        if args.workers:
+            os.environ["SCRAPER_WORKERS"] = str(args.workers)
+        if "cdc_common" in sys.modules:
+            parser.error("bench_scraper must import the scrapers itself (run it as a script)")
+
+        import cdc_common
+        import fetch_pipeline
+        import scraper
+        import manual_scraper
+
+        timings = defaultdict(list)
+
+        def observe(job):
+            for stage, seconds in job.get("timings", {}).items():
+                timings[stage].append(seconds)
+
+        fetch_pipeline.job_observers.append(observe)
+        targets = [("cases", scraper, len(site.cases)),
+                   ("manuals", manual_scraper, len(site.manuals))]
+        if args.only:
+            targets = [t for t in targets if t[0] == args.only]
+
+        os.chdir(workdir)
+        try:
+            for run in range(1, args.runs + 1):
+                for label, module, docs in targets:
+                    # Fresh per-run HTTP cache counters, limiter and breaker state.
+                    cdc_common._validators = cdc_common._limiter = cdc_common._breaker = None
+                    timings.clear()
+                    site.reset_stats()
+                    start = time.perf_counter()
+                    module.main([])
+                    row = summarize(label, run, docs, time.perf_counter() - start,
+                                    dict(site.stats), timings)
+                    results.append(row)
+                    print(format_row(row), flush=True)
+        finally:
+            os.chdir(cwd)
+            fetch_pipeline.job_observers.remove(observe)
+            if args.keep:
+                print(f"workdir kept at {workdir}")
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
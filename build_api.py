@@ -22,6 +22,7 @@ import logging
 from datetime import datetime, timezone
 
 from cdc_common import setup_logging
+from record_store import get_store
 
 logger = logging.getLogger(__name__)
 
@@ -74,8 +75,9 @@ def build_api_payloads(cases, manuals, now=None):
 
     summary = {
         "generated": generated,
-        "case_definitions": [_summary_row(r) for r in clean_cases],
-        "manuals": [_summary_row(r) for r in clean_manuals],
+        # From the records as loaded: summary fields never need a lazy record's shard.
+        "case_definitions": [_summary_row(r) for r in cases],
+        "manuals": [_summary_row(r) for r in manuals],
     }
 
     return {
@@ -86,18 +88,17 @@ def build_api_payloads(cases, manuals, now=None):
     }
 
 
-def _load(path):
+def _load(dataset):
     try:
-        with open(path, encoding="utf-8") as f:
-            return json.load(f)
+        return get_store().load_lazy(dataset)
     except (FileNotFoundError, json.JSONDecodeError):
         return []
 
 
 def main():
     setup_logging()
-    cases = _load("diseases.json")
-    manuals = _load("disease_manuals.json")
+    cases = _load("cases")
+    manuals = _load("manuals")
     payloads = build_api_payloads(cases, manuals)
 
     os.makedirs(API_DIR, exist_ok=True)
@@ -2,12 +2,26 @@ import json
 import os
 import re
 import logging
+import argparse
 from datetime import datetime
 
-from dashboard_common import SECURITY_JS, embed_json
+from dashboard_common import (DETAILS_DIR, DETAILS_JS, ROWS_JS, SECURITY_JS, embed_json,
+                              split_details, write_details)
+from record_store import get_store
+from search_index import SEARCH_JS, write_index
 
 logger = logging.getLogger(__name__)
 
+# Fields the search box matches (search_index.py indexes them at build time).
+SEARCH_FIELDS = ["name", "english_name", "content"]
+# What index.html embeds per disease (dashboard_common.split_details): these
+# fields whole, the opening characters of each long PREVIEW_FIELDS text, and
+# the name of the details file with everything else.
+SUMMARY_FIELDS = ["name", "english_name", "source_category", "category_tag", "sort_key",
+                  "url", "last_pdf_update"]
+PREVIEW_FIELDS = ["臨床條件", "檢驗條件", "流行病學條件", "通報定義", "疾病分類",
+                  "suspected_case", "probable_case", "confirmed_case"]
+
 HTML_TEMPLATE = """<!DOCTYPE html>
 <html lang="zh-TW">
 <head>
@@ -245,6 +259,12 @@ HTML_TEMPLATE = """<!DOCTYPE html>
             display: none;
         }
         
+        mark {
+            background: #fef08a;
+            color: inherit;
+            padding: 0;
+        }
+
         .tag {
             display: inline-block;
             font-size: 0.7rem;
@@ -377,6 +397,12 @@ HTML_TEMPLATE = """<!DOCTYPE html>
 
 __SECURITY_JS__
 
+__SEARCH_JS__
+
+__ROWS_JS__
+
+__DETAILS_JS__
+
         const tbody = document.getElementById('tableBody');
         const catNav = document.getElementById('catNav');
         const searchInput = document.getElementById('searchInput');
@@ -386,6 +412,7 @@ __SECURITY_JS__
         let currentSort = 'category'; 
 
         const COLS = ["臨床條件", "檢驗條件", "流行病學條件", "通報定義", "疾病分類", "檢體採檢送驗事項"];
+        const CASE_KEYS = ['suspected_case', 'probable_case', 'confirmed_case'];
 
         // Group categories for navigation
         // Key map for sorting/labels
@@ -424,144 +451,200 @@ __SECURITY_JS__
             banner.innerHTML = html;
         }
 
-        function render(filter = '') {
-            tbody.innerHTML = '';
-            catNav.innerHTML = '';
-            
-            const f = filter.toLowerCase();
-            let filtered = DATA.filter(d => 
-                d.name.toLowerCase().includes(f) || 
-                (d.english_name && d.english_name.toLowerCase().includes(f)) ||
-                (d.content && d.content.toLowerCase().includes(f))
-            );
-            
-            // Apply Sorting
-            if (currentSort === 'name') {
-                // Sort by English Name -> Chinese Name
-                filtered.sort((a, b) => {
-                    const enA = (a.english_name || a.name).toLowerCase();
-                    const enB = (b.english_name || b.name).toLowerCase();
-                    return enA.localeCompare(enB);
-                });
-                
-                // Hide Category Nav when sorting by name
-                catNav.style.display = 'none';
-                
-            } else {
-                // Sort by Category Sort Key (which is already done in Python, but we can ensure it here)
-                // Actually DATA comes sorted by category key from Python.
-                // We just need to ensure we process them in order for grouping separators.
-                
-                 catNav.style.display = 'flex';
-            }
+        // One row per disease, built once (in DATA's category order); render()
+        // only filters, reorders and marks them (ROWS_JS). fillRow() runs again
+        // when a slim record's details arrive (DETAILS_JS).
+        function fillRow(row) {
+            const d = row.d;
+            const isUpdated = recentUpdateSet.has(d.name);
+            const updatedBadgeHtml = isUpdated ? `<span class="badge-update">✨ 剛更新</span>` : '';
+
+            // Name Col with tag inline + English Name
+            let html = `<td>
+                <div><span style="font-weight:600" data-mark="name">${esc(d.name)}</span>${d.category_tag ? `<span class="tag">${esc(d.category_tag)}</span>` : ''}${updatedBadgeHtml}</div>
+                ${d.english_name ? `<div style="font-size:0.8rem; color:#555; margin-top:2px" data-mark="english_name">${esc(d.english_name)}</div>` : ''}
+                <a href="${esc(safeUrl(d.url))}" target="_blank" class="pdf-link">View PDF</a>
+            </td>`;
+
+            COLS.forEach(key => {
+                // For 檢體採檢送驗事項, show PDF link instead of content
+                if (key === "檢體採檢送驗事項") {
+                    html += `<td>
+                        <a href="${esc(safeUrl(d.url))}" target="_blank" class="pdf-link" style="opacity:1">詳見 PDF</a>
+                    </td>`;
+                } else if (key === "疾病分類" && CASE_KEYS.some(k => fieldText(d, k))) {
+                    // Render structured case definitions
+                    html += `<td><div class="cell-content">`;
+
+                    const printCase = (key) => {
+                        const caseRaw = fieldText(d, key);
+                        if (!caseRaw) return '';
+                        if (isPreview(d, key)) return esc(caseRaw) + '…';
+                        const caseDiff = d[key + "_diff"];
+                        return (isUpdated && caseDiff) ? renderDiff(caseDiff, caseRaw) : esc(caseRaw);
+                    };
 
-            let lastCat = null;
-            const catsFound = new Set();
-            
-            filtered.forEach((d, index) => {
-                const currentCat = d.sort_key || 99;
-                catsFound.add(currentCat);
-                
-                // Add Category Header Row if we are in Category Sort Mode
-                if (currentSort === 'category' && currentCat !== lastCat) {
-                    lastCat = currentCat;
-                    
-                    // Row for anchor
-                    const headerRow = document.createElement('tr');
-                    headerRow.className = 'category-header-row';
-                    headerRow.id = `cat-${currentCat}`;
-                    headerRow.innerHTML = `<td colspan="7">${CAT_LABELS[currentCat] || "Other"}</td>`;
-                    tbody.appendChild(headerRow);
+                    if (fieldText(d, 'suspected_case')) {
+                        html += `<div style="margin-bottom:8px"><strong style="color:#eab308; font-size:0.85em">可能病例 Suspected</strong><br>${printCase('suspected_case')}</div>`;
+                    }
+                    if (fieldText(d, 'probable_case')) {
+                        html += `<div style="margin-bottom:8px"><strong style="color:#f97316; font-size:0.85em">極可能病例 Probable</strong><br>${printCase('probable_case')}</div>`;
+                    }
+                    if (fieldText(d, 'confirmed_case')) {
+                        html += `<div><strong style="color:#ef4444; font-size:0.85em">確定病例 Confirmed</strong><br>${printCase('confirmed_case')}</div>`;
+                    }
+
+                    // If there is leftover text in "疾病分類" that wasn't parsed? 
+                    // Our parser splits by keys, so we only captured what was under keys.
+                    // d['疾病分類'] contains the full original text.
+                    // We can just show the structured parts.
+
+                    const more = CASE_KEYS.some(k => isPreview(d, k));
+                    html += `</div>
+                    <button class="toggle-btn" onclick="toggle(this)" style="display:${more ? 'inline-block' : 'none'}">Show More</button>
+                    </td>`;
+                } else {
+                    // A preview is re-filled, not marked, once the details arrive.
+                    const preview = isPreview(d, key);
+                    const diffed = isUpdated && d[key + "_diff"];
+                    const text = preview ? esc(fieldText(d, key)) + '…'
+                        : diffed ? renderDiff(d[key + "_diff"], d[key]) : esc(d[key] || "");
+                    html += `<td>
+                        <div class="cell-content"${diffed || preview ? '' : ` data-mark="${esc(key)}"`}>${text}</div>
+                        ${text ? `<button class="toggle-btn" onclick="toggle(this)" style="display:${preview ? 'inline-block' : 'none'}">Show More</button>` : ''}
+                    </td>`;
                 }
+            });
+
+            row.tr.innerHTML = html;
+            row.marks = {};
+            row.marked.clear();
+            row.tr.querySelectorAll('[data-mark]').forEach(el => { row.marks[el.dataset.mark] = el; });
+            return row;
+        }
+
+        const rows = DATA.map((d, i) => {
+            const tr = document.createElement('tr');
+            tr.dataset.doc = i;
+            return fillRow({d, i, tr, cat: d.sort_key || 99, marks: {}, marked: new Set(), measured: false});
+        });
+
+        // Details arrived: rebuild those rows, then search again (their texts
+        // may turn a pending hit into a miss, or add marks).
+        function detailsLoaded(docs) {
+            docs.forEach(doc => {
+                const row = rows[doc];
+                fillRow(row);
+                row.measured = false;
+            });
+            wantedQuery = null;
+            render(searchInput.value);
+        }
+        const fetchDetails = (docs) => {
+            const missing = [...docs].filter(doc => DATA[doc].detail);
+            if (missing.length)
+                loadDetails(missing).then(() => detailsLoaded(missing), err => console.warn(err));
+        };
+        let rowsByName = null;
+        const headerRows = new Map();
 
+        function headerRow(cat) {
+            if (!headerRows.has(cat)) {
+                // Row for anchor
                 const tr = document.createElement('tr');
-                
-                const isUpdated = recentUpdateSet.has(d.name);
-                const updatedBadgeHtml = isUpdated ? `<span class="badge-update">✨ 剛更新</span>` : '';
-                
-                // Name Col with tag inline + English Name
-                let html = `<td>
-                    <div><span style="font-weight:600">${esc(d.name)}</span>${d.category_tag ? `<span class="tag">${esc(d.category_tag)}</span>` : ''}${updatedBadgeHtml}</div>
-                    ${d.english_name ? `<div style="font-size:0.8rem; color:#555; margin-top:2px">${esc(d.english_name)}</div>` : ''}
-                    <a href="${esc(safeUrl(d.url))}" target="_blank" class="pdf-link">View PDF</a>
-                </td>`;
-                
-                COLS.forEach(key => {
-                    // For 檢體採檢送驗事項, show PDF link instead of content
-                    if (key === "檢體採檢送驗事項") {
-                        html += `<td>
-                            <a href="${esc(safeUrl(d.url))}" target="_blank" class="pdf-link" style="opacity:1">詳見 PDF</a>
-                        </td>`;
-                    } else if (key === "疾病分類" && (d.suspected_case || d.probable_case || d.confirmed_case)) {
-                        // Render structured case definitions
-                        html += `<td><div class="cell-content">`;
-                        
-                        const printCase = (caseRaw, caseDiff) => {
-                            if (!caseRaw) return '';
-                            return (isUpdated && caseDiff) ? renderDiff(caseDiff) : esc(caseRaw);
-                        };
-                        
-                        if (d.suspected_case) {
-                            html += `<div style="margin-bottom:8px"><strong style="color:#eab308; font-size:0.85em">可能病例 Suspected</strong><br>${printCase(d.suspected_case, d.suspected_case_diff)}</div>`;
-                        }
-                        if (d.probable_case) {
-                            html += `<div style="margin-bottom:8px"><strong style="color:#f97316; font-size:0.85em">極可能病例 Probable</strong><br>${printCase(d.probable_case, d.probable_case_diff)}</div>`;
-                        }
-                        if (d.confirmed_case) {
-                            html += `<div><strong style="color:#ef4444; font-size:0.85em">確定病例 Confirmed</strong><br>${printCase(d.confirmed_case, d.confirmed_case_diff)}</div>`;
-                        }
-                        
-                        // If there is leftover text in "疾病分類" that wasn't parsed? 
-                        // Our parser splits by keys, so we only captured what was under keys.
-                        // d['疾病分類'] contains the full original text.
-                        // We can just show the structured parts.
-                        
-                        html += `</div>
-                        <button class="toggle-btn" onclick="toggle(this)" style="display:none">Show More</button>
-                        </td>`;
-                    } else {
-                        const text = (isUpdated && d[key + "_diff"]) ? renderDiff(d[key + "_diff"]) : esc(d[key] || "");
-                        html += `<td>
-                            <div class="cell-content">${text}</div>
-                            ${text ? '<button class="toggle-btn" onclick="toggle(this)" style="display:none">Show More</button>' : ''}
-                        </td>`;
+                tr.className = 'category-header-row';
+                tr.id = `cat-${cat}`;
+                tr.innerHTML = `<td colspan="7">${CAT_LABELS[cat] || "Other"}</td>`;
+                headerRows.set(cat, tr);
+            }
+            return headerRows.get(cat);
+        }
+
+        function placeRows() {
+            const frag = document.createDocumentFragment();
+            if (currentSort === 'name') {
+                // Sort by English Name -> Chinese Name (ordered by the search worker;
+                // DATA order until it has answered)
+                (rowsByName || rows).forEach(row => frag.appendChild(row.tr));
+            } else {
+                // DATA comes sorted by category key from Python: a header before each group.
+                let lastCat = null;
+                rows.forEach(row => {
+                    if (row.cat !== lastCat) {
+                        lastCat = row.cat;
+                        frag.appendChild(headerRow(row.cat));
                     }
+                    frag.appendChild(row.tr);
                 });
-                
-                tr.innerHTML = html;
-                tbody.appendChild(tr);
-            });
-            
-            // Generate Nav Buttons
-            CAT_ORDER.forEach(c => {
-                if (catsFound.has(c)) {
-                    const btn = document.createElement('button');
-                    btn.className = 'nav-btn';
-                    btn.textContent = CAT_LABELS[c];
-                    btn.onclick = () => {
-                        const el = document.getElementById(`cat-${c}`);
-                        if(el) {
-                            el.scrollIntoView({ behavior: 'smooth', block: 'start' });
-                        }
-                    };
-                    catNav.appendChild(btn);
-                }
-            });
-            
-            // Helper to check overflow
-            setTimeout(() => {
-                document.querySelectorAll('.cell-content').forEach(div => {
-                    if (div.scrollHeight > div.clientHeight) {
-                         const btn = div.nextElementSibling;
-                         if (btn && btn.classList.contains('toggle-btn')) {
-                             btn.style.display = 'inline-block';
-                         }
+            }
+            tbody.appendChild(frag);
+        }
+
+        let wantedQuery = null, wantedSort = null, shownSort = null, navKey = null;
+
+        function render(filter = '') {
+            const q = filter.toLowerCase();
+            if (q === wantedQuery && currentSort === wantedSort) return;
+            wantedQuery = q;
+            wantedSort = currentSort;
+            runSearch(q, hits => show(q, hits));
+        }
+
+        function show(q, hits) {
+            const firstShown = filterRows(rows, hits, q);
+            if (hits) fetchDetails(hits.pending);
+            if (currentSort !== shownSort) placeRows();
+            shownSort = currentSort;
+
+            const catsFound = new Set(rows.filter(row => !row.tr.hidden).map(row => row.cat));
+            headerRows.forEach((tr, cat) => { tr.hidden = currentSort !== 'category' || !catsFound.has(cat); });
+            // Hide Category Nav when sorting by name
+            catNav.style.display = currentSort === 'name' ? 'none' : 'flex';
+
+            // Generate Nav Buttons (only when the set of categories changed)
+            const key = CAT_ORDER.filter(c => catsFound.has(c)).join();
+            if (key !== navKey) {
+                navKey = key;
+                catNav.innerHTML = '';
+                CAT_ORDER.forEach(c => {
+                    if (catsFound.has(c)) {
+                        const btn = document.createElement('button');
+                        btn.className = 'nav-btn';
+                        btn.textContent = CAT_LABELS[c];
+                        btn.onclick = () => {
+                            const el = document.getElementById(`cat-${c}`);
+                            if(el) {
+                                el.scrollIntoView({ behavior: 'smooth', block: 'start' });
+                            }
+                        };
+                        catNav.appendChild(btn);
                     }
                 });
-            }, 0);
+            }
+
+            showOverflowToggles(firstShown);
         }
 
         window.toggle = function(btn) {
+            const tr = btn.closest('tr');
+            const row = rows[tr.dataset.doc];
+            if (row.d.detail) {
+                // A preview: fetch the whole record, then open the same cell.
+                const column = [...tr.children].indexOf(btn.closest('td'));
+                btn.textContent = 'Loading…';
+                loadDetails([row.i]).then(() => {
+                    detailsLoaded([row.i]);
+                    const again = tr.children[column].querySelector('.toggle-btn');
+                    if (again) {
+                        again.style.display = 'inline-block';
+                        toggle(again);
+                    }
+                }, err => {
+                    btn.textContent = 'Show More';
+                    console.warn(err);
+                });
+                return;
+            }
             const div = btn.previousElementSibling;
             div.classList.toggle('expanded');
             btn.textContent = div.classList.contains('expanded') ? 'Show Less' : 'Show More';
@@ -582,13 +665,22 @@ __SECURITY_JS__
             }
         }
 
-        searchInput.addEventListener('input', e => render(e.target.value));
+        searchInput.addEventListener('input', debounce(() => render(searchInput.value), SEARCH_DEBOUNCE_MS));
         sortSelect.addEventListener('change', (e) => {
             currentSort = e.target.value;
             render(searchInput.value);
         });
 
         render();
+        // Recently updated rows show their diffs: fetch those details right away.
+        fetchDetails(recentUpdates.map(d => DATA.indexOf(d)));
+        startSearch('search/cases.json', __SEARCH_FIELDS__, {name: {keys: ['english_name', 'name']}}, orders => {
+            rowsByName = orders.name.map(i => rows[i]);
+            if (currentSort === 'name') {
+                shownSort = wantedSort = null;
+                render(searchInput.value);
+            }
+        });
     </script>
 </body>
 </html>
@@ -620,12 +712,15 @@ def parse_category_sort_key(classification):
         if val: return val, f"第{val_str}類"
     return 99, ""
 
-def main():
+def main(argv=None):
     from cdc_common import setup_logging
     setup_logging()
+    parser = argparse.ArgumentParser(description="Build index.html from the case definitions.")
+    parser.add_argument("--single-file", action="store_true",
+                        help="embed every record in full (works offline; no details/ files)")
+    args = parser.parse_args(argv)
     try:
-        with open("diseases.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = get_store().load("cases")
     except FileNotFoundError:
         logger.error("diseases.json not found")
         return
@@ -645,7 +740,12 @@ def main():
     # Sort order: 1, 5, 2, 3, 4, others (99)
     custom_order = {1: 0, 5: 1, 2: 2, 3: 3, 4: 4, 99: 5}
     data.sort(key=lambda x: (custom_order.get(x['sort_key'], 5), x['name']))
-    json_str = embed_json(data)
+    if args.single_file:
+        json_str = embed_json(data)
+    else:
+        slim, details = split_details(data, SUMMARY_FIELDS, PREVIEW_FIELDS)
+        write_details(details, os.path.join(DETAILS_DIR, "cases"))
+        json_str = embed_json(slim)
     
     # Determine last updated time
     # Priority: metadata.json > diseases.json mtime > now
@@ -662,7 +762,15 @@ def main():
         ts = os.path.getmtime("diseases.json")
         last_updated = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M")
 
+    write_index("cases", data, SEARCH_FIELDS)
+
     html_content = HTML_TEMPLATE.replace("__SECURITY_JS__", SECURITY_JS)
+    html_content = html_content.replace("__SEARCH_JS__", SEARCH_JS)
+    html_content = html_content.replace("__ROWS_JS__", ROWS_JS)
+    html_content = html_content.replace("__DETAILS_JS__", DETAILS_JS)
+    html_content = html_content.replace(
+        "__DETAILS_DIR__", "null" if args.single_file else embed_json(f"{DETAILS_DIR}/cases/"))
+    html_content = html_content.replace("__SEARCH_FIELDS__", embed_json(SEARCH_FIELDS))
     html_content = html_content.replace("__DATA_PLACEHOLDER__", json_str)
     html_content = html_content.replace("<!-- LAST_UPDATED -->", last_updated)
     
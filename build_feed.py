@@ -17,6 +17,8 @@ from datetime import datetime, timezone
 from email.utils import format_datetime
 from xml.sax.saxutils import escape
 
+from record_store import get_store
+
 logger = logging.getLogger(__name__)
 
 # The published site root; override with SITE_URL if the Pages URL differs.
@@ -90,10 +92,9 @@ def build_feed(case_data, manual_data, site_url=SITE_URL, now=None):
     return "\n".join(parts)
 
 
-def _load(path):
+def _load(dataset):
     try:
-        with open(path, encoding="utf-8") as f:
-            return json.load(f)
+        return get_store().load_lazy(dataset)
     except (FileNotFoundError, json.JSONDecodeError):
         return []
 
@@ -101,8 +102,8 @@ def _load(path):
 def main():
     from cdc_common import setup_logging
     setup_logging()
-    case_data = _load("diseases.json")
-    manual_data = _load("disease_manuals.json")
+    case_data = _load("cases")
+    manual_data = _load("manuals")
     xml = build_feed(case_data, manual_data)
     with open("feed.xml", "w", encoding="utf-8") as f:
         f.write(xml)
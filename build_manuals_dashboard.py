@@ -1,12 +1,26 @@
 import json
 import os
 import logging
+import argparse
 from datetime import datetime
 
-from dashboard_common import SECURITY_JS, embed_json
+from dashboard_common import (DETAILS_DIR, DETAILS_JS, ROWS_JS, SECURITY_JS, embed_json,
+                              split_details, write_details)
+from record_store import get_store
+from search_index import SEARCH_JS, write_index
 
 logger = logging.getLogger(__name__)
 
+# Fields the search box matches (search_index.py indexes them at build time);
+# the sections are the page's COLS.
+SEARCH_FIELDS = ["name", "疾病概述", "致病原", "流行病學", "傳染窩", "傳染方式", "潛伏期",
+                 "可傳染期", "感受性及抵抗力", "病例定義", "檢體採檢送驗事項", "防疫措施"]
+# What manuals.html embeds per manual (dashboard_common.split_details): these
+# fields whole, the opening characters of each long section, and the name of
+# the details file with everything else.
+SUMMARY_FIELDS = ["name", "url", "last_pdf_update"]
+PREVIEW_FIELDS = SEARCH_FIELDS[1:]
+
 HTML_TEMPLATE = """<!DOCTYPE html>
 <html lang="zh-TW">
 <head>
@@ -205,8 +219,23 @@ HTML_TEMPLATE = """<!DOCTYPE html>
         }
         .pdf-link:hover { text-decoration: underline; color: #1d4ed8; }
 
+        /* Stand-ins for the rows virtual rendering hasn't mounted */
+        tr.spacer-row td {
+            padding: 0;
+            border: 0;
+            position: static;
+            width: auto;
+            min-width: 0;
+        }
+
         .pdf-link:hover { text-decoration: underline; color: #1d4ed8; }
 
+        mark {
+            background: #fef08a;
+            color: inherit;
+            padding: 0;
+        }
+
         .badge-update {
             display: inline-block;
             background: #fef08a;
@@ -321,6 +350,13 @@ HTML_TEMPLATE = """<!DOCTYPE html>
         const DATA = __DATA_PLACEHOLDER__;
 
 __SECURITY_JS__
+
+__SEARCH_JS__
+
+__ROWS_JS__
+
+__DETAILS_JS__
+
         const tbody = document.getElementById('tableBody');
         const searchInput = document.getElementById('searchInput');
 
@@ -331,82 +367,240 @@ __SECURITY_JS__
         
         const THIRTY_DAYS_MS = 30 * 24 * 60 * 60 * 1000;
 
-        function render(filter = '') {
-            tbody.innerHTML = '';
-            
-            // Calculate Recent Updates
-            const now = Date.now();
-            const recentUpdates = [];
-            const recentUpdateSet = new Set();
-            
-            DATA.forEach(d => {
-                if (d.last_pdf_update) {
-                    const updateTime = new Date(d.last_pdf_update).getTime();
-                    if (now - updateTime <= THIRTY_DAYS_MS) {
-                        recentUpdates.push(d.name);
-                        recentUpdateSet.add(d.name);
-                    }
+        // Calculate Recent Updates
+        const now = Date.now();
+        const recentUpdates = [];
+        const recentUpdateSet = new Set();
+
+        DATA.forEach(d => {
+            if (d.last_pdf_update) {
+                const updateTime = new Date(d.last_pdf_update).getTime();
+                if (now - updateTime <= THIRTY_DAYS_MS) {
+                    recentUpdates.push(d.name);
+                    recentUpdateSet.add(d.name);
                 }
-            });
-            
-            const banner = document.getElementById('recentUpdatesBanner');
-            if (recentUpdates.length > 0) {
-                const namesHtml = recentUpdates.map(name => `<a href="javascript:searchInput.value='${esc(name)}';render('${esc(name)}')" style="color:#b45309; text-decoration:underline; margin-right:8px; font-weight:500">${esc(name)}</a>`).join('');
-                banner.innerHTML = `<span style="font-weight:600; color:#92400e;">✨ 剛更新 (最近30天內):</span> ${namesHtml}`;
-                banner.style.display = 'block';
-            } else {
-                banner.style.display = 'none';
             }
-            
-            const f = filter.toLowerCase();
-            let filtered = DATA.filter(d => {
-                if (d.name.toLowerCase().includes(f)) return true;
-                // Also search inside content
-                for (let col of COLS) {
-                    if (d[col] && d[col].toLowerCase().includes(f)) return true;
-                }
-                return false;
+        });
+
+        const banner = document.getElementById('recentUpdatesBanner');
+        if (recentUpdates.length > 0) {
+            const namesHtml = recentUpdates.map(name => `<a href="javascript:searchInput.value='${esc(name)}';render('${esc(name)}')" style="color:#b45309; text-decoration:underline; margin-right:8px; font-weight:500">${esc(name)}</a>`).join('');
+            banner.innerHTML = `<span style="font-weight:600; color:#92400e;">✨ 剛更新 (最近30天內):</span> ${namesHtml}`;
+            banner.style.display = 'block';
+        } else {
+            banner.style.display = 'none';
+        }
+
+        // One row per manual, built on first use; render() only filters and marks
+        // them (ROWS_JS), and in virtual mode mounts just the ones near the viewport.
+        // fillRow() runs again when a slim record's details arrive (DETAILS_JS).
+        function fillRow(row) {
+            const d = row.d;
+            const isUpdated = recentUpdateSet.has(d.name);
+            const updatedBadgeHtml = isUpdated ? `<span class="badge-update">✨ 剛更新</span>` : '';
+
+            let html = `<td>
+                <div style="font-weight:600; font-size:1.05rem; margin-bottom:4px;"><span data-mark="name">${esc(d.name)}</span>${updatedBadgeHtml}</div>
+                <a href="${esc(safeUrl(d.url))}" target="_blank" class="pdf-link">下載 PDF 手冊 📥</a>
+            </td>`;
+
+            COLS.forEach(key => {
+                // A preview is re-filled, not marked, once the details arrive.
+                const preview = isPreview(d, key);
+                const diffed = isUpdated && d[key + "_diff"];
+                const text = preview ? esc(fieldText(d, key)) + '…'
+                    : diffed ? renderDiff(d[key + "_diff"], d[key]) : esc(d[key] || "");
+                html += `<td>
+                    <div class="cell-content"${diffed || preview ? '' : ` data-mark="${esc(key)}"`}>${text}</div>
+                    ${text.length > 100 ? `<button class="toggle-btn" onclick="toggle(this)" style="display:${preview ? 'inline-block' : 'none'}">Show More</button>` : ''}
+                </td>`;
             });
-            
-            // Sort alphabetically by name
-            filtered.sort((a, b) => a.name.localeCompare(b.name, 'zh-TW'));
 
-            filtered.forEach(d => {
+            if (!row.tr) {
+                row.tr = document.createElement('tr');
+                row.tr.id = `manual-${d.name}`;  // anchor: manuals.html#manual-<name>
+                row.tr.dataset.doc = row.i;
+            }
+            row.tr.innerHTML = html;
+            row.marks = {};
+            row.marked.clear();
+            row.tr.querySelectorAll('[data-mark]').forEach(el => { row.marks[el.dataset.mark] = el; });
+            return row;
+        }
+
+        const rows = DATA.map((d, i) => ({d, i, tr: null, marks: null, marked: new Set(),
+                                         measured: false, height: 0, markQuery: ''}));
+        // Sorted alphabetically by name, once, by the search worker (startSearch
+        // below); filtering keeps the order.
+        let ordered = rows;
+
+        // --- Virtual rows -------------------------------------------------
+        // Only the rows in or near the viewport are in the table; two spacer
+        // rows stand in for the others, sized from each row's last measured
+        // height (the average so far for rows never shown). A ResizeObserver
+        // keeps the heights current (Show More, fonts, window width). The
+        // table, its sticky header and first column are untouched, and
+        // #manual-<name> anchors scroll to rows that aren't mounted yet.
+        // `python build_manuals_dashboard.py --full-render` builds every row
+        // up front instead.
+        const VIRTUAL_ROWS = __VIRTUAL_ROWS__;
+        const OVERSCAN_PX = 800;
+
+        const virtualRows = (() => {
+            let shown = [], hits = null, q = '', mounted = [], scheduled = false;
+            const spacer = () => {
                 const tr = document.createElement('tr');
-                const isUpdated = recentUpdateSet.has(d.name);
-                const updatedBadgeHtml = isUpdated ? `<span class="badge-update">✨ 剛更新</span>` : '';
-                
-                let html = `<td>
-                    <div style="font-weight:600; font-size:1.05rem; margin-bottom:4px;">${esc(d.name)}${updatedBadgeHtml}</div>
-                    <a href="${esc(safeUrl(d.url))}" target="_blank" class="pdf-link">下載 PDF 手冊 📥</a>
-                </td>`;
-                
-                COLS.forEach(key => {
-                    const text = (isUpdated && d[key + "_diff"]) ? renderDiff(d[key + "_diff"]) : esc(d[key] || "");
-                    html += `<td>
-                        <div class="cell-content">${text}</div>
-                        ${text.length > 100 ? '<button class="toggle-btn" onclick="toggle(this)" style="display:none">Show More</button>' : ''}
-                    </td>`;
-                });
-                
-                tr.innerHTML = html;
-                tbody.appendChild(tr);
+                tr.className = 'spacer-row';
+                tr.innerHTML = `<td colspan="${COLS.length + 1}"></td>`;
+                return tr;
+            };
+            const top = spacer(), bottom = spacer();
+            const rowOf = new WeakMap();
+            const resized = new ResizeObserver(entries => {
+                entries.forEach(e => { rowOf.get(e.target).height = e.target.getBoundingClientRect().height; });
+                schedule();
             });
-            
-            // Helper to check overflow
-            setTimeout(() => {
-                document.querySelectorAll('.cell-content').forEach(div => {
-                    if (div.scrollHeight > div.clientHeight) {
-                         const btn = div.nextElementSibling;
-                         if (btn && btn.classList.contains('toggle-btn')) {
-                             btn.style.display = 'inline-block';
-                         }
+
+            const estimate = () => {
+                const seen = rows.filter(r => r.height);
+                return seen.length ? seen.reduce((sum, r) => sum + r.height, 0) / seen.length : 240;
+            };
+            const offsetOf = (row) => {
+                const est = estimate();
+                let y = 0;
+                for (const r of shown) {
+                    if (r === row) break;
+                    y += r.height || est;
+                }
+                return y;
+            };
+            const mount = (row) => {
+                if (!row.tr) {
+                    fillRow(row);
+                    rowOf.set(row.tr, row);
+                }
+                if (row.markQuery !== q) {  // marks catch up when a row is shown
+                    markRow(row, hits ? hits.get(row.i) : null, q);
+                    row.markQuery = q;
+                }
+                return row.tr;
+            };
+
+            function update() {
+                scheduled = false;
+                const est = estimate();
+                const viewTop = -tbody.getBoundingClientRect().top - OVERSCAN_PX;
+                const viewBottom = viewTop + window.innerHeight + 2 * OVERSCAN_PX;
+                let y = 0, first = -1, last = -1, above = 0, inside = 0;
+                shown.forEach((row, k) => {
+                    const h = row.height || est;
+                    if (y + h >= viewTop && y <= viewBottom) {
+                        if (first < 0) { first = k; above = y; }
+                        last = k;
+                        inside += h;
                     }
+                    y += h;
                 });
-            }, 0);
+                if (first < 0) above = y;
+                const next = first < 0 ? [] : shown.slice(first, last + 1);
+                top.firstChild.style.height = `${above}px`;
+                bottom.firstChild.style.height = `${y - above - inside}px`;
+                next.forEach(mount);
+                if (next.length !== mounted.length || next.some((row, k) => row !== mounted[k])) {
+                    mounted.forEach(row => { if (!next.includes(row)) resized.unobserve(row.tr); });
+                    next.forEach(row => { if (!mounted.includes(row)) resized.observe(row.tr); });
+                    tbody.replaceChildren(top, ...next.map(row => row.tr), bottom);
+                    mounted = next;
+                }
+                const firstShown = next.filter(row => !row.measured);
+                firstShown.forEach(row => { row.measured = true; });
+                showOverflowToggles(firstShown);
+            }
+            function schedule() {
+                if (!scheduled) {
+                    scheduled = true;
+                    requestAnimationFrame(update);
+                }
+            }
+
+            return {
+                filter(newHits, newQuery) {
+                    const tableTop = tbody.getBoundingClientRect().top;
+                    // A new query while scrolled into the table: start its results at the top.
+                    if (newQuery !== q && tableTop < 0) window.scrollTo(0, window.scrollY + tableTop);
+                    hits = newHits;
+                    q = newQuery;
+                    shown = hits ? ordered.filter(row => hits.has(row.i)) : ordered;
+                    update();
+                },
+                reveal(name) {
+                    const row = ordered.find(r => r.d.name === name);
+                    if (!row) return;
+                    if (!shown.includes(row)) {
+                        searchInput.value = '';
+                        render('');
+                    }
+                    window.scrollTo(0, window.scrollY + tbody.getBoundingClientRect().top + offsetOf(row));
+                    update();
+                    row.tr.scrollIntoView({ block: 'start' });
+                },
+                schedule,
+            };
+        })();
+
+        // Details arrived: rebuild those rows (if built), then search again
+        // (their texts may turn a pending hit into a miss, or add marks).
+        function detailsLoaded(docs) {
+            docs.forEach(doc => {
+                const row = rows[doc];
+                if (!row.tr) return;
+                fillRow(row);
+                row.markQuery = null;
+                row.measured = false;
+            });
+            wantedQuery = null;
+            render(searchInput.value);
+        }
+        const fetchDetails = (docs) => {
+            const missing = [...docs].filter(doc => DATA[doc].detail);
+            if (missing.length)
+                loadDetails(missing).then(() => detailsLoaded(missing), err => console.warn(err));
+        };
+
+        let wantedQuery = null;
+
+        function render(filter = '') {
+            // Name and every section (search_index.py), in the search worker
+            const q = filter.toLowerCase();
+            if (q === wantedQuery) return;
+            wantedQuery = q;
+            runSearch(q, hits => {
+                if (VIRTUAL_ROWS) virtualRows.filter(hits, q);
+                else showOverflowToggles(filterRows(rows, hits, q));
+                if (hits) fetchDetails(hits.pending);
+            });
         }
 
         window.toggle = function(btn) {
+            const tr = btn.closest('tr');
+            const row = rows[tr.dataset.doc];
+            if (row.d.detail) {
+                // A preview: fetch the whole record, then open the same cell.
+                const column = [...tr.children].indexOf(btn.closest('td'));
+                btn.textContent = 'Loading…';
+                loadDetails([row.i]).then(() => {
+                    detailsLoaded([row.i]);
+                    const again = tr.children[column].querySelector('.toggle-btn');
+                    if (again) {
+                        again.style.display = 'inline-block';
+                        toggle(again);
+                    }
+                }, err => {
+                    btn.textContent = 'Show More';
+                    console.warn(err);
+                });
+                return;
+            }
             const div = btn.previousElementSibling;
             div.classList.toggle('expanded');
             btn.textContent = div.classList.contains('expanded') ? 'Show Less' : 'Show More';
@@ -426,25 +620,52 @@ __SECURITY_JS__
             }
         }
 
-        searchInput.addEventListener('input', e => render(e.target.value));
+        searchInput.addEventListener('input', debounce(() => render(searchInput.value), SEARCH_DEBOUNCE_MS));
 
-        render();
+        startSearch('search/manuals.json', __SEARCH_FIELDS__, {name: {keys: ['name'], locale: 'zh-TW'}}, orders => {
+            ordered = orders.name.map(i => rows[i]);
+            if (VIRTUAL_ROWS) {
+                window.addEventListener('scroll', virtualRows.schedule, { passive: true });
+                window.addEventListener('resize', virtualRows.schedule);
+                document.getElementById('tableContainer').addEventListener('scroll', virtualRows.schedule, { passive: true });
+                window.addEventListener('hashchange', () => {
+                    virtualRows.reveal(decodeURIComponent(location.hash.slice(1)).replace(/^manual-/, ''));
+                });
+            } else {
+                ordered.forEach(row => tbody.appendChild(fillRow(row).tr));
+            }
+            render();
+            // Recently updated rows show their diffs: fetch those details right away.
+            fetchDetails(rows.filter(row => recentUpdateSet.has(row.d.name)).map(row => row.i));
+            if (VIRTUAL_ROWS && location.hash)
+                virtualRows.reveal(decodeURIComponent(location.hash.slice(1)).replace(/^manual-/, ''));
+        });
     </script>
 </body>
 </html>
 """
 
-def main():
+def main(argv=None):
     from cdc_common import setup_logging
     setup_logging()
+    parser = argparse.ArgumentParser(description="Build manuals.html from the disease manuals.")
+    parser.add_argument("--full-render", action="store_true",
+                        help="build every table row on load instead of only those near the viewport")
+    parser.add_argument("--single-file", action="store_true",
+                        help="embed every record in full (works offline; no details/ files)")
+    args = parser.parse_args(argv)
     try:
-        with open("disease_manuals.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = get_store().load("manuals")
     except FileNotFoundError:
         logger.error("disease_manuals.json not found")
         return
 
-    json_str = embed_json(data)
+    if args.single_file:
+        json_str = embed_json(data)
+    else:
+        slim, details = split_details(data, SUMMARY_FIELDS, PREVIEW_FIELDS)
+        write_details(details, os.path.join(DETAILS_DIR, "manuals"))
+        json_str = embed_json(slim)
     
     last_updated = datetime.now().strftime("%Y-%m-%d %H:%M")
     
@@ -460,7 +681,16 @@ def main():
         ts = os.path.getmtime("disease_manuals.json")
         last_updated = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M")
 
+    write_index("manuals", data, SEARCH_FIELDS)
+
     html_content = HTML_TEMPLATE.replace("__SECURITY_JS__", SECURITY_JS)
+    html_content = html_content.replace("__SEARCH_JS__", SEARCH_JS)
+    html_content = html_content.replace("__ROWS_JS__", ROWS_JS)
+    html_content = html_content.replace("__DETAILS_JS__", DETAILS_JS)
+    html_content = html_content.replace(
+        "__DETAILS_DIR__", "null" if args.single_file else embed_json(f"{DETAILS_DIR}/manuals/"))
+    html_content = html_content.replace("__SEARCH_FIELDS__", embed_json(SEARCH_FIELDS))
+    html_content = html_content.replace("__VIRTUAL_ROWS__", "false" if args.full_render else "true")
     html_content = html_content.replace("__DATA_PLACEHOLDER__", json_str)
     html_content = html_content.replace("<!-- LAST_UPDATED -->", last_updated)
     
@@ -2,21 +2,36 @@
 cdc_common.py - Shared helpers for the Taiwan CDC scrapers.
 
 Centralises the bits that were previously duplicated across pdf_fetcher.py and
-manual_scraper.py: a configured requests Session (consistent User-Agent +
-automatic retry/backoff) and the download -> sha256 -> pdfplumber-extract
-pipeline used to cache PDFs and detect updates.
+manual_scraper.py: a configured requests Session (consistent User-Agent), one
+fetch() path that every request takes -- retries, an adaptive rate limiter and a
+circuit breaker shared by all threads (throttle.py) -- an HTTP
+conditional-request cache in front of it,
+and the download -> sha256 -> pdfplumber-extract pipeline used to cache PDFs
+and detect updates.
 """
 import os
 import re
 import csv
+import json
+import time
 import logging
 import hashlib
+import threading
 
 import requests
 from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
 
-BASE_URL = "https://www.cdc.gov.tw"
+from throttle import AdaptiveLimiter, CircuitBreaker
+from text_cache import get_cache as get_text_cache
+from pdf_store import store_for
+
+logger = logging.getLogger(__name__)
+
+# Overridable so the scrapers can be pointed at a local stand-in site
+# (fake_cdc.py / bench_scraper.py); must be set before the modules are imported.
+BASE_URL = os.environ.get("CDC_BASE_URL", "https://www.cdc.gov.tw").rstrip("/")
 
 # A real-ish User-Agent: the CDC site serves empty pages to some default
 # clients, so every request must send one consistently.
@@ -27,7 +42,41 @@ USER_AGENT = (
 
 DEFAULT_TIMEOUT = 20
 
+# PDFs are streamed to disk in chunks of this size; anything larger than
+# MAX_PDF_BYTES is refused (the biggest 防治工作手冊 is a few MB).
+DOWNLOAD_CHUNK = 1 << 16
+MAX_PDF_BYTES = 100 * 1024 * 1024
+
+# Sized for the concurrent fetch pipeline (fetch_pipeline.py): every worker
+# thread shares the one Session, so the pool must not be the bottleneck.
+POOL_SIZE = 16
+
+# Retry policy for fetch(): statuses worth another attempt, attempt count and
+# backoff base (seconds). Applied in _send(), through the shared limiter.
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+RETRIES = 4
+BACKOFF_FACTOR = 1
+
 _session = None
+_limiter = None
+_breaker = None
+_session_lock = threading.Lock()
+
+HTTP_CACHE_DIR = os.path.join(".cache", "http")
+
+# Before re-downloading a PDF we already have, download_pdf asks the server
+# cheaply whether it changed (probe_unchanged): "head" sends a HEAD, "range" a
+# GET for bytes=0-0 (for servers that mishandle HEAD), "off" skips straight to
+# the conditional GET. PDF_PROBE overrides the default.
+PROBE_MODE = os.environ.get("PDF_PROBE", "head")
+
+# Probes and 304s only repeat what the server claims. Every PDF is still fully
+# downloaded and re-hashed once this many days have passed since its last full
+# verification (PDF_FULL_VERIFY_DAYS), in case those validators lie.
+try:
+    FULL_VERIFY_DAYS = float(os.environ.get("PDF_FULL_VERIFY_DAYS", 7))
+except ValueError:
+    FULL_VERIFY_DAYS = 7.0
 
 
 def setup_logging(level=None):
@@ -45,29 +94,253 @@ def setup_logging(level=None):
 
 
 def get_session():
-    """Return a process-wide Session with retry/backoff and a default UA."""
+    """Return a process-wide Session with a default UA (retries live in fetch)."""
     global _session
-    if _session is None:
-        s = requests.Session()
-        s.headers.update({"User-Agent": USER_AGENT})
-        retry = Retry(
-            total=4,
-            backoff_factor=1,  # waits 0s, 2s, 4s, 8s between attempts
-            status_forcelist=(429, 500, 502, 503, 504),
-            allowed_methods=frozenset(["GET", "HEAD"]),
-            raise_on_status=False,
-        )
-        adapter = HTTPAdapter(max_retries=retry)
-        s.mount("https://", adapter)
-        s.mount("http://", adapter)
-        _session = s
+    with _session_lock:
+        if _session is None:
+            _session = _new_session()
     return _session
 
 
-def fetch(url, timeout=DEFAULT_TIMEOUT):
-    """GET a URL through the shared session. Raises on HTTP error."""
-    res = get_session().get(url, timeout=timeout)
-    res.raise_for_status()
+def _new_session():
+    s = requests.Session()
+    s.headers.update({"User-Agent": USER_AGENT})
+    # No urllib3-level retries: every attempt must pass through the shared
+    # limiter / circuit breaker in _send(), so retrying happens there.
+    adapter = HTTPAdapter(max_retries=0, pool_maxsize=POOL_SIZE)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+def get_limiter():
+    """The process-wide AdaptiveLimiter every request goes through."""
+    global _limiter
+    with _session_lock:
+        if _limiter is None:
+            _limiter = AdaptiveLimiter()
+    return _limiter
+
+
+def get_breaker():
+    """The process-wide CircuitBreaker every request goes through."""
+    global _breaker
+    with _session_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker()
+    return _breaker
+
+
+def _retry_after(res):
+    """Seconds from a numeric Retry-After header, else None."""
+    value = (res.headers.get("Retry-After") or "").strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _send(method, url, **kwargs):
+    """
+    One logical request: up to RETRIES retries on 429/5xx/connection errors,
+    each attempt gated by the circuit breaker and the adaptive limiter and
+    reported back to both. Backoff is Retry-After when the server sends one,
+    else BACKOFF_FACTOR * 2**attempt (0s, 2s, 4s, 8s), and it pauses every
+    caller, not just this one. The final 429/5xx response is returned as is.
+    """
+    limiter, breaker = get_limiter(), get_breaker()
+    request = getattr(get_session(), method)
+    for attempt in range(RETRIES + 1):
+        breaker.before_request()
+        limiter.acquire()
+        backoff = BACKOFF_FACTOR * (2 ** attempt) if attempt else 0
+        start = time.monotonic()
+        try:
+            res = request(url, **kwargs)
+        except requests.RequestException:
+            limiter.record_failure(backoff)
+            breaker.record_failure()
+            if attempt == RETRIES:
+                raise
+            continue
+        if res.status_code in RETRY_STATUSES:
+            retry_after = _retry_after(res)
+            limiter.record_failure(retry_after if retry_after is not None else backoff)
+            breaker.record_failure()
+            if attempt == RETRIES:
+                return res
+            logger.debug("HTTP %s from %s; retrying.", res.status_code, url)
+            res.close()
+            continue
+        limiter.record_success(time.monotonic() - start)
+        breaker.record_success()
+        return res
+
+
+class ValidatorStore:
+    """
+    Persistent per-URL HTTP validators (ETag / Last-Modified) so repeat runs
+    can ask CDC "has this changed?" instead of re-downloading everything.
+
+    Kept under .cache/http/: validators.json maps url -> {etag, last_modified,
+    size, ...} and bodies/<sha1(url)> holds the last body of each HTML page so a
+    304 can be answered locally. PDF bodies are not duplicated here: the PDF
+    already on disk is the cached copy, so download_pdf stores the sha256 it
+    belongs to alongside the validators instead.
+
+    Also counts hits (304s and unchanged probes), full-response misses and bytes saved for the run
+    summary. Thread-safe; call save() once at the end of a run.
+    """
+
+    def __init__(self, root=HTTP_CACHE_DIR):
+        self.root = root
+        self.path = os.path.join(root, "validators.json")
+        self.hits = self.misses = self.bytes_saved = self.probe_hits = 0
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # Caller holds self._lock.
+        if self._entries is None:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def get(self, url):
+        with self._lock:
+            return self._load().get(url)
+
+    def update(self, url, res, **extra):
+        """Record the validators from a full (200) response; forget the URL if it sent none."""
+        entry = {
+            "etag": res.headers.get("ETag"),
+            "last_modified": res.headers.get("Last-Modified"),
+            "content_type": res.headers.get("Content-Type"),
+            **extra,
+        }
+        with self._lock:
+            entries = self._load()
+            if entry["etag"] or entry["last_modified"]:
+                entries[url] = {k: v for k, v in entry.items() if v is not None}
+            else:
+                entries.pop(url, None)
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def _body_path(self, url):
+        return os.path.join(self.root, "bodies", hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+    def read_body(self, url):
+        try:
+            with open(self._body_path(url), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write_body(self, url, body):
+        path = self._body_path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, path)
+
+    def record_hit(self, size, probe=False):
+        with self._lock:
+            self.hits += 1
+            self.probe_hits += bool(probe)
+            self.bytes_saved += size or 0
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def save(self):
+        with self._lock:
+            if self._entries is None:
+                return
+            os.makedirs(self.root, exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+
+    def summary(self):
+        return (f"HTTP cache: {self.hits} hits ({self.probe_hits} by probe, the rest 304), "
+                f"{self.misses} misses, {self.bytes_saved / 1024 / 1024:.1f} MB saved")
+
+
+_validators = None
+
+
+def get_validator_store():
+    """The process-wide ValidatorStore, or None when disabled via HTTP_CACHE=0."""
+    global _validators
+    if os.environ.get("HTTP_CACHE", "1") == "0":
+        return None
+    with _session_lock:
+        if _validators is None:
+            _validators = ValidatorStore()
+    return _validators
+
+
+def _cached_response(url, body, entry):
+    """A 200-looking Response rebuilt from a locally cached body (after a 304)."""
+    res = requests.Response()
+    res.status_code = 200
+    res.url = url
+    res._content = body
+    res.headers = CaseInsensitiveDict(
+        {"Content-Type": entry["content_type"]} if entry.get("content_type") else {})
+    res.encoding = get_encoding_from_headers(res.headers)
+    res.from_cache = True
+    return res
+
+
+def fetch(url, timeout=DEFAULT_TIMEOUT, stream=False, conditional=None):
+    """
+    GET a URL through the shared session. Raises on HTTP error. With
+    stream=True the body is left unread for iter_content (close the response).
+
+    Conditional requests: by default a non-streamed GET sends the stored
+    If-None-Match / If-Modified-Since validators, and a 304 is answered with
+    the cached body (the returned Response then has from_cache=True). Streamed
+    downloads own their body, so they only send validators with
+    conditional=True and must handle the 304 themselves (see download_pdf).
+    """
+    store = get_validator_store()
+    entry = store.get(url) if store is not None and conditional is not False else None
+    headers = {}
+    if entry and (conditional or (not stream and store.read_body(url) is not None)):
+        headers = store.conditional_headers(entry)
+
+    res = _send("get", url, timeout=timeout, stream=stream, headers=headers)
+    try:
+        res.raise_for_status()
+    except Exception:
+        res.close()
+        raise
+
+    if stream or store is None:
+        return res
+    if res.status_code == 304 and headers:
+        body = store.read_body(url)
+        store.record_hit(len(body))
+        return _cached_response(url, body, entry)
+    store.update(url, res)
+    if res.headers.get("ETag") or res.headers.get("Last-Modified"):
+        store.write_body(url, res.content)
+    store.record_miss()
     return res
 
 
@@ -104,8 +377,30 @@ def safe_filename(name):
     return re.sub(r'[<>:"/\\|?*]', '_', name)
 
 
-def extract_pdf_text(pdf_path):
-    """Extract all text from a local PDF via pdfplumber."""
+def file_sha256(path, chunk_size=1 << 16):
+    """sha256 hex digest of a local file, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def extract_pdf_text(pdf_path, sha256=None):
+    """
+    Extract all text from a local PDF via pdfplumber.
+
+    The content-addressed text cache (text_cache.py) is consulted first, keyed
+    by the PDF's sha256 (hashed from the file when the caller doesn't already
+    know it), so the same PDF bytes are only ever run through pdfplumber once.
+    """
+    cache = get_text_cache()
+    if cache is not None:
+        sha256 = sha256 or file_sha256(pdf_path)
+        cached = cache.get(sha256)
+        if cached is not None:
+            return cached
+
     import pdfplumber  # local import: keeps the heavy PDF stack out of import time
 
     text = ""
@@ -114,29 +409,151 @@ def extract_pdf_text(pdf_path):
             page_text = page.extract_text()
             if page_text:
                 text += page_text + "\n"
-    return text.strip()
+    text = text.strip()
+
+    if cache is not None:
+        cache.put(sha256, text, source=os.path.basename(pdf_path))
+    return text
+
+
+class DownloadTooLarge(Exception):
+    """Raised when a download exceeds max_bytes (declared or actually streamed)."""
+
+
+def _stream_to_file(res, path, max_bytes):
+    """Write a streamed response to path, returning (sha256_hex, size)."""
+    declared = res.headers.get("Content-Length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise DownloadTooLarge(f"{res.url}: Content-Length {declared} > {max_bytes}")
+    h = hashlib.sha256()
+    size = 0
+    with open(path, "wb") as f:
+        for chunk in res.iter_content(DOWNLOAD_CHUNK):
+            size += len(chunk)
+            if size > max_bytes:
+                raise DownloadTooLarge(f"{res.url}: body exceeds {max_bytes} bytes")
+            h.update(chunk)
+            f.write(chunk)
+    return h.hexdigest(), size
+
+
+def _probe_size(res):
+    """Full body size from a probe response (Content-Range total on a 206)."""
+    if res.status_code == 206:
+        total = res.headers.get("Content-Range", "").rpartition("/")[2]
+        return int(total) if total.isdigit() else None
+    length = res.headers.get("Content-Length")
+    return int(length) if length and length.isdigit() else None
+
+
+def probe_unchanged(url, entry, mode=None, timeout=DEFAULT_TIMEOUT):
+    """
+    True only if a HEAD (or a bytes=0-0 Range GET) reports the same size and
+    the same ETag / Last-Modified as the validator entry recorded at the last
+    full download. Every validator on record must be echoed back unchanged;
+    anything missing, different or failing makes the probe inconclusive
+    (False), and the caller falls back to downloading.
+    """
+    mode = mode or PROBE_MODE
+    if mode not in ("head", "range") or entry.get("size") is None:
+        return False
+    if not (entry.get("etag") or entry.get("last_modified")):
+        return False
+    try:
+        if mode == "head":
+            res = _send("head", url, timeout=timeout, allow_redirects=True)
+        else:
+            res = _send("get", url, timeout=timeout, stream=True,
+                        headers={"Range": "bytes=0-0"})
+    except requests.RequestException as e:
+        logger.debug("Change probe for %s failed: %s", url, e)
+        return False
+    with res:  # a Range GET answered with a plain 200 must not be read
+        if res.status_code not in (200, 206):
+            return False
+        observed = {
+            "size": _probe_size(res),
+            "etag": res.headers.get("ETag"),
+            "last_modified": res.headers.get("Last-Modified"),
+        }
+    return (observed["size"] == entry["size"]
+            and all(observed[k] == entry[k] for k in ("etag", "last_modified") if entry.get(k)))
+
+
+def _full_verify_due(entry, now=None):
+    verified = entry.get("verified_at")
+    if verified is None:
+        return True
+    return (now or time.time()) - verified >= FULL_VERIFY_DAYS * 86400
 
 
-def download_pdf(url, dest_dir, name, expected_hash=None, timeout=DEFAULT_TIMEOUT):
+def download_pdf(url, dest_dir, name, expected_hash=None, timeout=DEFAULT_TIMEOUT,
+                 extract=True, max_bytes=MAX_PDF_BYTES):
     """
     Download a PDF, save it under dest_dir/<safe_name>.pdf and return
     (text_content, local_path, sha256_hash).
 
     If expected_hash is given and matches the freshly downloaded bytes, the
     text extraction is skipped and (None, local_path, hash) is returned so the
-    caller can treat it as "unchanged".
+    caller can treat it as "unchanged". With extract=False the text is never
+    extracted here (the pipeline's extractor stage does it separately).
+
+    The body is streamed into a temp file next to the destination while being
+    hashed, so a large manual is never held in memory, and it is refused with
+    DownloadTooLarge past max_bytes. The temp file then goes into the
+    content-addressed store (pdf_store.py; dropped if that blob already
+    exists) and the per-name path is re-linked only if it doesn't already
+    point at that blob, so an unchanged PDF leaves the disk untouched. With
+    the store disabled the temp file replaces the cached PDF (atomically, via
+    os.replace) only when the content actually changed. When the cheap change
+    probe (probe_unchanged) or a 304 to the conditional request says the PDF
+    on disk is still current, nothing is downloaded at all -- except that a
+    full download is forced every FULL_VERIFY_DAYS per URL.
     """
     os.makedirs(dest_dir, exist_ok=True)
+    pdf_path = os.path.join(dest_dir, f"{safe_filename(name)}.pdf")
+    tmp_path = f"{pdf_path}.{os.getpid()}.{threading.get_ident()}.part"
 
-    res = fetch(url, timeout=timeout)
-    pdf_bytes = res.content
-    current_hash = hashlib.sha256(pdf_bytes).hexdigest()
+    # Revalidate instead of re-downloading when the validators on record belong
+    # to exactly the PDF we already have on disk.
+    store = get_validator_store()
+    entry = store.get(url) if store is not None else None
+    revalidate = bool(entry and expected_hash and entry.get("sha256") == expected_hash
+                      and os.path.exists(pdf_path))
+    if revalidate and _full_verify_due(entry):
+        logger.debug("Periodic full verify of %s.", url)
+        revalidate = False
+    if revalidate and probe_unchanged(url, entry, timeout=timeout):
+        store.record_hit(entry.get("size"), probe=True)
+        return None, pdf_path, expected_hash
 
-    pdf_path = os.path.join(dest_dir, f"{safe_filename(name)}.pdf")
-    with open(pdf_path, "wb") as f:
-        f.write(pdf_bytes)
+    try:
+        with fetch(url, timeout=timeout, stream=True, conditional=revalidate) as res:
+            if revalidate and res.status_code == 304:
+                store.record_hit(entry.get("size"))
+                return None, pdf_path, expected_hash
+            current_hash, size = _stream_to_file(res, tmp_path, max_bytes)
+            if store is not None:
+                store.update(url, res, sha256=current_hash, size=size,
+                             verified_at=int(time.time()))
+                store.record_miss()
+
+        blobs = store_for(dest_dir)
+        unchanged = (expected_hash and current_hash == expected_hash
+                     and os.path.exists(pdf_path) and os.path.getsize(pdf_path) == size)
+        if blobs is not None:
+            blobs.put(tmp_path, current_hash)
+            blobs.link(current_hash, pdf_path)
+        elif unchanged:
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, pdf_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
-    if expected_hash and current_hash == expected_hash:
+    if not extract or (expected_hash and current_hash == expected_hash):
         return None, pdf_path, current_hash
 
-    return extract_pdf_text(pdf_path), pdf_path, current_hash
+    return extract_pdf_text(pdf_path, current_hash), pdf_path, current_hash
@@ -25,6 +25,7 @@ import logging
 import subprocess
 
 from cdc_common import setup_logging
+from record_store import DATASETS, ShardStore, get_store, has_value
 
 logger = logging.getLogger(__name__)
 
@@ -41,17 +42,13 @@ MANUAL_SECTIONS = [
 MANUAL_MIN = 3
 
 
-def _nonempty(v):
-    return bool(v) and (not isinstance(v, str) or bool(v.strip()))
-
-
 def case_ok(rec):
-    return (any(_nonempty(rec.get(k)) for k in CASE_CORE)
-            or any(_nonempty(rec.get(k)) for k in CASE_STRUCT))
+    return (any(has_value(rec, k) for k in CASE_CORE)
+            or any(has_value(rec, k) for k in CASE_STRUCT))
 
 
 def manual_ok(rec):
-    return sum(1 for k in MANUAL_SECTIONS if _nonempty(rec.get(k))) >= MANUAL_MIN
+    return sum(1 for k in MANUAL_SECTIONS if has_value(rec, k)) >= MANUAL_MIN
 
 
 def dataset_stats(records, ok_fn):
@@ -81,14 +78,21 @@ def evaluate(name, stats, prev_count=None, min_rate=0.6, max_shrink=0.30):
     return problems
 
 
-def _load(path):
+def _load(dataset):
     try:
-        with open(path, encoding="utf-8") as f:
-            return json.load(f)
+        return get_store().load_lazy(dataset)
     except (FileNotFoundError, json.JSONDecodeError):
         return []
 
 
+def _committed_path(dataset):
+    """The file whose committed version counts the dataset's records."""
+    store = get_store()
+    if isinstance(store, ShardStore):
+        return store.index_path(dataset).replace(os.sep, "/")  # one entry per record
+    return DATASETS[dataset]
+
+
 def _prev_count(path):
     """Record count in the last committed version of path, or None if unknown."""
     try:
@@ -114,16 +118,16 @@ def main():
     min_rate = float(os.environ.get("COVERAGE_MIN_RATE", "0.6"))
     max_shrink = float(os.environ.get("COVERAGE_MAX_SHRINK", "0.30"))
 
-    cases = dataset_stats(_load("diseases.json"), case_ok)
-    manuals = dataset_stats(_load("disease_manuals.json"), manual_ok)
+    cases = dataset_stats(_load("cases"), case_ok)
+    manuals = dataset_stats(_load("manuals"), manual_ok)
     logger.info("Case definitions: %d records, %d well-parsed (%.0f%%)",
                 cases["total"], cases["ok"], cases["rate"] * 100)
     logger.info("Disease manuals:  %d records, %d well-parsed (%.0f%%)",
                 manuals["total"], manuals["ok"], manuals["rate"] * 100)
 
-    problems = evaluate("case definitions", cases, _prev_count("diseases.json"),
+    problems = evaluate("case definitions", cases, _prev_count(_committed_path("cases")),
                         min_rate, max_shrink)
-    problems += evaluate("disease manuals", manuals, _prev_count("disease_manuals.json"),
+    problems += evaluate("disease manuals", manuals, _prev_count(_committed_path("manuals")),
                          min_rate, max_shrink)
 
     if problems:
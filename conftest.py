@@ -2,4 +2,17 @@
 import os
 import sys
 
+import pytest
+
 sys.path.insert(0, os.path.dirname(__file__))
+
+
+@pytest.fixture(autouse=True)
+def _fresh_throttle(monkeypatch):
+    """Each test gets its own unthrottled limiter and a closed circuit breaker."""
+    import cdc_common
+    from throttle import AdaptiveLimiter, CircuitBreaker
+
+    monkeypatch.setattr(cdc_common, "_limiter",
+                        AdaptiveLimiter(rate=1000, max_rate=1000, sleep=lambda s: None))
+    monkeypatch.setattr(cdc_common, "_breaker", CircuitBreaker(threshold=8, cooldown=60))
@@ -3,34 +3,208 @@ dashboard_common.py - Shared building blocks for the dashboard generators.
 
 The two dashboards (build_dashboard.py, build_manuals_dashboard.py) have
 genuinely different layouts/CSS, so they are not collapsed into one template.
-What they MUST share is the client-side security code (renderDiff()'s allow-list
-has to stay in lockstep with the diff tags emitted by scraper.diff_texts()) and
+What they MUST share is the client-side security code (renderDiff()'s tags have
+to stay in lockstep with scraper.DIFF_DEL / DIFF_INS) and
 the way untrusted data is embedded into the page — so both live here as a single
 source of truth.
+
+They also share the lazy-details scheme: instead of inlining every record in
+full (~1.5 MB of manual text in manuals.html), a page embeds slim records --
+the fields its table needs up front plus short previews of the long sections --
+and loadDetails() (DETAILS_JS) fetches a record's remaining fields from
+details/<dataset>/ when a row is expanded, a search may hit it, or it shows a
+recent diff. Both generators take --single-file to embed everything as before
+(a page that works when opened from disk).
 """
+import os
 import json
+import hashlib
+
+# Lazy details (split_details / DETAILS_JS): the pages embed slim records and
+# fetch the rest of each record from DETAILS_DIR/<dataset>/<sha>.json.
+DETAILS_DIR = "details"
+PREVIEW_CHARS = 160
+# Never shipped to the page: local paths and bookkeeping the dashboards don't show.
+_DETAIL_DROP = {"pdf_path", "pdf_hash", "parser_version"}
 
 # Injected into each dashboard's <script> via the __SECURITY_JS__ placeholder.
-# esc() escapes raw values for innerHTML; renderDiff() permits ONLY the four
-# diff tags emitted by scraper.diff_texts() and escapes everything else, so even
-# diff HTML written by older runs cannot inject markup. safeUrl() blocks non
-# http(s) URLs (e.g. javascript:) so a poisoned link can't execute. Keep the tag
-# strings in DIFF_RE/DIFF_TAGS identical to those produced by diff_texts().
+# esc() escapes raw values for innerHTML; renderDiff(diff, text) builds the diff
+# markup from a compact *_diff (text_diff.compact_diff: run lengths into the
+# record's own text plus the deleted strings), escaping every text segment, and
+# for legacy HTML diff strings permits ONLY the four diff tags and escapes
+# everything else, so even diff HTML written by older runs cannot inject
+# markup. safeUrl() blocks non-http(s) URLs (e.g. javascript:) so a poisoned
+# link can't execute. Keep the tag strings identical to scraper.DIFF_DEL /
+# DIFF_INS (scraper.render_diff() is the Python reference renderer).
 SECURITY_JS = r"""
         // --- XSS hardening ------------------------------------------------
         // PDF-extracted text is untrusted. esc() escapes raw values for
-        // innerHTML; renderDiff() permits ONLY the four diff tags emitted by
-        // diff_texts() and escapes everything else, so even diff HTML written
+        // innerHTML; renderDiff() rebuilds a compact diff from the record's
+        // own (escaped) text, and in legacy HTML diffs permits ONLY the four
+        // diff tags and escapes everything else, so even diff HTML written
         // by older runs cannot inject markup. safeUrl() rejects non-http(s)
         // URLs so a poisoned link cannot run javascript: on click.
         const esc = (s) => s == null ? '' : String(s).replace(/[&<>"']/g,
             c => ({'&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;',"'":'&#39;'}[c]));
         const safeUrl = (u) => /^https?:\/\//i.test(String(u || '')) ? String(u) : '#';
+        const DIFF_DEL = '<del style="color: #9ca3af;">';
+        const DIFF_INS = '<b style="color: #ea580c; background: #ffedd5;">';
         const DIFF_RE = /(<del style="color: #9ca3af;">|<\/del>|<b style="color: #ea580c; background: #ffedd5;">|<\/b>)/g;
-        const DIFF_TAGS = new Set(['<del style="color: #9ca3af;">', '</del>',
-            '<b style="color: #ea580c; background: #ffedd5;">', '</b>']);
-        const renderDiff = (s) => s == null ? '' :
-            String(s).split(DIFF_RE).map(p => DIFF_TAGS.has(p) ? p : esc(p)).join('');""".lstrip("\n")
+        const DIFF_TAGS = new Set([DIFF_DEL, '</del>', DIFF_INS, '</b>']);
+        // Compact diff: n = next n characters of text unchanged, ["+", n] =
+        // next n inserted, ["-", "s"] = s deleted. Offsets are code points
+        // (Python str indices), hence Array.from rather than String#slice.
+        // A diff whose runs don't cover the text exactly was made against
+        // some other text: show the text plain rather than mark wrong spans.
+        const renderDiff = (diff, text) => {
+            if (diff == null) return '';
+            if (!Array.isArray(diff))
+                return String(diff).split(DIFF_RE).map(p => DIFF_TAGS.has(p) ? p : esc(p)).join('');
+            const chars = Array.from(String(text == null ? '' : text));
+            const covered = diff.reduce((n, op) => n + (typeof op === 'number' ? op : op[0] === '+' ? op[1] : 0), 0);
+            if (covered !== chars.length) return esc(chars.join(''));
+            let pos = 0;
+            return diff.map(op => {
+                if (typeof op === 'number') return esc(chars.slice(pos, pos += op).join(''));
+                if (op[0] === '+') return DIFF_INS + esc(chars.slice(pos, pos += op[1]).join('')) + '</b>';
+                return DIFF_DEL + esc(op[1]) + '</del>';
+            }).join('');
+        };""".lstrip("\n")
+
+
+# Injected after __SEARCH_JS__ via the __ROWS_JS__ placeholder. Each page builds
+# its table rows once, as {d, tr, marks: {field: element}, marked, measured}
+# keyed by record, and render() only shows / hides / reorders those nodes:
+# filterRows() toggles `hidden`, re-marks the search hits of visible rows (only
+# cells whose marks change are rewritten) and returns the rows that have just
+# become visible for the first time, whose "Show More" buttons
+# showOverflowToggles() then measures -- so a keystroke no longer rebuilds
+# every row or forces layout on every cell. Input is debounced.
+ROWS_JS = r"""
+        // --- Keyed rows ---------------------------------------------------
+        const SEARCH_DEBOUNCE_MS = 150;
+        const debounce = (fn, ms) => {
+            let timer = null;
+            return (...args) => { clearTimeout(timer); timer = setTimeout(() => fn(...args), ms); };
+        };
+
+        const markRow = (row, hit, q) => {
+            for (const key in row.marks) {
+                const raw = String(row.d[key] || '');
+                // A hit from the search worker has no offsets: find them for this row only.
+                const offsets = !hit ? [] : (hit[key] || findAll(raw.toLowerCase(), q));
+                if (!offsets.length && !row.marked.has(key)) continue;
+                row.marks[key].innerHTML = markHits(raw, offsets, q.length);
+                if (offsets.length) row.marked.add(key); else row.marked.delete(key);
+            }
+        };
+
+        // rows[i] is DATA[i]'s row; hits is what runSearch() passed on (null = all).
+        const filterRows = (rows, hits, q) => {
+            const firstShown = [];
+            rows.forEach((row, i) => {
+                const hit = hits ? hits.get(i) : null;
+                const visible = !hits || hit !== undefined;
+                if (row.tr.hidden !== !visible) row.tr.hidden = !visible;
+                if (!visible) return;
+                markRow(row, hit, q);
+                if (!row.measured) {
+                    row.measured = true;
+                    firstShown.push(row);
+                }
+            });
+            return firstShown;
+        };
+
+        const showOverflowToggles = (rows) => requestAnimationFrame(() => rows.forEach(row =>
+            row.tr.querySelectorAll('.cell-content').forEach(div => {
+                const btn = div.nextElementSibling;
+                if (btn && btn.classList.contains('toggle-btn') && div.scrollHeight > div.clientHeight)
+                    btn.style.display = 'inline-block';
+            })));""".lstrip("\n")
+
+
+# Injected after __ROWS_JS__ via the __DETAILS_JS__ placeholder (see
+# split_details). A slim record carries `detail`, the file holding the rest of
+# its fields, and `preview`, the opening characters of each long field;
+# fieldText() reads a field or its preview, and loadDetails(docs) fetches each
+# record's file once (concurrent callers share the request) and merges it into
+# DATA and the search worker's copy, after which the record is an ordinary
+# full one. With the single-file fallback DETAILS_DIR is null and no record
+# has `detail`.
+DETAILS_JS = r"""
+        // --- Lazy details -------------------------------------------------
+        const DETAILS_DIR = __DETAILS_DIR__;
+        const detailRequests = new Map();  // DATA position -> Promise of the merged record
+        const fieldText = (d, key) => d[key] !== undefined ? d[key] : ((d.preview && d.preview[key]) || '');
+        const isPreview = (d, key) => !!(d.preview && d.preview[key] !== undefined);
+        const loadDetails = (docs) => Promise.all([...docs].map(doc => {
+            const d = DATA[doc];
+            if (!d.detail) return Promise.resolve(d);
+            if (!detailRequests.has(doc)) {
+                detailRequests.set(doc, fetch(DETAILS_DIR + d.detail)
+                    .then(r => r.ok ? r.json() : Promise.reject(new Error(`${d.detail}: HTTP ${r.status}`)))
+                    .then(full => {
+                        Object.assign(d, full);
+                        delete d.detail;
+                        delete d.preview;
+                        updateSearchRecord(doc, full);
+                        return d;
+                    })
+                    .catch(err => {
+                        detailRequests.delete(doc);  // let the next request retry
+                        throw err;
+                    }));
+            }
+            return detailRequests.get(doc);
+        }));""".lstrip("\n")
+
+
+def split_details(records, summary_keys, preview_keys, limit=PREVIEW_CHARS):
+    """
+    Split records into the slim records a page embeds and their detail files.
+
+    A slim record keeps summary_keys, every preview_keys field of at most
+    `limit` characters, and for longer ones only their first `limit`
+    characters under "preview". Everything else the page may need (full
+    texts, *_diff, content) goes to one JSON file per record, named by the
+    sha256 of its bytes so browsers can cache it for good; "detail" names it.
+    Returns (slim records, {filename: file text}).
+    """
+    slim, details = [], {}
+    for record in records:
+        s = {k: record[k] for k in summary_keys if k in record}
+        preview = {}
+        for k in preview_keys:
+            value = record.get(k)
+            if isinstance(value, str) and len(value) > limit:
+                preview[k] = value[:limit]
+            elif value:
+                s[k] = value
+        rest = {k: v for k, v in record.items() if k not in s and k not in _DETAIL_DROP}
+        if rest:
+            body = json.dumps(rest, ensure_ascii=False, separators=(",", ":"))
+            filename = hashlib.sha256(body.encode("utf-8")).hexdigest()[:16] + ".json"
+            details[filename] = body
+            s["detail"] = filename
+            if preview:
+                s["preview"] = preview
+        slim.append(s)
+    return slim, details
+
+
+def write_details(details, out_dir):
+    """Write split_details()'s files into out_dir, removing files from earlier builds."""
+    os.makedirs(out_dir, exist_ok=True)
+    for filename in os.listdir(out_dir):
+        if filename.endswith(".json") and filename not in details:
+            os.remove(os.path.join(out_dir, filename))
+    for filename, body in details.items():
+        path = os.path.join(out_dir, filename)
+        if not os.path.exists(path):  # content-addressed: an existing file is already right
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(body)
+    return len(details)
 
 
 def embed_json(data):
@@ -4,13 +4,32 @@ Can be run independently to test parsing on local PDFs.
 """
 import re
 import os
-import json
 import logging
+import functools
 import unicodedata
 
+from section_grammar import (
+    SectionGrammar, NUMBERED_SINGLE, NUMBERED_SUBITEM, FORM_BOUNDARY, is_noise,
+)
+
 logger = logging.getLogger(__name__)
-# pdfplumber is imported lazily inside main() so the pure-text parsing
-# functions can be imported (and unit-tested) without the heavy PDF stack.
+
+# Stamped on every case-definition record as 'parser_version' (next to its input
+# 'pdf_hash'). Bump it whenever build_record's output changes, so the next
+# scraper run / data_parser.main re-parses the records built by the old code
+# even though their PDFs haven't changed.
+PARSER_VERSION = 1
+
+# pdfplumber is only loaded by main() (in extraction worker processes) so the
+# pure-text parsing functions can be imported (and unit-tested) without the
+# heavy PDF stack.
+
+@functools.lru_cache(maxsize=None)
+def _repeat_pattern(n):
+    # n copies of the same character. re.sub scans left to right and never
+    # overlaps matches, which is exactly the greedy skip-n loop this replaced.
+    return re.compile(r'(.)\1{%d}' % (n - 1), re.DOTALL)
+
 
 def deduplicate_chars(text, n=4):
     """
@@ -19,56 +38,44 @@ def deduplicate_chars(text, n=4):
     """
     if not text:
         return text
-    result = []
-    i = 0
-    while i < len(text):
-        char = text[i]
-        # Check if next n-1 chars are the same
-        if i + n <= len(text) and all(text[i+j] == char for j in range(n)):
-            result.append(char)
-            i += n  # Skip the repeated chars
-        else:
-            result.append(char)
-            i += 1
-    return ''.join(result)
+    return _repeat_pattern(n).sub(r'\1', text)
+
+# Common half-width punctuation -> full-width:
+# , -> ，, : -> ：, ; -> ；, ! -> ！, ? -> ？, ( -> （, ) -> ）
+_PUNCT_MAP = str.maketrans({
+    ',': '，',
+    ':': '：',
+    ';': '；',
+    '!': '！',
+    '?': '？',
+    '(': '（',
+    ')': '）'
+})
+_PUNCT_UNMAP = str.maketrans({v: k for k, v in _PUNCT_MAP.items()})
+_HALF_WIDTH_PUNCT = re.compile(r'[,:;!?()]')
+
 
 def normalize_text(text):
     """Normalize Unicode text to handle CJK compatibility characters."""
     # NFKC normalization converts compatibility characters to their standard forms
     text = unicodedata.normalize('NFKC', text)
-    
-    # Convert common half-width punctuation to full-width
-    # , -> ，, : -> ：, ; -> ；, ! -> ！, ? -> ？, ( -> （, ) -> ）
-    punct_map = str.maketrans({
-        ',': '，',
-        ':': '：',
-        ';': '；',
-        '!': '！',
-        '?': '？',
-        '(': '（',
-        ')': '）'
-    })
-    text = text.translate(punct_map)
+    text = text.translate(_PUNCT_MAP)
 
     # Handle quadruple-repeated chars from some PDF extractions
     text = deduplicate_chars(text, 4)
     return text
 
-# Page-footer / boilerplate that PDF extraction sometimes leaves inside a
-# parsed section. All are matched against a single (stripped) line so they
-# cannot eat legitimate content that merely mentions, e.g., 疾病管制署 mid-sentence.
-_FOOTER_PAGE = re.compile(
-    r'^(?:\d+\s*/\s*\d+|第?\s*\d+\s*頁(?:\s*/\s*共?\s*\d+\s*頁)?|[-–—]\s*\d+\s*[-–—])$'
-)
-_FOOTER_DATE = re.compile(
-    r'^\d{2,3}\s*年\s*\d{1,2}\s*月\s*\d{1,2}\s*日\s*'
-    r'(?:修訂|核定|公告|訂定|制定|增訂|修正|發布)?$'
-)
-_FOOTER_AGENCY = re.compile(r'疾病管制署.*(?:FAX|傳真|電話|（0\d|\(0\d)')
-# Some case-definition PDFs append a blank case-report form; it starts with a
-# 【密件】 title line. Everything from there on is form noise, not a definition.
-_FORM_BOUNDARY = re.compile(r'^\s*【密件】')
 
+def _is_normalized(text):
+    """
+    True if normalize_text(text) == text, checked without building the copy:
+    no half-width punctuation left to convert, NFKC-stable once the full-width
+    punctuation is mapped back (NFKC itself turns it half-width), and no run
+    the de-duplication would shorten.
+    """
+    return (not _HALF_WIDTH_PUNCT.search(text)
+            and unicodedata.is_normalized('NFKC', text.translate(_PUNCT_UNMAP))
+            and not _repeat_pattern(4).search(text))
 
 def clean_section_text(text):
     """
@@ -83,97 +90,67 @@ def clean_section_text(text):
         return text
     out = []
     for line in text.split('\n'):
-        if _FORM_BOUNDARY.match(line):
+        if FORM_BOUNDARY.match(line):
             break  # form block begins here -> drop it and everything after
-        stripped = line.strip()
-        if (_FOOTER_PAGE.match(stripped)
-                or _FOOTER_DATE.match(stripped)
-                or _FOOTER_AGENCY.search(stripped)):
+        if is_noise(line.strip()):
             continue
         out.append(line)
     return '\n'.join(out).strip()
 
 
+# The top-level sections of a case-definition PDF: "一、臨床條件",
+# "一、 AFP 臨床條件" (optional prefix), "五、病例分類：" (alias) -- but NOT
+# "臨床條件一、(二)...". Footers and any appended report form are dropped.
+CASE_SECTIONS = SectionGrammar(
+    {
+        "臨床條件": "臨床條件",
+        "檢驗條件": "檢驗條件",
+        "流行病學條件": "流行病學條件",
+        "通報定義": "通報定義",
+        "疾病分類": "疾病分類",
+        "病例分類": "疾病分類",  # Alias for 疾病分類
+        "檢體採檢送驗事項": "檢體採檢送驗事項",
+    },
+    numbering=NUMBERED_SINGLE,
+    label_prefix=r'(?:\S+\s+)?',
+    trailer=r'\s*[:：]?',
+)
+
+# The case definitions inside 疾病分類: "(一) 可能病例:", "1. 確定病例",
+# "確定病例：" -- the text after the header on the same line is content.
+CASE_DEFINITIONS = SectionGrammar(
+    {
+        "可能病例": "suspected_case",
+        "極可能病例": "probable_case",
+        "確定病例": "confirmed_case",
+    },
+    numbering=NUMBERED_SUBITEM,
+    numbering_optional=True,
+    trailer=r'\s*[:：]?',
+    full_line=False,
+    strip_lines=True,
+)
+
+
 def parse_disease_content(content):
     """
     Parses the raw content string into specific sections.
     Returns a dictionary with 6 keys for disease definitions.
     """
-    sections = {
-        "臨床條件": "",
-        "檢驗條件": "",
-        "流行病學條件": "",
-        "通報定義": "",
-        "疾病分類": "",
-        "檢體採檢送驗事項": ""
-    }
-    
-    # Map header keywords to keys in the sections dict
-    # Using a list to ensure priority if needed, but here keys are distinct
-    headers_map = [
-        "臨床條件",
-        "檢驗條件",
-        "流行病學條件",
-        "通報定義",
-        "疾病分類",
-        "病例分類", # Alias for 疾病分類
-        "檢體採檢送驗事項"
-    ]
-
-    # Normalize Unicode to handle CJK compatibility characters
-    content = normalize_text(content)
-    
-    lines = content.split('\n')
-    current_section = None
-    buffer = []
-
-    # Regex to match: numeral (一、 or 壹、 or 1.) + optional prefix (e.g. "AFP ") + Header Name + end or colon
-    # The header should be at end of line or followed by colon/whitespace only
-    # matches: "一、 臨床條件", "一、 AFP 臨床條件", NOT "臨床條件一、(二)..."
-    header_pattern = re.compile(
-        r'^\s*([一二三四五六壹貳參肆伍陸0-9])\s*[、.]\s*'  # Require numeral
-        r'(?:\S+\s+)?'  # Optional prefix like "AFP "
-        r'(' + '|'.join(headers_map) + r')'  # Header name
-        r'\s*[:：]?\s*$'  # End of line (optionally with colon)
-    )
-
-    for line in lines:
-        stripped_line = line.strip()
-        match = header_pattern.match(stripped_line)
-        
-        if match:
-             header_name = match.group(2)  # Group 2 is the header name (group 1 is the numeral)
-             
-             # Handle aliases
-             if header_name == "病例分類":
-                 header_name = "疾病分類"
-
-             # Check if this strictly matches one of our known headers
-             if header_name in sections:
-                 # Save previous section
-                 if current_section and current_section in sections:
-                     sections[current_section] = "\n".join(buffer).strip()
-                 
-                 current_section = header_name
-                 buffer = []
-                 continue
-
-        if current_section:
-            buffer.append(line) # Keep original whitespace/indentation in buffer? user asked for simple
-            
-    if current_section and current_section in sections:
-        sections[current_section] = "\n".join(buffer).strip()
+    return _parse_normalized(normalize_text(content))
 
-    # Strip page-footer/boilerplate noise from every section before anything
-    # downstream (incl. the case-definition parse) sees it.
-    for key in sections:
-        sections[key] = clean_section_text(sections[key])
 
-    # Parse Case Definitions automatically
-    # Note: parse_case_definitions is defined later in the file, but available at runtime
-    case_defs = parse_case_definitions(sections.get("疾病分類", ""))
-    case_defs = {k: clean_section_text(v) for k, v in case_defs.items()}
-    sections.update(case_defs)
+def _parse_normalized(text):
+    """parse_disease_content on already-normalized text."""
+    sections = CASE_SECTIONS.parse(text)
+
+    # Parse Case Definitions automatically. The section is normally already
+    # in normal form, so only renormalize it when that would change it.
+    classification = sections["疾病分類"]
+    if classification:
+        if not _is_normalized(classification):
+            classification = normalize_text(classification)
+        sections.update(CASE_DEFINITIONS.parse(classification))
 
     return sections
 
@@ -238,69 +215,8 @@ def parse_case_definitions(classification_text):
     """
     if not classification_text:
         return {}
-
-    definitions = {
-        'suspected_case': '',
-        'probable_case': '',
-        'confirmed_case': ''
-    }
-    
     # Normalize for easier matching
-    text = normalize_text(classification_text)
-    
-    # We want to split by keywords but keep the content.
-    # Keywords: 可能病例, 極可能病例, 確定病例
-    # Usually preceded by (一), (二) etc.
-    
-    # Strategy: Find all indices of these keywords
-    # Map keyword -> "suspected_case", etc.
-    key_map = {
-        "極可能病例": "probable_case", # Must check "極可能" before "可能" to avoid partial match if we regex naively
-        "可能病例": "suspected_case",
-        "確定病例": "confirmed_case"
-    }
-    
-    # We can iterate through the lines and see if a line STARTS with one of these (ignoring numbering)
-    lines = text.split('\n')
-    current_key = None
-    buffer = []
-    
-    # Pattern: ^\s*(\(.*\)|[0-9]+\.|[一二三四]+\、)?\s*(keyword)\s*[:：]?
-    # Matches: "(一) 可能病例:", "1. 確定病例", "確定病例："
-    pattern = re.compile(r'^\s*(?:[\(（][一二三四0-9]+[\)）]|[0-9]+\.|[一二三四]\、)?\s*(極可能病例|可能病例|確定病例)\s*[:：]?')
-    
-    for line in lines:
-        line = line.strip()
-        match = pattern.match(line)
-        if match:
-            # We found a new header
-            found_keyword = match.group(1)
-            
-            # Save previous buffer
-            if current_key:
-                definitions[current_key] = "\n".join(buffer).strip()
-            
-            # Start new section
-            current_key = key_map.get(found_keyword)
-            # Add the rest of the line (after the header) to buffer?
-            # e.g. "(一) 可能病例: some text..." -> "some text..."
-            # Or keep the whole line? User probably wants the content.
-            # Usually the header line implies the title, we can strip it or keep it.
-            # If we want structured data PROBABLY we strip the header title "可能病例".
-            
-            # Let's remove the header part from the line
-            # match.end() gives end of match
-            content_part = line[match.end():].strip()
-            buffer = [content_part] if content_part else []
-            
-        elif current_key:
-            buffer.append(line)
-            
-    # Save last buffer
-    if current_key:
-        definitions[current_key] = "\n".join(buffer).strip()
-
-    return definitions
+    return CASE_DEFINITIONS.parse(normalize_text(classification_text))
 
 
 def build_record(content):
@@ -313,107 +229,119 @@ def build_record(content):
     the offline reprocessor (data_parser.main), so english_name and the sections
     can never drift apart again. Pure: no network / file IO.
     """
-    fields = parse_disease_content(content)  # normalises + cleans internally
-    fields["english_name"] = extract_english_name(normalize_text(content))
+    text = normalize_text(content)  # the only full-text normalization
+    fields = _parse_normalized(text)
+    fields["english_name"] = extract_english_name(text)
     return fields
 
 
-def main():
+def is_stale(record, pdf_hash, version=PARSER_VERSION):
+    """
+    True if record must be (re)built from the PDF with this pdf_hash: there is
+    no record yet, it was parsed from different bytes, or by another version
+    of the parser.
+    """
+    return (not record or record.get("pdf_hash") != pdf_hash
+            or record.get("parser_version") != version)
+
+
+def _extract_all(pdf_paths):
+    """
+    Yield (pdf_path, text, error) in input order while the extraction pool
+    works through the whole list in parallel. error is None on success.
+    """
+    # Local imports: the process pool (and pdfplumber behind it) are only
+    # needed when reading PDFs directly, not for the pure parsing functions.
+    from concurrent.futures import ThreadPoolExecutor
+    from extraction_pool import ExtractionExecutor
+
+    with ExtractionExecutor() as extractor, \
+            ThreadPoolExecutor(max_workers=extractor.workers) as threads:
+        futures = [threads.submit(extractor.extract, p) for p in pdf_paths]
+        for path, future in zip(pdf_paths, futures):
+            try:
+                yield path, future.result(), None
+            except Exception as e:
+                yield path, None, e
+
+
+def main(argv=None):
     """
-    Independent execution: Read local PDFs and test the parser.
-    Updates diseases.json if it exists.
+    Offline re-parse of the PDFs already in pdfs/ into diseases.json, without
+    downloading anything. Only records whose PDF hash or parser_version is
+    stale are extracted and parsed again (--all forces every PDF); records are
+    matched to files through a name index, and everything else in
+    diseases.json is kept as it was, in its original order.
     """
-    import pdfplumber  # local import: only needed when reading PDFs directly
-    from cdc_common import setup_logging
+    import argparse
+    from cdc_common import setup_logging, safe_filename, file_sha256, write_csv
+    from record_store import get_store
+
+    parser = argparse.ArgumentParser(description="Re-parse local PDFs into diseases.json.")
+    parser.add_argument("--all", action="store_true", help="re-parse every PDF, stale or not")
+    args = parser.parse_args(argv)
     setup_logging()
 
     pdf_dir = "pdfs"
-    json_path = "diseases.json"
 
     if not os.path.exists(pdf_dir):
         logger.error("Directory %s not found.", pdf_dir)
         return
 
-    logger.info("Testing parser on files in %s/...", pdf_dir)
-    
-    processed_count = 0
-    updated_data = []
-    
-    # Load existing JSON to preserve other fields (url, source_category) if we want to save back
-    existing_map = {}
-    if os.path.exists(json_path):
-        with open(json_path, "r", encoding="utf-8") as f:
-            existing_data = json.load(f)
-            for d in existing_data:
-                existing_map[d['name']] = d
-    
-    files = [f for f in os.listdir(pdf_dir) if f.endswith(".pdf")]
-    
-    for filename in sorted(files):
-        disease_name = filename.replace(".pdf", "").replace("_", "/")
+    try:
+        records = get_store().load("cases")
+    except FileNotFoundError:
+        records = []
+    # PDFs are saved as <safe_filename(name)>.pdf, so that is the lookup key.
+    by_stem = {safe_filename(r['name']): r for r in records}
+
+    stale = []
+    for filename in sorted(f for f in os.listdir(pdf_dir) if f.endswith(".pdf")):
         pdf_path = os.path.join(pdf_dir, filename)
-        
-        # Extract text via pdfplumber
-        text = ""
-        try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    extract = page.extract_text()
-                    if extract:
-                        text += extract + "\n"
-        except Exception as e:
-            logger.warning("Error reading %s: %s", filename, e)
+        pdf_hash = file_sha256(pdf_path)
+        record = by_stem.get(filename[:-len(".pdf")])
+        if args.all or is_stale(record, pdf_hash):
+            stale.append((filename, pdf_path, pdf_hash, record))
+    logger.info("Re-parsing %d stale PDF(s) in %s/ (parser v%d)...",
+                len(stale), pdf_dir, PARSER_VERSION)
+
+    processed_count = 0
+    for (filename, _, pdf_hash, record), (_, text, error) in zip(
+            stale, _extract_all([s[1] for s in stale])):
+        if error is not None:
+            logger.warning("Error reading %s: %s", filename, error)
             continue
-            
+
         # Parse (single shared path: sections + case defs + english_name)
         parsed = build_record(text)
-        english_name = parsed["english_name"]
-
-        # Check if parsing found anything
         filled_sections = sum(1 for v in parsed.values() if v)
-        logger.info("Parsed %s: found %d/9 sections, English: %s", disease_name, filled_sections, english_name)
-        
-        # Update existing record - try to find by name (handle _ vs / differences)
-        record = None
-        for name, r in existing_map.items():
-            # Match by normalizing both names
-            if name.replace("/", "_") == disease_name.replace("/", "_"):
-                record = r
-                break
-        
-        if record:
-            # Only update the parsed fields (incl. english_name), keep existing
-            # url, source_category, etc.
-            for k, v in parsed.items():
-                record[k] = v
-            record['content'] = normalize_text(text.strip())
-            updated_data.append(record)
-        else:
-            # Create new record stub (no url available)
-            new_record = {'name': disease_name, 'content': normalize_text(text.strip())}
-            new_record.update(parsed)
-            updated_data.append(new_record)
-            logger.warning("No existing record found for %s", disease_name)
-            
+        logger.info("Parsed %s: found %d/9 sections, English: %s",
+                    filename, filled_sections, parsed["english_name"])
+
+        if record is None:
+            # New record stub (no url available)
+            record = {'name': filename[:-len(".pdf")].replace("_", "/")}
+            records.append(record)
+            by_stem[filename[:-len(".pdf")]] = record
+            logger.warning("No existing record found for %s", record['name'])
+        # Only the parsed fields change; url, source_category etc. are kept.
+        record.update(parsed)
+        # Compact diffs are run lengths into the previous parse's text: drop them.
+        for k in [k for k in record if k.endswith('_diff')]:
+            del record[k]
+        record['content'] = normalize_text(text.strip())
+        record['pdf_hash'] = pdf_hash
+        record['parser_version'] = PARSER_VERSION
         processed_count += 1
 
-    # Save back to JSON?? 
-    # The user said "exec parser directly so I don't have to re-download".
-    # This implies we should update the data source.
-    if updated_data:
-        # Sort by name or preserve order? Let's preserve order from existing if possible
-        # Currently updated_data is sorted by filename.
-        
-        # Let's write to diseases.json
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(updated_data, f, ensure_ascii=False, indent=2)
-        logger.info("Updated %s with parsed data from %d PDFs.", json_path, processed_count)
-        
-        # Also update CSV
-        from cdc_common import write_csv
+    if processed_count:
+        get_store().save("cases", records)
+        logger.info("Updated the case definitions with parsed data from %d PDFs.", processed_count)
+
         cols = ["name", "url", "source_category", "pdf_path", "臨床條件", "檢驗條件", "流行病學條件", "通報定義", "疾病分類", "檢體採檢送驗事項"]
-        write_csv("diseases.csv", updated_data, columns=cols)
+        write_csv("diseases.csv", records, columns=cols)
         logger.info("Updated diseases.csv")
 
+
 if __name__ == "__main__":
     main()
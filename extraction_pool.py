@@ -0,0 +1,132 @@
+"""
+extraction_pool.py - Process-pool PDF text extraction shared by the scrapers
+and data_parser.main.
+
+pdfplumber's layout analysis is CPU-bound (seconds per long 防治工作手冊 PDF) and
+its memory use creeps up over a run, so it doesn't belong on the scraping
+threads. ExtractionExecutor runs cdc_common.extract_pdf_text in worker
+processes and adds the two guarantees the daily run needs:
+
+  * worker recycling -- after `max_tasks_per_child` documents per worker the
+    pool is retired and a fresh one started, so pdfplumber memory growth stays
+    bounded (done by hand: ProcessPoolExecutor only grew max_tasks_per_child in
+    Python 3.11, and CI runs 3.10);
+  * a per-document timeout -- a pathological PDF is abandoned after `timeout`
+    seconds, its pool's processes are killed and the next document gets a
+    fresh pool, instead of the whole run stalling.
+
+Tunables come from the environment: EXTRACT_WORKERS (default: CPU count, max
+4), EXTRACT_MAX_TASKS (default 25) and EXTRACT_TIMEOUT (seconds, default 180).
+"""
+import os
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from cdc_common import extract_pdf_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_TASKS = 25
+DEFAULT_TIMEOUT = 180
+
+
+class ExtractionTimeout(Exception):
+    """Raised when one document's extraction exceeds the per-document timeout."""
+
+
+def _env_number(name, default, cast=int):
+    try:
+        value = cast(os.environ.get(name, default))
+    except ValueError:
+        return default
+    return value if value > 0 else default
+
+
+def _kill(pool):
+    # ProcessPoolExecutor has no public "kill now": a worker stuck inside
+    # pdfplumber never returns to pick up the shutdown sentinel, so terminate
+    # the processes directly (CPython keeps them in _processes).
+    for proc in list((getattr(pool, "_processes", None) or {}).values()):
+        try:
+            proc.terminate()
+        except Exception:
+            pass
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ExtractionExecutor:
+    """
+    Thread-safe front end to a recycled process pool. Use as a context manager;
+    extract(path) blocks the calling thread (not the GIL) until the text is
+    ready, so several pipeline threads can keep all workers busy.
+    """
+
+    def __init__(self, workers=None, max_tasks_per_child=None, timeout=None,
+                 fn=extract_pdf_text):
+        self.workers = workers or _env_number(
+            "EXTRACT_WORKERS", min(4, os.cpu_count() or 1))
+        self.max_tasks_per_child = max_tasks_per_child or _env_number(
+            "EXTRACT_MAX_TASKS", DEFAULT_MAX_TASKS)
+        self.timeout = timeout or _env_number("EXTRACT_TIMEOUT", DEFAULT_TIMEOUT, float)
+        self.fn = fn
+        self.generation = 0
+        self._pool = None
+        self._submitted = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _current_pool(self):
+        # Caller holds self._lock.
+        if self._pool is None or self._submitted >= self.workers * self.max_tasks_per_child:
+            if self._pool is not None:
+                logger.debug("Recycling extraction pool after %d documents.", self._submitted)
+                self._pool.shutdown(wait=False)  # in-flight jobs still finish
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            self._submitted = 0
+            self.generation += 1
+        self._submitted += 1
+        return self._pool
+
+    def _retire(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        _kill(pool)
+
+    def extract(self, pdf_path, *args):
+        """
+        Extract one PDF's text in a worker (extra args, e.g. the known sha256,
+        are passed through to fn); ExtractionTimeout if it hangs.
+        """
+        for attempt in range(2):
+            with self._lock:
+                pool = self._current_pool()
+                future = pool.submit(self.fn, pdf_path, *args)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeout:
+                logger.warning("Extraction of %s timed out after %ss; restarting workers.",
+                               pdf_path, self.timeout)
+                self._retire(pool)
+                raise ExtractionTimeout(f"{pdf_path}: extraction exceeded {self.timeout}s")
+            except BrokenProcessPool:
+                # Another document's timeout killed this pool under us (or a
+                # worker crashed): retry once on a fresh pool.
+                self._retire(pool)
+                if attempt:
+                    raise
+        return None  # unreachable
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
@@ -0,0 +1,370 @@
+"""
+fake_cdc.py - Local stand-in for the parts of cdc.gov.tw the scrapers touch.
+
+Serves, from the committed corpus (diseases.json / disease_manuals.json, with
+tests/fixtures/dengue_definition.txt as a fallback document):
+
+    <TARGET_URL path>              case-definition listing (category headers +
+                                   File/Get links), like pdf_fetcher expects
+    /File/Get/case-<n>             viewer page with an a.viewer-button
+    /Uploads/case-<n>.pdf          the case definition as a real PDF
+    <MANUAL_LIST_URL path>?page=k  paginated manual listing
+    /Category/MPage/manual-<n>     manual detail page linking the PDF
+    /Uploads/manual-<n>.pdf        the manual as a real PDF
+
+PDFs are generated on the fly by make_pdf(): plain text set in the standard
+(non-embedded) MSung-Light CNS1 font, which pdfplumber extracts back to the
+original Unicode, so the whole download -> extract -> parse path is exercised.
+Every response carries an ETag / Last-Modified and honours conditional requests.
+
+Knobs for load testing: per-request latency, an injected 429/5xx error rate and
+a per-response bandwidth cap. All links are absolute (built from the request's
+Host header), so the site works whichever base URL the scrapers were given.
+
+Standalone:  python fake_cdc.py --port 8000 --latency 0.05 --error-rate 0.02
+then run a scraper with CDC_BASE_URL=http://127.0.0.1:8000 (bench_scraper.py
+automates this).
+"""
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import threading
+import contextlib
+from collections import namedtuple
+from email.utils import formatdate
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger(__name__)
+
+# Paths only; the host part comes from whichever server is answering.
+CASE_LIST_PATH = "/Category/DiseaseDefine/ZW54U0FpVVhpVGR3UkViWm8rQkNwUT09"
+MANUAL_LIST_PATH = "/Category/DiseaseManual/bU9xd21vK0l5S3gwb3VUTldqdVNnQT09"
+
+FIXTURE_TEXT = os.path.join(os.path.dirname(__file__), "tests", "fixtures",
+                            "dengue_definition.txt")
+
+MANUAL_SECTIONS = [
+    "疾病概述", "致病原", "流行病學", "傳染窩", "傳染方式", "潛伏期",
+    "可傳染期", "感受性及抵抗力", "病例定義", "檢體採檢送驗事項", "防疫措施",
+]
+_NUMERALS = ["一", "二", "三", "四", "五", "六", "七", "八", "九", "十", "十一"]
+_CATEGORY_HEADERS = {
+    "第一類": "第一類法定傳染病", "第二類": "第二類法定傳染病",
+    "第三類": "第三類法定傳染病", "第四類": "第四類法定傳染病",
+    "第五類": "第五類法定傳染病",
+}
+
+Doc = namedtuple("Doc", ["name", "category", "text"])
+
+
+def make_pdf(text, lines_per_page=45, width=38):
+    """
+    Render text as a minimal multi-page PDF that pdfplumber reads back verbatim
+    (modulo wrapping at `width` characters). Uses the predefined UniCNS-UCS2-H
+    CMap, so no font has to be embedded.
+    """
+    lines = []
+    for raw in text.split("\n"):
+        raw = raw or " "
+        while raw:
+            lines.append(raw[:width])
+            raw = raw[width:]
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[" "]]
+
+    objs = []
+
+    def add(obj):
+        objs.append(obj)
+        return len(objs)
+
+    descriptor = add(b"<< /Type /FontDescriptor /FontName /MSung-Light /Flags 6 "
+                     b"/FontBBox [0 -200 1000 900] /ItalicAngle 0 /Ascent 880 "
+                     b"/Descent -120 /CapHeight 880 /StemV 93 >>")
+    cid_font = add(b"<< /Type /Font /Subtype /CIDFontType0 /BaseFont /MSung-Light "
+                   b"/CIDSystemInfo << /Registry (Adobe) /Ordering (CNS1) /Supplement 4 >> "
+                   b"/FontDescriptor %d 0 R /DW 1000 >>" % descriptor)
+    font = add(b"<< /Type /Font /Subtype /Type0 /BaseFont /MSung-Light "
+               b"/Encoding /UniCNS-UCS2-H /DescendantFonts [%d 0 R] >>" % cid_font)
+    pages_id = add(None)  # filled in once the page objects exist
+
+    kids = []
+    for page_lines in pages:
+        ops = ["BT /F1 12 Tf 14 TL 40 800 Td"]
+        ops += ["<%s> Tj T*" % line.encode("utf-16-be").hex() for line in page_lines]
+        ops.append("ET")
+        stream = "\n".join(ops).encode("ascii")
+        contents = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        kids.append(add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+                        b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+                        % (pages_id, font, contents)))
+    objs[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, obj in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (num, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objs) + 1, catalog, xref)
+    return bytes(out)
+
+
+def manual_text(record):
+    """Rebuild a manual's full text (numbered section headers + bodies)."""
+    parts = [record.get("name", "")]
+    for numeral, key in zip(_NUMERALS, MANUAL_SECTIONS):
+        parts.append(f"{numeral}、{key}")
+        parts.append(record.get(key) or "")
+    return "\n".join(parts)
+
+
+def load_corpus(cases_path="diseases.json", manuals_path="disease_manuals.json",
+                max_cases=None, max_manuals=None):
+    """(case_docs, manual_docs) from the committed data files."""
+    def _load(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return []
+
+    with open(FIXTURE_TEXT, encoding="utf-8") as f:
+        fallback = f.read()
+    cases = [Doc(r["name"], r.get("source_category") or "其他", r.get("content") or fallback)
+             for r in _load(cases_path)[:max_cases]]
+    manuals = [Doc(r["name"], "", manual_text(r)) for r in _load(manuals_path)[:max_manuals]]
+    if not cases:
+        cases = [Doc("登革熱", "第二類", fallback)]
+    return cases, manuals
+
+
+class FakeCDC:
+    """The stand-in site: routes, generated PDFs, fault injection and counters."""
+
+    def __init__(self, cases, manuals, latency=0.0, error_rate=0.0,
+                 error_statuses=(429, 500, 503), bandwidth=None, page_size=25, seed=0):
+        self.cases = list(cases)
+        self.manuals = list(manuals)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.bandwidth = bandwidth  # bytes/sec per response, None = unlimited
+        self.page_size = max(1, page_size)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._pdfs = {}
+        self.last_modified = formatdate(0, usegmt=True)
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {"requests": 0, "bytes": 0, "not_modified": 0, "errors": 0}
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _pdf(self, kind, n):
+        key = (kind, n)
+        with self._lock:
+            if key not in self._pdfs:
+                docs = self.cases if kind == "case" else self.manuals
+                self._pdfs[key] = make_pdf(docs[n].text)
+            return self._pdfs[key]
+
+    def _case_listing(self, base):
+        parts = ['<html><body><div class="disease-wrapper">']
+        current = None
+        for n, doc in enumerate(self.cases):
+            if doc.category != current:
+                current = doc.category
+                parts.append(f"<h4>{escape(_CATEGORY_HEADERS.get(current, '其他傳染病'))}</h4>")
+            parts.append(f'<li><a href="{base}/File/Get/case-{n}">{escape(doc.name)}</a></li>')
+        parts.append("</div></body></html>")
+        return "".join(parts)
+
+    def _manual_listing(self, base, page):
+        pages = max(1, -(-len(self.manuals) // self.page_size))
+        start = (page - 1) * self.page_size
+        items = "".join(
+            f'<li><a href="{base}/Category/MPage/manual-{n}">{escape(doc.name)}工作手冊</a></li>'
+            for n, doc in enumerate(self.manuals[start:start + self.page_size], start))
+        nav = "".join(f'<li><a href="{base}{MANUAL_LIST_PATH}?page={p}">{p}</a></li>'
+                      for p in range(1, pages + 1) if p != page)
+        return (f'<html><body><ul class="infectious_disease_ul">{items}</ul>'
+                f'<ul class="pagination">{nav}</ul></body></html>')
+
+    def route(self, path, query, base):
+        """(status, content_type, body) for one GET, or None for 404."""
+        html = "text/html; charset=utf-8"
+        if path == CASE_LIST_PATH:
+            return 200, html, self._case_listing(base).encode("utf-8")
+        if path == MANUAL_LIST_PATH:
+            try:
+                page = int(parse_qs(query).get("page", ["1"])[0])
+            except ValueError:
+                page = 1
+            return 200, html, self._manual_listing(base, page).encode("utf-8")
+        kind_n = path.rsplit("/", 1)[-1]
+        kind, _, n = kind_n.partition("-")
+        n = n[:-4] if n.endswith(".pdf") else n
+        if not n.isdigit():
+            return None
+        n = int(n)
+        docs = self.cases if kind == "case" else self.manuals if kind == "manual" else None
+        if docs is None or n >= len(docs):
+            return None
+        if path.startswith("/Uploads/"):
+            return 200, "application/pdf", self._pdf(kind, n)
+        if path.startswith("/File/Get/") and kind == "case":
+            body = (f'<html><body><a class="viewer-button" href="{base}/Uploads/case-{n}.pdf">'
+                    f'下載</a></body></html>')
+            return 200, html, body.encode("utf-8")
+        if path.startswith("/Category/MPage/") and kind == "manual":
+            body = (f'<html><body><a href="{base}/Uploads/manual-{n}.pdf">'
+                    f'{escape(docs[n].name)}.pdf</a></body></html>')
+            return 200, html, body.encode("utf-8")
+        return None
+
+    def inject_error(self):
+        """An HTTP status to fail this request with, or None."""
+        with self._lock:
+            if self.error_rate and self._rng.random() < self.error_rate:
+                return self._rng.choice(self.error_statuses)
+        return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        logger.debug("fake_cdc: " + fmt, *args)
+
+    def _serve(self, head):
+        site = self.server.site
+        site._count("requests")
+        if site.latency:
+            time.sleep(site.latency)
+
+        status = site.inject_error()
+        if status:
+            site._count("errors")
+            self.send_response(status)
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        parts = urlsplit(self.path)
+        found = site.route(parts.path, parts.query, f"http://{self.headers.get('Host')}")
+        if found is None:
+            self.send_error(404)
+            return
+        _, content_type, body = found
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            site._count("not_modified")
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", site.last_modified)
+        self.end_headers()
+        if head:
+            return
+        self._write_throttled(body, site.bandwidth)
+        site._count("bytes", len(body))
+
+    def _write_throttled(self, body, bandwidth):
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        chunk = max(1024, int(bandwidth / 20))
+        for i in range(0, len(body), chunk):
+            piece = body[i:i + chunk]
+            self.wfile.write(piece)
+            time.sleep(len(piece) / bandwidth)
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+
+@contextlib.contextmanager
+def running(site, host="127.0.0.1", port=0):
+    """Serve `site` on a background thread; yields its base URL."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.site = site
+    thread = threading.Thread(target=server.serve_forever, name="fake-cdc", daemon=True)
+    thread.start()
+    try:
+        yield f"http://{host}:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def add_site_arguments(parser):
+    """Fault-injection / corpus flags shared with bench_scraper.py."""
+    parser.add_argument("--cases", type=int, default=None, help="serve at most N case definitions")
+    parser.add_argument("--manuals", type=int, default=None, help="serve at most N manuals")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests answered with 429/500/503")
+    parser.add_argument("--bandwidth", type=float, default=None,
+                        help="per-response cap in KB/s (default: unlimited)")
+    parser.add_argument("--page-size", type=int, default=25, help="manuals per listing page")
+    parser.add_argument("--seed", type=int, default=0, help="fault-injection RNG seed")
+
+
+def site_from_args(args):
+    cases, manuals = load_corpus(max_cases=args.cases, max_manuals=args.manuals)
+    return FakeCDC(cases, manuals, latency=args.latency, error_rate=args.error_rate,
+                   bandwidth=args.bandwidth * 1024 if args.bandwidth else None,
+                   page_size=args.page_size, seed=args.seed)
+
+
+def main(argv=None):
+    from cdc_common import setup_logging
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Serve a local stand-in CDC site.")
+    parser.add_argument("--port", type=int, default=8000)
+    add_site_arguments(parser)
+    args = parser.parse_args(argv)
+
+    site = site_from_args(args)
+    with running(site, port=args.port) as base_url:
+        logger.info("Serving %d case definitions and %d manuals at %s "
+                    "(set CDC_BASE_URL=%s). Ctrl-C to stop.",
+                    len(site.cases), len(site.manuals), base_url, base_url)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+journal.py - Append-only run journal, crash resume and atomic compaction.
+
+A scraper run used to checkpoint by rewriting its whole JSON file (every 10
+diseases in scraper.py, only at the very end in manual_scraper.py), so a crash
+late in a run either cost O(n) rewrites along the way or lost everything.
+Instead, each finished document is now appended as ONE line to a JSONL
+journal next to the output (diseases.journal.jsonl, ...), flushed and fsync'ed:
+
+    {"key": "登革熱", "out": [[<record>], [<status row>], []]}
+
+`out` holds whatever the loop body added to each of the run's output lists
+for that document (RunJournal.track does the bookkeeping), so the journal
+alone can rebuild every list. When the run finishes, the final dataset is
+built from it in document order and stored in one go -- for the JSON files
+with one os.replace, so readers never see a half-written file (compact(), or
+record_store's save() followed by finish()) -- and the journal is deleted.
+
+A crashed run leaves its journal behind. `--resume` (scraper.py,
+manual_scraper.py) loads it and only processes the documents not in it; a
+torn last line is dropped. The output JSON itself is untouched until
+compaction, so the resumed run still compares against the previous data.
+Without --resume a leftover journal is discarded.
+"""
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def journal_path(output_path):
+    """diseases.json -> diseases.journal.jsonl"""
+    return os.path.splitext(output_path)[0] + ".journal.jsonl"
+
+
+def write_json_atomic(path, data, **dump_kwargs):
+    """json.dump to a temp file next to path, then os.replace it into place."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, **dump_kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class RunJournal:
+    """The journal of one (possibly resumed) run; entries are keyed by document."""
+
+    def __init__(self, path, resume=False, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self.entries = {}
+        if resume:
+            self._load()
+        elif os.path.exists(path):
+            logger.info("Discarding the journal of an unfinished run (%s); "
+                        "pass --resume to continue it instead.", path)
+        # Rewrite only the intact entries, so appends never follow a torn line.
+        self._file = None
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            for key, out in self.entries.items():
+                f.write(self._line(key, out))
+        os.replace(path + ".tmp", path)
+        self._file = open(path, "a", encoding="utf-8")
+
+    @staticmethod
+    def _line(key, out):
+        return json.dumps({"key": key, "out": out}, ensure_ascii=False) + "\n"
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for n, line in enumerate(lines, 1):
+            try:
+                entry = json.loads(line)
+                self.entries[entry["key"]] = entry["out"]
+            except (ValueError, KeyError, TypeError):
+                # Only the last line can be torn by a crash; anything after a
+                # bad line is not trusted either.
+                logger.warning("Journal %s: dropping unreadable line %d and after.", self.path, n)
+                break
+        logger.info("Resuming: %d document(s) already done in %s.", len(self.entries), self.path)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def append(self, key, out):
+        """Record a finished document; durable once this returns."""
+        self.entries[key] = out
+        self._file.write(self._line(key, out))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def track(self, items, key, *outputs):
+        """
+        Yield items; once the loop body for an item has finished (the loop asks
+        for the next one, or ends), journal what it appended to each of the
+        output lists. A body that raises is not journaled, so the document is
+        processed again on resume.
+        """
+        for item in items:
+            marks = [len(o) for o in outputs]
+            yield item
+            self.append(key(item), [o[m:] for o, m in zip(outputs, marks)])
+
+    def collect(self, keys, n_outputs):
+        """The output lists rebuilt from the journal, in `keys` order."""
+        lists = [[] for _ in range(n_outputs)]
+        for k in dict.fromkeys(keys):
+            for lst, part in zip(lists, self.entries.get(k) or ()):
+                lst.extend(part)
+        return lists
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def finish(self):
+        """Retire the journal once its contents are safely stored elsewhere."""
+        self.close()
+        os.remove(self.path)
+
+    def compact(self, output_path, data, **dump_kwargs):
+        """Write the final JSON atomically and retire the journal."""
+        write_json_atomic(output_path, data, **dump_kwargs)
+        self.finish()
@@ -0,0 +1,108 @@
+"""
+link_cache.py - Persistent viewer-URL -> PDF-URL resolution cache.
+
+Both scrapers reach each PDF in two hops: the listing links to a viewer/detail
+page, and only that page (a.viewer-button / embed / .pdf link) reveals the
+actual PDF URL. The second hop almost never changes, yet it cost one HTML
+fetch + BeautifulSoup parse per disease per run. ResolutionCache remembers the
+answer, keyed by viewer URL, in a small JSON file committed next to
+diseases.json (pdf_url_cache.json / manual_pdf_url_cache.json), so a
+steady-state run only requests the PDFs themselves.
+
+Entries are re-resolved when:
+  * they are older than the TTL (LINK_CACHE_TTL_DAYS, default 7);
+  * the listing link for that disease changed -- the stale entry recorded
+    under the disease's name is dropped as soon as a different viewer URL is
+    looked up for it;
+  * the cached PDF URL stops working -- callers invalidate() it and resolve
+    again fresh (see the scrapers' download stages).
+"""
+import os
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_DAYS = 7
+_DATE_FMT = "%Y-%m-%dT%H:%M:%S"
+
+
+def _ttl_from_env():
+    try:
+        return float(os.environ.get("LINK_CACHE_TTL_DAYS", DEFAULT_TTL_DAYS))
+    except ValueError:
+        return DEFAULT_TTL_DAYS
+
+
+class ResolutionCache:
+    """Thread-safe {viewer_url: {name, pdf_url, resolved}} with TTL."""
+
+    def __init__(self, path, ttl_days=None, now=datetime.now):
+        self.path = path
+        self.ttl = timedelta(days=_ttl_from_env() if ttl_days is None else ttl_days)
+        self.hits = self.misses = 0
+        self._now = now
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._entries = {}
+
+    def lookup(self, name, viewer_url):
+        """Cached PDF URL for this disease's viewer page, or None if absent/expired."""
+        with self._lock:
+            # The listing now points this disease somewhere else: forget the old link.
+            for url in [u for u, e in self._entries.items()
+                        if e.get("name") == name and u != viewer_url]:
+                del self._entries[url]
+            entry = self._entries.get(viewer_url)
+            if not entry:
+                return None
+            try:
+                resolved = datetime.strptime(entry["resolved"], _DATE_FMT)
+            except (KeyError, ValueError):
+                return None
+            if self._now() - resolved > self.ttl:
+                return None
+            return entry.get("pdf_url")
+
+    def store(self, name, viewer_url, pdf_url):
+        with self._lock:
+            self._entries[viewer_url] = {
+                "name": name,
+                "pdf_url": pdf_url,
+                "resolved": self._now().strftime(_DATE_FMT),
+            }
+
+    def invalidate(self, viewer_url):
+        with self._lock:
+            self._entries.pop(viewer_url, None)
+
+    def resolve(self, name, viewer_url, resolver):
+        """
+        Return (pdf_url, from_cache). On a miss resolver(viewer_url) is called
+        and a truthy answer is remembered; failures (None) are never cached.
+        """
+        pdf_url = self.lookup(name, viewer_url)
+        if pdf_url:
+            with self._lock:
+                self.hits += 1
+            return pdf_url, True
+        with self._lock:
+            self.misses += 1
+        pdf_url = resolver(viewer_url)
+        if pdf_url:
+            self.store(name, viewer_url, pdf_url)
+        return pdf_url, False
+
+    def save(self):
+        with self._lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+        logger.info("PDF link cache: %d hits, %d resolved (%s).",
+                    self.hits, self.misses, self.path)
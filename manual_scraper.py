@@ -1,19 +1,36 @@
 import os
 import re
-import json
-import time
 import logging
 import urllib.parse
 from bs4 import BeautifulSoup
 from datetime import datetime
 
-from scraper import diff_texts
-from data_parser import clean_section_text
-from cdc_common import BASE_URL, fetch, download_pdf, write_csv, setup_logging
+from scraper import upgrade_diffs
+from text_diff import compact_diff
+from data_parser import is_stale
+from section_grammar import SectionGrammar, NUMBERED_CHINESE
+from cdc_common import (
+    BASE_URL, fetch, download_pdf, write_csv, setup_logging, get_text_cache,
+    get_validator_store, get_limiter, get_breaker,
+)
+from extraction_pool import ExtractionExecutor
+from link_cache import ResolutionCache
+from journal import RunJournal, journal_path
+from record_store import get_store
+from section_history import SectionHistory
+from fetch_pipeline import Stage, run_pipeline, configured_workers
 
 logger = logging.getLogger(__name__)
 
-MANUAL_LIST_URL = "https://www.cdc.gov.tw/Category/DiseaseManual/bU9xd21vK0l5S3gwb3VUTldqdVNnQT09"
+MANUAL_LIST_URL = BASE_URL + "/Category/DiseaseManual/bU9xd21vK0l5S3gwb3VUTldqdVNnQT09"
+
+# Stamped on every manual record as 'parser_version'; bump it whenever
+# parse_manual_text's output changes so unchanged PDFs get re-parsed too
+# (see data_parser.PARSER_VERSION).
+PARSER_VERSION = 1
+
+# Detail page -> PDF URL answers, kept next to disease_manuals.json (link_cache.py).
+LINK_CACHE_PATH = "manual_pdf_url_cache.json"
 
 
 def parse_manual_listing(html):
@@ -91,69 +108,96 @@ def get_actual_pdf_link(detail_url):
     for a in soup.select('a[href]'):
         if '.pdf' in a['href'].lower() or '/File/Get/' in a['href']:
             # Prevent circular reference if it points back to itself
-            full_url = urllib.parse.urljoin("https://www.cdc.gov.tw", a['href'])
+            full_url = urllib.parse.urljoin(BASE_URL, a['href'])
             if full_url != detail_url:
                 return full_url
     # If no further PDF link found, maybe the detail_url itself is a PDF delivery endpoint
     return detail_url
 
+# Running page headers of the manuals ("...工作手冊－...", "...年修訂") are
+# dropped before header matching.
+_MANUAL_PAGE_HEADERS = (re.compile(r'年修訂$'), re.compile(r'工作手冊.*－|－.*工作手冊'))
+
+# 防治工作手冊 chapters: numeral (一、 or 壹、) + header + optional English
+# title, e.g. "一、疾病概述（Disease description）".
+MANUAL_SECTIONS = SectionGrammar(
+    ["疾病概述", "致病原", "流行病學", "傳染窩", "傳染方式",
+     "潛伏期", "可傳染期", "感受性及抵抗力", "病例定義", "檢體採檢送驗事項", "防疫措施"],
+    numbering=NUMBERED_CHINESE,
+    trailer=r'(?:\s*[（\(][A-Za-z\s\-]+[）\)])?',
+    skip=_MANUAL_PAGE_HEADERS,
+    flags=re.IGNORECASE,
+)
+
+
 def parse_manual_text(text):
     """Parses text into sections based on typical headers."""
-    # List of common headers to look for
-    headers_map = [
-        "疾病概述", "致病原", "流行病學", "傳染窩", "傳染方式", 
-        "潛伏期", "可傳染期", "感受性及抵抗力", "病例定義", "檢體採檢送驗事項", "防疫措施"
-    ]
-    
-    # Regex to match: numeral (一、 or 壹、) + optional title + header
-    # e.g., "一、疾病概述（Disease description）"
-    header_pattern = re.compile(
-        r'^\s*([一二三四五六七八九十壹貳參肆伍陸柒捌玖拾]+)\s*[、.]\s*'
-        r'(' + '|'.join(headers_map) + r')'
-        r'(?:\s*[（\(][A-Za-z\s\-]+[）\)])?\s*$', re.IGNORECASE
-    )
-    
-    sections = {k: "" for k in headers_map}
-    current_section = None
-    buffer = []
-    
-    for line in text.split('\n'):
-        # Ignore page footers/headers or pagination markers
-        stripped = line.strip()
-        if stripped.endswith("年修訂") or "工作手冊" in stripped and "－" in stripped:
-            continue
-            
-        match = header_pattern.match(stripped)
-        if match:
-            # Save previous
-            if current_section and current_section in sections:
-                sections[current_section] = "\n".join(buffer).strip()
-            
-            header_name = match.group(2)
-            current_section = header_name
-            buffer = []
-            continue
-            
-        if current_section:
-            buffer.append(line)
-            
-    # Save last
-    if current_section and current_section in sections:
-        sections[current_section] = "\n".join(buffer).strip()
+    return MANUAL_SECTIONS.parse(text)
 
-    for key in sections:
-        sections[key] = clean_section_text(sections[key])
+def _fetch_stages(pdf_dir, workers, extractor, links):
+    """
+    The resolve -> download -> extract stages for one manual job.
+
+    Mirrors scraper._fetch_stages: a job starts as {'disease', 'record',
+    'expected_hash'} and collects pdf_url / pdf_path / current_hash / text;
+    jobs with no link, a failed download or a still-current record (same hash
+    and parser_version) stop early. Detail pages are only
+    fetched when the link cache has no fresh answer for them.
+    """
+    def resolve(job):
+        disease = job['disease']
+        job['pdf_url'], job['link_cached'] = links.resolve(
+            disease['name'], disease['url'], get_actual_pdf_link)
+        if not job['pdf_url']:
+            job['done'] = True
+
+    def download(job):
+        disease = job['disease']
+        try:
+            _, job['pdf_path'], job['current_hash'] = download_pdf(
+                job['pdf_url'], pdf_dir, disease['name'], job['expected_hash'],
+                extract=False)
+        except Exception:
+            if not job['link_cached']:
+                raise
+            # The remembered PDF URL may have gone stale: re-resolve and retry once.
+            links.invalidate(disease['url'])
+            job['pdf_url'], job['link_cached'] = links.resolve(
+                disease['name'], disease['url'], get_actual_pdf_link)
+            _, job['pdf_path'], job['current_hash'] = download_pdf(
+                job['pdf_url'], pdf_dir, disease['name'], job['expected_hash'],
+                extract=False)
+        if not is_stale(job['record'], job['current_hash'], PARSER_VERSION):
+            job['done'] = True
+
+    def extract(job):
+        try:
+            job['text'] = extractor.extract(job['pdf_path'], job['current_hash'])
+        except Exception as e:
+            if job['current_hash'] != job['expected_hash']:
+                raise
+            # Only a re-parse failed: the old record stays as it is.
+            logger.warning("Error re-extracting %s: %s", job['pdf_path'], e)
+
+    return [
+        Stage("resolve", resolve, workers),
+        Stage("download", download, workers),
+        Stage("extract", extract, extractor.workers),
+    ]
 
-    return sections
 
-def main():
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Scrape the CDC disease manuals into disease_manuals.json.")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run from its journal")
+    args = parser.parse_args(argv)
     setup_logging()
     pdf_dir = "manual_pdfs"
     os.makedirs(pdf_dir, exist_ok=True)
     
     try:
-        with open("disease_manuals.json", "r", encoding="utf-8") as f:
-            existing_data = {d['name']: d for d in json.load(f)}
+        existing_data = {d['name']: upgrade_diffs(d) for d in get_store().load("manuals")}
     except FileNotFoundError:
         existing_data = {}
     
@@ -164,62 +208,102 @@ def main():
     logger.info("Found %d manual links.", len(links))
     
     results = []
-    
-    for i, disease in enumerate(links):
-        name = disease['name']
-        list_url = disease['url']
-        logger.info("[%d/%d] Processing %s...", i + 1, len(links), name)
-
-        pdf_url = get_actual_pdf_link(list_url)
-        if not pdf_url:
-            logger.warning("Could not find PDF link for %s", name)
-            continue
-            
-        old_record = existing_data.get(name)
-        expected_hash = old_record.get('pdf_hash') if old_record else None
 
-        # Download (+ hash + text extraction) via the shared helper.
-        try:
-            text, pdf_path, current_hash = download_pdf(pdf_url, pdf_dir, name, expected_hash)
-        except Exception as e:
-            logger.warning("Download/extract error: %s", e)
-            continue
-
-        if text is None and current_hash == expected_hash:
-            logger.info("  Unchanged (hash matched); skipping extraction.")
-            # Update the URL just in case
-            old_record['url'] = pdf_url
-            if 'last_pdf_update' not in old_record:
-                old_record['last_pdf_update'] = now_date_str
-            results.append(old_record)
-            continue
-
-        logger.info("  Update detected: %s (hash %s)", name, current_hash[:6])
-
-        # Parse
-        parsed_sections = parse_manual_text(text)
+    # Finished manuals go to the journal (journal.py) as they complete.
+    journal = RunJournal(journal_path("disease_manuals.json"), resume=args.resume)
+    jobs = [
+        {'disease': d, 'record': existing_data.get(d['name']),
+         'expected_hash': (existing_data.get(d['name']) or {}).get('pdf_hash')}
+        for d in links if d['name'] not in journal
+    ]
+    with ExtractionExecutor() as extractor:
+        link_cache = ResolutionCache(LINK_CACHE_PATH)
+        stages = _fetch_stages(pdf_dir, configured_workers(), extractor, link_cache)
+
+        # Fetching runs concurrently; jobs come back in listing order.
+        tracked = journal.track(run_pipeline(jobs, stages), lambda job: job['disease']['name'], results)
+        for i, job in enumerate(tracked):
+            disease = job['disease']
+            name = disease['name']
+            logger.info("[%d/%d] Processing %s...", i + 1, len(jobs), name)
+
+            if job.get('error'):
+                logger.warning("Download/extract error: %s", job['error'])
+                continue
+
+            pdf_url = job.get('pdf_url')
+            if not pdf_url:
+                logger.warning("Could not find PDF link for %s", name)
+                continue
+
+            old_record = existing_data.get(name)
+            expected_hash = job['expected_hash']
+            text, current_hash = job.get('text'), job.get('current_hash')
+
+            if text is None and current_hash == expected_hash:
+                logger.info("  Unchanged (hash matched); skipping extraction.")
+                # Update the URL just in case
+                old_record['url'] = pdf_url
+                if 'last_pdf_update' not in old_record:
+                    old_record['last_pdf_update'] = now_date_str
+                results.append(old_record)
+                continue
+
+            if current_hash == expected_hash and old_record:
+                # Same PDF, older parser_version: rebuild the sections only (no
+                # diffs; last_pdf_update stays). The previous update's diffs
+                # are run lengths into the old parse's text, so they go too.
+                logger.info("  Re-parsing (parser v%s -> v%d).",
+                            old_record.get('parser_version'), PARSER_VERSION)
+                results.append({
+                    'name': name,
+                    'url': pdf_url,
+                    'pdf_hash': current_hash,
+                    'last_pdf_update': old_record.get('last_pdf_update', now_date_str),
+                    'parser_version': PARSER_VERSION,
+                    **parse_manual_text(text),
+                })
+                continue
+
+            logger.info("  Update detected: %s (hash %s)", name, current_hash[:6])
+
+            # Parse
+            parsed_sections = parse_manual_text(text)
         
-        record = {
-            'name': name,
-            'url': pdf_url, # Reference direct PDF
-            'pdf_hash': current_hash,
-            'last_pdf_update': now_date_str,
-            **parsed_sections
-        }
+            record = {
+                'name': name,
+                'url': pdf_url, # Reference direct PDF
+                'pdf_hash': current_hash,
+                'last_pdf_update': now_date_str,
+                'parser_version': PARSER_VERSION,
+                **parsed_sections
+            }
         
-        if old_record:
-            for k in ["疾病概述", "致病原", "流行病學", "傳染窩", "傳染方式", "潛伏期", "可傳染期", "感受性及抵抗力", "病例定義", "檢體採檢送驗事項", "防疫措施"]:
-                val_old = old_record.get(k, "")
-                val_new = parsed_sections.get(k, "")
-                if val_old != val_new:
-                    record[k + "_diff"] = diff_texts(val_old, val_new)
+            if old_record:
+                for k in ["疾病概述", "致病原", "流行病學", "傳染窩", "傳染方式", "潛伏期", "可傳染期", "感受性及抵抗力", "病例定義", "檢體採檢送驗事項", "防疫措施"]:
+                    val_old = old_record.get(k, "")
+                    val_new = parsed_sections.get(k, "")
+                    if val_old != val_new:
+                        record[k + "_diff"] = compact_diff(val_old, val_new)
                     
-        results.append(record)
-
-        time.sleep(0.5)
-
-    with open("disease_manuals.json", "w", encoding="utf-8") as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+            results.append(record)
+
+    link_cache.save()
+    if get_text_cache() is not None:
+        get_text_cache().evict()
+    if get_validator_store() is not None:
+        get_validator_store().save()
+        logger.info(get_validator_store().summary())
+    logger.info(get_limiter().summary())
+    if get_breaker().trips:
+        logger.warning("Circuit breaker opened %d time(s) during this run.", get_breaker().trips)
+
+    results, = journal.collect([d['name'] for d in links], 1)
+    SectionHistory.open("manuals").record_all(results, MANUAL_SECTIONS.keys, now_date_str)
+    get_store().save("manuals", results)
+    journal.finish()
+    get_store().log_run("manuals", total=len(links), updated=sum(
+        1 for r in results if r.get('last_pdf_update') == now_date_str), failed=len(links) - len(results))
 
     write_csv("disease_manuals.csv", results)
 
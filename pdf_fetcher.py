@@ -11,7 +11,7 @@ from cdc_common import BASE_URL, fetch, download_pdf
 
 logger = logging.getLogger(__name__)
 
-TARGET_URL = "https://www.cdc.gov.tw/Category/DiseaseDefine/ZW54U0FpVVhpVGR3UkViWm8rQkNwUT09"
+TARGET_URL = BASE_URL + "/Category/DiseaseDefine/ZW54U0FpVVhpVGR3UkViWm8rQkNwUT09"
 PDF_DIR = "pdfs"
 
 
@@ -107,15 +107,17 @@ def get_actual_pdf_url(viewer_url):
         logger.warning("Error finding PDF URL on %s: %s", viewer_url, e)
         return None
 
-def download_and_extract_pdf(full_pdf_url, disease_name, expected_hash=None):
+def download_and_extract_pdf(full_pdf_url, disease_name, expected_hash=None, extract=True):
     """
     Download PDF from the actual PDF url, save locally, and extract text content.
     Returns tuple: (text_content, local_pdf_path, pdf_hash)
     If expected_hash is provided and matches, returns (None, local_pdf_path, pdf_hash)
+    With extract=False the text is left for the caller: (None, local_pdf_path, pdf_hash)
     Returns (None, None, None) on failure.
     """
     try:
-        return download_pdf(full_pdf_url, PDF_DIR, disease_name, expected_hash)
+        return download_pdf(full_pdf_url, PDF_DIR, disease_name, expected_hash,
+                            extract=extract)
     except Exception as e:
         logger.warning("Error processing %s: %s", full_pdf_url, e)
         return None, None, None
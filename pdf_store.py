@@ -0,0 +1,272 @@
+"""
+pdf_store.py - Content-addressed PDF storage with dedupe, gc and verify.
+
+pdfs/ and manual_pdfs/ are keyed by safe_filename(name), which made renamed
+diseases leave their old file behind forever and stored a PDF that backs two
+entries twice. The bytes now live once, under their sha256:
+
+    store/ab/abcdef0123....pdf
+
+and pdfs/<name>.pdf / manual_pdfs/<name>.pdf are links to the blob -- hard
+links by default (PDF_STORE_LINK=hardlink), or relative symlinks
+(PDF_STORE_LINK=symlink); where neither works the blob is copied. Readers
+keep opening the per-name paths as before. cdc_common.download_pdf() moves
+each freshly downloaded temp file into the store (or drops it when the blob
+already exists) and only re-points the per-name link when it doesn't
+already resolve to that blob, so an unchanged PDF touches nothing on disk.
+
+The store sits next to the PDF directories (store/ beside pdfs/), or at
+PDF_STORE_DIR; PDF_STORE=0 turns it off (plain per-name files as before).
+Blobs are never written in place -- every write is a new file plus a rename --
+so a hard-linked per-name path can't corrupt a blob.
+
+    python pdf_store.py adopt           # move existing per-name files into the store
+    python pdf_store.py gc [--dry-run]  # drop blobs / per-name files no record references
+    python pdf_store.py verify          # re-hash every blob (mmap, in parallel)
+    python pdf_store.py stats
+"""
+import os
+import sys
+import mmap
+import shutil
+import hashlib
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+STORE_DIRNAME = "store"
+LINK_MODES = ("hardlink", "symlink")
+# Record datasets and the per-name directory their PDFs are linked into.
+LINK_DIRS = {"cases": "pdfs", "manuals": "manual_pdfs"}
+
+
+def mmap_sha256(path):
+    """sha256 hex digest of a file, hashed straight from an mmap of it."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size:
+            # hashlib releases the GIL on large buffers, so threads hash in parallel.
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                h.update(mm)
+    return h.hexdigest()
+
+
+class PdfStore:
+    """Blobs under root/<sha256[:2]>/<sha256>.pdf, linked to per-name paths."""
+
+    def __init__(self, root, link_mode=None):
+        self.root = root
+        self.link_mode = link_mode or os.environ.get("PDF_STORE_LINK", "hardlink")
+        if self.link_mode not in LINK_MODES:
+            logger.warning("Unknown PDF_STORE_LINK=%r; using hardlinks.", self.link_mode)
+            self.link_mode = "hardlink"
+        self._lock = threading.Lock()
+
+    def blob_path(self, sha256):
+        return os.path.join(self.root, sha256[:2], f"{sha256}.pdf")
+
+    def blobs(self):
+        """{sha256: path} of every blob in the store."""
+        found = {}
+        if not os.path.isdir(self.root):
+            return found
+        for shard in sorted(os.listdir(self.root)):
+            shard_dir = os.path.join(self.root, shard)
+            if len(shard) != 2 or not os.path.isdir(shard_dir):
+                continue
+            for filename in os.listdir(shard_dir):
+                if filename.endswith(".pdf"):
+                    found[filename[:-len(".pdf")]] = os.path.join(shard_dir, filename)
+        return found
+
+    def put(self, src_path, sha256):
+        """Move src_path (already hashed to sha256) into the store; return the blob path."""
+        blob = self.blob_path(sha256)
+        with self._lock:  # two jobs may deliver the same PDF at once
+            if os.path.exists(blob):
+                os.remove(src_path)
+                return blob
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            try:
+                os.replace(src_path, blob)
+            except OSError:  # e.g. the store is on another filesystem
+                shutil.move(src_path, blob)
+        return blob
+
+    def adopt(self, path, sha256):
+        """Take an existing per-name file into the store without rewriting it."""
+        blob = self.blob_path(sha256)
+        with self._lock:
+            if not os.path.exists(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                try:
+                    os.link(path, blob)
+                except OSError:
+                    shutil.copy2(path, blob)
+        self.link(sha256, path)
+        return blob
+
+    def is_linked(self, sha256, path):
+        try:
+            return os.path.samefile(path, self.blob_path(sha256))
+        except OSError:
+            return False
+
+    def link(self, sha256, path):
+        """Point path at the blob (atomically); a no-op if it already does."""
+        if self.is_linked(sha256, path):
+            return False
+        blob = self.blob_path(sha256)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.lnk"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        try:
+            if self.link_mode == "hardlink":
+                try:
+                    os.link(blob, tmp)
+                except OSError:
+                    self._symlink_or_copy(blob, tmp)
+            else:
+                self._symlink_or_copy(blob, tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+            raise
+        return True
+
+    @staticmethod
+    def _symlink_or_copy(blob, tmp):
+        try:
+            os.symlink(os.path.relpath(blob, os.path.dirname(tmp) or "."), tmp)
+        except OSError:
+            shutil.copy2(blob, tmp)
+
+    def gc(self, referenced, link_dirs=None, dry_run=False):
+        """
+        Remove every blob whose hash is not in `referenced`, and every *.pdf in
+        link_dirs ({dir: set of file names to keep}) that no record names.
+        Returns (removed blob paths, removed per-name paths).
+        """
+        removed_links = []
+        for link_dir, keep in (link_dirs or {}).items():
+            if not os.path.isdir(link_dir):
+                continue
+            for filename in sorted(os.listdir(link_dir)):
+                if filename.endswith(".pdf") and filename not in keep:
+                    path = os.path.join(link_dir, filename)
+                    removed_links.append(path)
+                    if not dry_run:
+                        os.remove(path)
+        removed_blobs = []
+        for sha256, path in sorted(self.blobs().items()):
+            if sha256 not in referenced:
+                removed_blobs.append(path)
+                if not dry_run:
+                    os.remove(path)
+        return removed_blobs, removed_links
+
+    def verify(self, workers=None):
+        """[(sha256, actual sha256)] for every blob whose bytes don't match its name."""
+        blobs = self.blobs()
+        with ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1)) as pool:
+            actual = pool.map(mmap_sha256, blobs.values())
+            return [(sha, got) for sha, got in zip(blobs, actual) if sha != got]
+
+    def stats(self):
+        blobs = self.blobs()
+        return {"blobs": len(blobs),
+                "bytes": sum(os.path.getsize(p) for p in blobs.values())}
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def store_for(pdf_dir):
+    """The PdfStore serving pdf_dir (store/ beside it, or PDF_STORE_DIR), or None if disabled."""
+    if os.environ.get("PDF_STORE", "1") == "0":
+        return None
+    root = os.environ.get("PDF_STORE_DIR") or os.path.join(
+        os.path.dirname(os.path.normpath(pdf_dir)), STORE_DIRNAME)
+    with _stores_lock:  # one instance (and lock) per store for all download threads
+        if root not in _stores:
+            _stores[root] = PdfStore(root)
+        return _stores[root]
+
+
+def _records():
+    from record_store import get_store
+    records = {}
+    for dataset in LINK_DIRS:
+        try:
+            records[dataset] = get_store().load(dataset)
+        except FileNotFoundError:
+            records[dataset] = []
+    return records
+
+
+def main(argv=None):
+    from cdc_common import setup_logging, safe_filename
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Manage the content-addressed PDF store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("adopt", help="move per-name PDFs matching their record's hash into the store")
+    gc = sub.add_parser("gc", help="remove blobs and per-name PDFs no record references")
+    gc.add_argument("--dry-run", action="store_true")
+    ver = sub.add_parser("verify", help="re-hash every blob and report mismatches")
+    ver.add_argument("--workers", type=int, default=None)
+    sub.add_parser("stats", help="blob count and size")
+    args = parser.parse_args(argv)
+
+    store = store_for(LINK_DIRS["cases"])
+    if store is None:
+        logger.error("The PDF store is disabled (PDF_STORE=0).")
+        return 1
+
+    if args.command == "adopt":
+        adopted = 0
+        for dataset, records in _records().items():
+            for r in records:
+                path = os.path.join(LINK_DIRS[dataset], f"{safe_filename(r['name'])}.pdf")
+                if (r.get("pdf_hash") and os.path.isfile(path)
+                        and not store.is_linked(r["pdf_hash"], path)
+                        and mmap_sha256(path) == r["pdf_hash"]):
+                    store.adopt(path, r["pdf_hash"])
+                    adopted += 1
+        logger.info("Adopted %d PDF(s) into %s/.", adopted, store.root)
+    elif args.command == "gc":
+        records = _records()
+        if not any(records.values()):
+            logger.error("No records found; refusing to collect every blob.")
+            return 1
+        referenced = {r["pdf_hash"] for rs in records.values() for r in rs if r.get("pdf_hash")}
+        # A dataset with no records (never scraped here) leaves its directory alone.
+        keep = {LINK_DIRS[d]: {f"{safe_filename(r['name'])}.pdf" for r in rs}
+                for d, rs in records.items() if rs}
+        blobs, links = store.gc(referenced, keep, dry_run=args.dry_run)
+        verb = "Would remove" if args.dry_run else "Removed"
+        for path in links + blobs:
+            logger.info("%s %s", verb, path)
+        logger.info("%s %d blob(s) and %d orphaned per-name PDF(s).", verb, len(blobs), len(links))
+    elif args.command == "verify":
+        bad = store.verify(args.workers)
+        for expected, actual in bad:
+            logger.error("Corrupt blob %s (content hashes to %s)", store.blob_path(expected), actual)
+        blobs = store.blobs()
+        for dataset, records in _records().items():
+            for r in records:
+                if r.get("pdf_hash") and r["pdf_hash"] not in blobs:
+                    logger.warning("%s: no blob for %s (%s) yet.", dataset, r["name"], r["pdf_hash"][:12])
+        logger.info("Verified %d blob(s): %d corrupt.", len(store.blobs()), len(bad))
+        return 1 if bad else 0
+    else:
+        stats = store.stats()
+        print(f"{stats['blobs']} blobs, {stats['bytes'] / 1024 / 1024:.1f} MB in {store.root}/")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
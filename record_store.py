@@ -0,0 +1,477 @@
+"""
+record_store.py - Repository layer for the scraped records (JSON or SQLite).
+
+Every script used to json.load() / json.dump() diseases.json and
+disease_manuals.json directly. They now go through get_store(), which returns
+one of two backends with the same small interface:
+
+    load(dataset)             -> list of records, in stored order
+                                 (FileNotFoundError if never saved)
+    save(dataset, records)    replace the dataset with `records`; returns
+                              how many records were written
+    log_run(dataset, ...)     record one scraper run's counts
+    export(dataset, path)     write the public JSON file
+    load_lazy(dataset)        like load(), but may return read-only records
+                              that only read their section texts when asked
+
+where `dataset` is "cases" (diseases.json) or "manuals" (disease_manuals.json).
+
+  * JsonStore (default, RECORD_STORE=json) -- the two JSON arrays, exactly as
+    before; save() writes the whole file atomically (tmp + os.replace).
+  * SqliteStore (RECORD_STORE=sqlite, file RECORD_DB, default records.db) --
+    indexed tables:
+
+        records    one row per record: the record's JSON (key order kept),
+                   its position, pdf_hash, parser_version and last_pdf_update
+                   (indexed by dataset + name and dataset + last_pdf_update)
+        sections   one row per non-empty section text of a record
+        pdf_hashes every (record, pdf_hash) ever seen, with the first date
+        runs       one row per scraper run (counts, timestamps)
+
+    save() only writes the rows whose record actually changed, so a daily
+    run that touched three documents writes three rows, not the whole dataset.
+    updated_since() / get() answer the common queries from the indexes.
+
+  * ShardStore (RECORD_STORE=shards, directory SHARD_DIR, default data/) --
+    one file per record plus an index per dataset:
+
+        data/cases/index.json        [{"name", "file", "sha", "filled",
+        data/cases/登革熱.json          <summary fields>}, ...] in stored order
+        data/manuals/...
+
+    save() rewrites only the shards whose bytes changed (the index's sha says
+    which), so a daily run that touched three documents changes three files
+    and git stores three new blobs instead of a whole new 1.5 MB array. The
+    index carries each record's summary fields (SUMMARY_FIELDS) and the keys
+    whose values are non-empty, so load_lazy() can hand out LazyRecords that
+    answer name / dates / has(key) from the index and only open the shard
+    when something else is read. build_feed, check_coverage and build_api's
+    summary never deserialize a section text this way.
+
+The public repository still publishes today's JSON files: export() renders
+them from the database / shards with the same json.dumps settings the
+scrapers always used, so the output is byte-for-byte what the JSON backend
+would have written. CLI:
+
+    python record_store.py import            # JSON files -> RECORD_DB
+    python record_store.py export            # RECORD_DB -> JSON files
+    python record_store.py stats
+    python record_store.py --backend shards import   # JSON files -> SHARD_DIR
+"""
+import os
+import sys
+import json
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+from datetime import datetime
+from collections.abc import Mapping
+
+from journal import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+DATASETS = {"cases": "diseases.json", "manuals": "disease_manuals.json"}
+DEFAULT_DB = "records.db"
+DEFAULT_SHARD_DIR = "data"
+# Record fields copied into the shard index (see ShardStore / LazyRecord).
+SUMMARY_FIELDS = ("name", "english_name", "source_category", "category", "url",
+                  "actual_pdf_url", "last_pdf_update", "pdf_hash", "parser_version")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    dataset   TEXT PRIMARY KEY,
+    saved_at  TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS records (
+    dataset         TEXT NOT NULL,
+    name            TEXT NOT NULL,
+    position        INTEGER NOT NULL,
+    pdf_hash        TEXT,
+    parser_version  INTEGER,
+    last_pdf_update TEXT,
+    data            TEXT NOT NULL,
+    PRIMARY KEY (dataset, name)
+);
+CREATE INDEX IF NOT EXISTS records_by_update ON records (dataset, last_pdf_update);
+CREATE INDEX IF NOT EXISTS records_by_position ON records (dataset, position);
+CREATE TABLE IF NOT EXISTS sections (
+    dataset  TEXT NOT NULL,
+    name     TEXT NOT NULL,
+    section  TEXT NOT NULL,
+    text     TEXT NOT NULL,
+    PRIMARY KEY (dataset, name, section)
+);
+CREATE TABLE IF NOT EXISTS pdf_hashes (
+    dataset     TEXT NOT NULL,
+    name        TEXT NOT NULL,
+    pdf_hash    TEXT NOT NULL,
+    first_seen  TEXT,
+    PRIMARY KEY (dataset, name, pdf_hash)
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    dataset      TEXT NOT NULL,
+    started_at   TEXT,
+    finished_at  TEXT NOT NULL,
+    total        INTEGER,
+    updated      INTEGER,
+    failed       INTEGER
+);
+"""
+
+
+def section_fields(dataset):
+    """The section-text keys of a dataset's records."""
+    # Imported lazily: the scrapers import this module.
+    if dataset == "cases":
+        from data_parser import CASE_SECTIONS, CASE_DEFINITIONS
+        return CASE_SECTIONS.keys + CASE_DEFINITIONS.keys
+    from manual_scraper import MANUAL_SECTIONS
+    return MANUAL_SECTIONS.keys
+
+
+def has_value(record, key):
+    """Whether record[key] is non-empty (not blank), without loading a LazyRecord's shard."""
+    if isinstance(record, LazyRecord):
+        return record.has(key)
+    return _filled(record.get(key))
+
+
+def _filled(value):
+    return bool(value) and (not isinstance(value, str) or bool(value.strip()))
+
+
+class JsonStore:
+    """The JSON files themselves (one array per dataset)."""
+
+    def __init__(self, paths=None):
+        self.paths = dict(DATASETS, **(paths or {}))
+
+    def load(self, dataset):
+        with open(self.paths[dataset], "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, dataset, records):
+        write_json_atomic(self.paths[dataset], records, indent=2)
+        return len(records)
+
+    def load_lazy(self, dataset):
+        return self.load(dataset)  # one file: nothing to defer
+
+    def log_run(self, dataset, total, updated, failed, started_at=None):
+        pass  # the JSON backend's run log is status_report.md
+
+    def export(self, dataset, path=None):
+        path = path or self.paths[dataset]
+        if os.path.abspath(path) != os.path.abspath(self.paths[dataset]):
+            write_json_atomic(path, self.load(dataset), indent=2)
+        return path
+
+
+class SqliteStore:
+    """Records, sections, PDF hashes and runs in one SQLite file."""
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("RECORD_DB", DEFAULT_DB)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def load(self, dataset):
+        with self._lock:
+            if not self._db.execute("SELECT 1 FROM datasets WHERE dataset = ?",
+                                    (dataset,)).fetchone():
+                raise FileNotFoundError(f"{dataset}: not in {self.path}")
+            rows = self._db.execute(
+                "SELECT data FROM records WHERE dataset = ? ORDER BY position", (dataset,))
+            return [json.loads(data) for (data,) in rows]
+
+    def load_lazy(self, dataset):
+        return self.load(dataset)
+
+    def get(self, dataset, name):
+        """One record by name, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT data FROM records WHERE dataset = ? AND name = ?",
+                                   (dataset, name)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def updated_since(self, dataset, date):
+        """Records whose last_pdf_update >= date ("YYYY-MM-DD"), newest first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM records WHERE dataset = ? AND last_pdf_update >= ? "
+                "ORDER BY last_pdf_update DESC, position", (dataset, date))
+            return [json.loads(data) for (data,) in rows]
+
+    def save(self, dataset, records):
+        fields = section_fields(dataset)
+        now = datetime.now().strftime("%Y-%m-%d %H:%M")
+        with self._lock, self._db:
+            stored = dict(self._db.execute(
+                "SELECT name, data FROM records WHERE dataset = ?", (dataset,)))
+            seen = set()
+            changed = 0
+            for position, record in enumerate(records):
+                name = record["name"]
+                seen.add(name)
+                data = json.dumps(record, ensure_ascii=False)
+                if stored.get(name) == data:
+                    self._db.execute("UPDATE records SET position = ? WHERE dataset = ? AND name = ?",
+                                     (position, dataset, name))
+                    continue
+                changed += 1
+                self._db.execute(
+                    "INSERT OR REPLACE INTO records (dataset, name, position, pdf_hash, "
+                    "parser_version, last_pdf_update, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (dataset, name, position, record.get("pdf_hash"),
+                     record.get("parser_version"), record.get("last_pdf_update"), data))
+                self._db.execute("DELETE FROM sections WHERE dataset = ? AND name = ?",
+                                 (dataset, name))
+                self._db.executemany(
+                    "INSERT INTO sections (dataset, name, section, text) VALUES (?, ?, ?, ?)",
+                    [(dataset, name, k, record[k]) for k in fields if record.get(k)])
+                if record.get("pdf_hash"):
+                    self._db.execute(
+                        "INSERT OR IGNORE INTO pdf_hashes (dataset, name, pdf_hash, first_seen) "
+                        "VALUES (?, ?, ?, ?)",
+                        (dataset, name, record["pdf_hash"], record.get("last_pdf_update")))
+            for name in set(stored) - seen:
+                self._db.execute("DELETE FROM records WHERE dataset = ? AND name = ?", (dataset, name))
+                self._db.execute("DELETE FROM sections WHERE dataset = ? AND name = ?", (dataset, name))
+            self._db.execute("INSERT OR REPLACE INTO datasets (dataset, saved_at) VALUES (?, ?)",
+                             (dataset, now))
+        logger.info("Record store: %s saved, %d of %d records written, %d removed.",
+                    dataset, changed, len(records), len(set(stored) - seen))
+        return changed
+
+    def log_run(self, dataset, total, updated, failed, started_at=None):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO runs (dataset, started_at, finished_at, total, updated, failed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (dataset, started_at, datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                 total, updated, failed))
+
+    def export(self, dataset, path=None):
+        path = path or DATASETS[dataset]
+        write_json_atomic(path, self.load(dataset), indent=2)
+        return path
+
+    def stats(self):
+        with self._lock:
+            return {
+                "records": dict(self._db.execute(
+                    "SELECT dataset, COUNT(*) FROM records GROUP BY dataset")),
+                "sections": self._db.execute("SELECT COUNT(*) FROM sections").fetchone()[0],
+                "pdf_hashes": self._db.execute("SELECT COUNT(*) FROM pdf_hashes").fetchone()[0],
+                "runs": self._db.execute("SELECT COUNT(*) FROM runs").fetchone()[0],
+            }
+
+
+class LazyRecord(Mapping):
+    """A read-only record whose shard is only read when a non-summary key is."""
+
+    def __init__(self, entry, path):
+        self._summary = {k: entry[k] for k in SUMMARY_FIELDS if k in entry}
+        self._filled = frozenset(entry.get("filled", ()))
+        self._path = path
+        self._record = None
+
+    @property
+    def loaded(self):
+        return self._record is not None
+
+    def has(self, key):
+        return key in self._filled
+
+    def _full(self):
+        if self._record is None:
+            with open(self._path, "r", encoding="utf-8") as f:
+                self._record = json.load(f)
+        return self._record
+
+    def __getitem__(self, key):
+        if key in self._summary:
+            return self._summary[key]
+        if key in SUMMARY_FIELDS:
+            raise KeyError(key)  # the index has every summary field the record has
+        return self._full()[key]
+
+    def __iter__(self):
+        return iter(self._full())
+
+    def __len__(self):
+        return len(self._full())
+
+    def __repr__(self):
+        return f"LazyRecord({self._summary.get('name')!r})"
+
+
+class ShardStore:
+    """One JSON file per record under root/<dataset>/, plus an ordered index.json."""
+
+    def __init__(self, root=None):
+        self.root = root or os.environ.get("SHARD_DIR", DEFAULT_SHARD_DIR)
+        self._lock = threading.Lock()
+
+    def index_path(self, dataset):
+        return os.path.join(self.root, dataset, "index.json")
+
+    def _index(self, dataset):
+        with open(self.index_path(dataset), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _shard(self, dataset, filename):
+        return os.path.join(self.root, dataset, filename)
+
+    def load(self, dataset):
+        return [dict(r) for r in self.load_lazy(dataset)]
+
+    def load_lazy(self, dataset):
+        with self._lock:
+            return [LazyRecord(e, self._shard(dataset, e["file"])) for e in self._index(dataset)]
+
+    def get(self, dataset, name):
+        """One record by name, or None."""
+        with self._lock:
+            try:
+                entry = next((e for e in self._index(dataset) if e["name"] == name), None)
+            except FileNotFoundError:
+                return None
+        return dict(LazyRecord(entry, self._shard(dataset, entry["file"]))) if entry else None
+
+    @staticmethod
+    def _filename(name, taken):
+        from cdc_common import safe_filename  # lazily: cdc_common pulls in requests
+        stem = safe_filename(name).strip() or "_"
+        filename, n = f"{stem}.json", 2
+        while filename in taken or filename == "index.json":
+            filename, n = f"{stem}-{n}.json", n + 1
+        return filename
+
+    def save(self, dataset, records):
+        with self._lock:
+            os.makedirs(os.path.join(self.root, dataset), exist_ok=True)
+            try:
+                stored = {e["name"]: e for e in self._index(dataset)}
+            except FileNotFoundError:
+                stored = {}
+            taken = {e["file"] for e in stored.values()}
+            index, changed = [], 0
+            for record in records:
+                name = record["name"]
+                old = stored.get(name)
+                data = json.dumps(record, ensure_ascii=False, indent=2)
+                sha = hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+                if old:
+                    filename = old["file"]
+                else:
+                    filename = self._filename(name, taken)
+                    taken.add(filename)
+                path = self._shard(dataset, filename)
+                if not old or old.get("sha") != sha or not os.path.exists(path):
+                    changed += 1
+                    write_json_atomic(path, record, indent=2)
+                entry = {"name": name, "file": filename, "sha": sha,
+                         "filled": [k for k, v in record.items() if _filled(v)]}
+                entry.update((k, record[k]) for k in SUMMARY_FIELDS[1:] if k in record)
+                index.append(entry)
+            kept = {e["name"] for e in index}
+            removed = [e for name, e in stored.items() if name not in kept]
+            write_json_atomic(self.index_path(dataset), index, indent=1)
+            for entry in removed:
+                path = self._shard(dataset, entry["file"])
+                if os.path.exists(path):
+                    os.remove(path)
+        logger.info("Record store: %s saved, %d of %d shards written, %d removed.",
+                    dataset, changed, len(records), len(removed))
+        return changed
+
+    def log_run(self, dataset, total, updated, failed, started_at=None):
+        pass  # as for JsonStore: status_report.md is the run log
+
+    def export(self, dataset, path=None):
+        path = path or DATASETS[dataset]
+        write_json_atomic(path, self.load(dataset), indent=2)
+        return path
+
+    def stats(self):
+        records, files, size = {}, 0, 0
+        for dataset in DATASETS:
+            try:
+                index = self._index(dataset)
+            except FileNotFoundError:
+                continue
+            records[dataset] = len(index)
+            for e in index:
+                path = self._shard(dataset, e["file"])
+                if os.path.exists(path):
+                    files += 1
+                    size += os.path.getsize(path)
+        return {"records": records, "shards": files, "bytes": size}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide store: RECORD_STORE=sqlite / shards, else JsonStore."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = os.environ.get("RECORD_STORE", "json").lower()
+            if backend == "sqlite":
+                _store = SqliteStore()
+            elif backend == "shards":
+                _store = ShardStore()
+            else:
+                _store = JsonStore()
+    return _store
+
+
+def main(argv=None):
+    from cdc_common import setup_logging
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Move the scraped records between JSON and SQLite / shards.")
+    parser.add_argument("--backend", choices=("sqlite", "shards"), default="sqlite")
+    parser.add_argument("--db", default=None, help="SQLite file (default: RECORD_DB or %s)" % DEFAULT_DB)
+    parser.add_argument("--shard-dir", default=None,
+                        help="shard directory (default: SHARD_DIR or %s)" % DEFAULT_SHARD_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("import", help="load diseases.json / disease_manuals.json into the database")
+    sub.add_parser("export", help="write diseases.json / disease_manuals.json from the database")
+    sub.add_parser("stats", help="row counts")
+    args = parser.parse_args(argv)
+
+    db = SqliteStore(args.db) if args.backend == "sqlite" else ShardStore(args.shard_dir)
+    try:
+        if args.command == "import":
+            files = JsonStore()
+            for dataset in DATASETS:
+                try:
+                    db.save(dataset, files.load(dataset))
+                except FileNotFoundError:
+                    logger.warning("%s not found; skipped.", DATASETS[dataset])
+        elif args.command == "export":
+            for dataset in DATASETS:
+                try:
+                    logger.info("Exported %s.", db.export(dataset))
+                except FileNotFoundError:
+                    logger.warning("%s: not in the database; skipped.", dataset)
+        else:
+            print(json.dumps(db.stats(), ensure_ascii=False, indent=2))
+    finally:
+        if args.backend == "sqlite":
+            db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,30 @@
 """
 scraper.py - Main script to fetch and parse Taiwan CDC notifiable disease definitions.
 """
+import re
 import json
-import time
-import difflib
 import html
 import logging
 
 from pdf_fetcher import fetch_disease_links, get_actual_pdf_url, download_and_extract_pdf
-from data_parser import build_record
-from cdc_common import write_csv, setup_logging
+from data_parser import build_record, is_stale, PARSER_VERSION
+from cdc_common import (
+    write_csv, setup_logging, get_text_cache, get_validator_store,
+    get_limiter, get_breaker,
+)
+from extraction_pool import ExtractionExecutor
+from text_diff import compact_diff
+from link_cache import ResolutionCache
+from journal import RunJournal, journal_path
+from record_store import get_store, section_fields
+from section_history import SectionHistory
+from fetch_pipeline import Stage, run_pipeline, configured_workers
 
 logger = logging.getLogger(__name__)
 
+# Viewer page -> PDF URL answers, kept next to diseases.json (link_cache.py).
+LINK_CACHE_PATH = "pdf_url_cache.json"
+
 
 def _keep_previous(results, record, old_disease):
     """
@@ -26,34 +38,158 @@ def _keep_previous(results, record, old_disease):
         return True
     return False
 
-def diff_texts(old_text, new_text):
+def _fetch_stages(workers, extractor, links):
+    """
+    The resolve -> download -> extract stages for one case-definition job.
+    Extraction is handed to the extractor's process pool, so the extract stage
+    gets one thread per pool worker to keep them all busy. Viewer pages are
+    only fetched when the link cache has no fresh answer for them.
+
+    Each job starts as {'disease', 'record', 'expected_hash'} (record: the
+    previous diseases.json entry, if any) and picks up actual_pdf_url /
+    pdf_path / current_hash / content on the way. Jobs whose viewer page has no
+    PDF link or whose download failed are marked done early, and so are those
+    whose record is still current (same hash, same parser_version): only those
+    never reach pdfplumber.
+    """
+    def resolve(job):
+        disease = job['disease']
+        job['actual_pdf_url'], job['link_cached'] = links.resolve(
+            disease['name'], disease['url'], get_actual_pdf_url)
+        if not job['actual_pdf_url']:
+            job['done'] = True
+
+    def download(job):
+        disease = job['disease']
+        _, pdf_path, current_hash = download_and_extract_pdf(
+            job['actual_pdf_url'], disease['name'], job['expected_hash'], extract=False)
+        if current_hash is None and job['link_cached']:
+            # The remembered PDF URL may have gone stale: re-resolve and retry once.
+            links.invalidate(disease['url'])
+            job['actual_pdf_url'], job['link_cached'] = links.resolve(
+                disease['name'], disease['url'], get_actual_pdf_url)
+            if job['actual_pdf_url']:
+                _, pdf_path, current_hash = download_and_extract_pdf(
+                    job['actual_pdf_url'], disease['name'], job['expected_hash'], extract=False)
+        job['pdf_path'] = pdf_path
+        job['current_hash'] = current_hash
+        if current_hash is None or not is_stale(job['record'], current_hash):
+            job['done'] = True
+
+    def extract(job):
+        try:
+            job['content'] = extractor.extract(job['pdf_path'], job['current_hash'])
+        except Exception as e:
+            logger.warning("Error extracting %s: %s", job['pdf_path'], e)
+            if job['current_hash'] != job['expected_hash']:
+                job['pdf_path'] = job['current_hash'] = None
+            # else: only a re-parse failed; the old record stays as it is.
+
+    return [
+        Stage("resolve", resolve, workers),
+        Stage("download", download, workers),
+        Stage("extract", extract, extractor.workers),
+    ]
+
+
+# The only markup a diff may contain. dashboard_common.SECURITY_JS renders the
+# stored compact diffs with these exact strings and allow-lists them in legacy
+# HTML diffs, so keep both sides identical.
+DIFF_DEL = '<del style="color: #9ca3af;">'
+DIFF_INS = '<b style="color: #ea580c; background: #ffedd5;">'
+_LEGACY_DIFF_TAGS = re.compile(
+    '(' + '|'.join(re.escape(t) for t in (DIFF_DEL, '</del>', DIFF_INS, '</b>')) + ')')
+
+
+def diff_length(ops):
+    """How many characters of the new text a compact diff walks through."""
+    return sum(op if isinstance(op, int) else (op[1] if op[0] == "+" else 0) for op in ops)
+
+
+def render_diff(new_text, ops):
+    """
+    HTML for a compact diff (text_diff.compact_diff) against new_text -- the
+    Python twin of renderDiff() in dashboard_common.SECURITY_JS.
+    """
     # The text comes from PDFs (untrusted) and is rendered via innerHTML in the
     # dashboards, so every text segment is HTML-escaped here. Only the diff
-    # wrapper tags below are real markup.
-    if not old_text:
-        return html.escape(new_text or "")
-    if not new_text:
-        return ""
-
-    matcher = difflib.SequenceMatcher(None, old_text, new_text)
+    # wrapper tags are real markup.
+    if diff_length(ops) != len(new_text):
+        # Made against some other text: plain text beats marking wrong spans.
+        return html.escape(new_text)
     result = []
-    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-        if tag == 'equal':
-            result.append(html.escape(new_text[j1:j2]))
-        elif tag == 'insert' or tag == 'replace':
-            if tag == 'replace':
-                result.append(f'<del style="color: #9ca3af;">{html.escape(old_text[i1:i2])}</del>')
-            result.append(f'<b style="color: #ea580c; background: #ffedd5;">{html.escape(new_text[j1:j2])}</b>')
-        elif tag == 'delete':
-            result.append(f'<del style="color: #9ca3af;">{html.escape(old_text[i1:i2])}</del>')
+    pos = 0
+    for op in ops:
+        if isinstance(op, int):
+            result.append(html.escape(new_text[pos:pos + op]))
+            pos += op
+        elif op[0] == "+":
+            result.append(f'{DIFF_INS}{html.escape(new_text[pos:pos + op[1]])}</b>')
+            pos += op[1]
+        else:
+            result.append(f'{DIFF_DEL}{html.escape(op[1])}</del>')
     return "".join(result)
 
 
-def main():
+def diff_texts(old_text, new_text):
+    """The old-vs-new diff of a section as (escaped) HTML."""
+    return render_diff(new_text or "", compact_diff(old_text or "", new_text or ""))
+
+
+def diff_from_html(diff_html):
+    """
+    Compact ops for a legacy HTML *_diff string, as written by diff_texts()
+    before records stored compact diffs.
+    """
+    ops = []
+    mode = None
+    for part in _LEGACY_DIFF_TAGS.split(diff_html):
+        if part == DIFF_DEL or part == DIFF_INS:
+            mode = part
+        elif part in ('</del>', '</b>'):
+            mode = None
+        elif part:
+            text = html.unescape(part)
+            if mode == DIFF_DEL:
+                ops.append(["-", text])
+            elif mode == DIFF_INS:
+                ops.append(["+", len(text)])
+            elif ops and isinstance(ops[-1], int):
+                ops[-1] += len(text)
+            else:
+                ops.append(len(text))
+    return ops
+
+
+def upgrade_diffs(record):
+    """
+    Convert a record's legacy HTML *_diff strings to compact ops in place and
+    return the record. A diff that doesn't replay to the record's current text
+    (it was computed against something else) is left as it is -- renderDiff()
+    still shows it.
+    """
+    for k, v in list(record.items()):
+        if not (k.endswith("_diff") and isinstance(v, str)):
+            continue
+        ops = diff_from_html(v)
+        text = record.get(k[:-len("_diff")]) or ""
+        kept = diff_length(ops)
+        # Compared unescaped: diffs from before diff_texts() escaped its
+        # segments hold raw "<" / "&" that the re-rendered HTML escapes.
+        if kept == len(text) and html.unescape(render_diff(text, ops)) == html.unescape(v):
+            record[k] = ops
+    return record
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Scrape the CDC case definitions into diseases.json.")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run from its journal")
+    args = parser.parse_args(argv)
     setup_logging()
     try:
-        with open("diseases.json", "r", encoding="utf-8") as f:
-            existing_data = {d['name']: d for d in json.load(f)}
+        existing_data = {d['name']: upgrade_diffs(d) for d in get_store().load("cases")}
     except FileNotFoundError:
         existing_data = {}
 
@@ -69,88 +205,137 @@ def main():
     from datetime import datetime
     now_date_str = datetime.now().strftime("%Y-%m-%d")
     
-    for i, disease in enumerate(links):
-        logger.info("[%d/%d] Processing %s (%s)...", i + 1, len(links), disease['name'], disease.get('source_category', 'N/A'))
+    # Every finished disease is appended to the journal (journal.py); with
+    # --resume the ones an interrupted run already finished are skipped.
+    journal = RunJournal(journal_path("diseases.json"), resume=args.resume)
+    jobs = [
+        {'disease': d, 'record': existing_data.get(d['name']),
+         'expected_hash': (existing_data.get(d['name']) or {}).get('pdf_hash')}
+        for d in links if d['name'] not in journal
+    ]
+    with ExtractionExecutor() as extractor:
+        link_cache = ResolutionCache(LINK_CACHE_PATH)
+        stages = _fetch_stages(configured_workers(), extractor, link_cache)
+
+        # Fetching runs concurrently; jobs come back in link order, so everything
+        # below (results, diffs, status report) is as deterministic as before.
+        tracked = journal.track(run_pipeline(jobs, stages), lambda job: job['disease']['name'],
+                                results, status_records, updated_diseases)
+        for i, job in enumerate(tracked):
+            disease = job['disease']
+            logger.info("[%d/%d] Processing %s (%s)...", i + 1, len(jobs), disease['name'], disease.get('source_category', 'N/A'))
         
-        record = {'name': disease['name'], 'category': disease.get('source_category', 'N/A'), 'status': 'Fail', 'issues': [], 'updated_now': False}
+            record = {'name': disease['name'], 'category': disease.get('source_category', 'N/A'), 'status': 'Fail', 'issues': [], 'updated_now': False}
 
-        old_disease = existing_data.get(disease['name'])
-        actual_pdf_url = get_actual_pdf_url(disease['url'])
+            old_disease = existing_data.get(disease['name'])
+            actual_pdf_url = job.get('actual_pdf_url')
 
-        if not actual_pdf_url:
-            logger.warning("Failed to get PDF URL for %s", disease['name'])
-            record['issues'].append("No PDF Link")
-            _keep_previous(results, record, old_disease)
-            status_records.append(record)
-            continue
+            if not actual_pdf_url:
+                logger.warning("Failed to get PDF URL for %s", disease['name'])
+                record['issues'].append("No PDF Link")
+                _keep_previous(results, record, old_disease)
+                status_records.append(record)
+                continue
 
-        disease['actual_pdf_url'] = actual_pdf_url
+            disease['actual_pdf_url'] = actual_pdf_url
 
-        # Check cache via Hash
-        expected_hash = old_disease.get('pdf_hash') if old_disease else None
-        
-        content, pdf_path, current_hash = download_and_extract_pdf(actual_pdf_url, disease['name'], expected_hash)
+            # Check cache via Hash
+            expected_hash = job['expected_hash']
+            content, pdf_path, current_hash = job.get('content'), job.get('pdf_path'), job.get('current_hash')
         
-        if not content and current_hash and current_hash == expected_hash:
-            # Hash matched perfectly, no need to parse or update
-            logger.info("  Unchanged (hash matched); skipping extraction.")
-            old_disease['source_category'] = disease.get('source_category', old_disease.get('source_category'))
-            # Update the URL just in case CDC changed the URL but kept the same precise file byte-for-byte
-            old_disease['actual_pdf_url'] = actual_pdf_url
-            if 'last_pdf_update' not in old_disease:
-                old_disease['last_pdf_update'] = now_date_str
-            results.append(old_disease)
-            record['status'] = 'Success'
-            status_records.append(record)
-            continue
+            if content is None and current_hash and current_hash == expected_hash:
+                # Hash matched perfectly, no need to parse or update
+                logger.info("  Unchanged (hash matched); skipping extraction.")
+                old_disease['source_category'] = disease.get('source_category', old_disease.get('source_category'))
+                # Update the URL just in case CDC changed the URL but kept the same precise file byte-for-byte
+                old_disease['actual_pdf_url'] = actual_pdf_url
+                if 'last_pdf_update' not in old_disease:
+                    old_disease['last_pdf_update'] = now_date_str
+                results.append(old_disease)
+                record['status'] = 'Success'
+                status_records.append(record)
+                continue
+
+            if content is not None and current_hash == expected_hash and old_disease:
+                # Same PDF, older parser_version: rebuild the parsed fields only.
+                # Not a content update, so no new diffs and last_pdf_update
+                # stays; the old diffs no longer line up with the text and go.
+                logger.info("  Re-parsing (parser v%s -> v%d).",
+                            old_disease.get('parser_version'), PARSER_VERSION)
+                old_disease['source_category'] = disease.get('source_category', old_disease.get('source_category'))
+                old_disease['actual_pdf_url'] = actual_pdf_url
+                old_disease['content'] = content
+                old_disease['pdf_path'] = pdf_path
+                old_disease.update(build_record(content))
+                # The diffs are run lengths into the previous parse's text.
+                for k in [k for k in old_disease if k.endswith('_diff')]:
+                    del old_disease[k]
+                old_disease['parser_version'] = PARSER_VERSION
+                if 'last_pdf_update' not in old_disease:
+                    old_disease['last_pdf_update'] = now_date_str
+                results.append(old_disease)
+                record['status'] = 'Success'
+                status_records.append(record)
+                continue
             
-        if content is None and current_hash is None:
-            logger.warning("Failed to extract content for %s", disease['name'])
-            record['issues'].append("Download/Extract Failed")
-            _keep_previous(results, record, old_disease)
-            status_records.append(record)
-            continue
+            if content is None and current_hash is None:
+                logger.warning("Failed to extract content for %s", disease['name'])
+                record['issues'].append("Download/Extract Failed")
+                _keep_previous(results, record, old_disease)
+                status_records.append(record)
+                continue
             
-        # If we reach here, the Hash is different, it's either new or honestly updated
-        logger.info("  Update detected: %s (hash %s)", disease['name'], current_hash[:6])
+            # If we reach here, the Hash is different, it's either new or honestly updated
+            logger.info("  Update detected: %s (hash %s)", disease['name'], current_hash[:6])
         
-        disease['pdf_hash'] = current_hash
-        disease['last_pdf_update'] = now_date_str
-        if old_disease:
-            updated_diseases.append(disease['name'])
-            record['updated_now'] = True
+            disease['pdf_hash'] = current_hash
+            disease['last_pdf_update'] = now_date_str
+            if old_disease:
+                updated_diseases.append(disease['name'])
+                record['updated_now'] = True
         
-        disease['content'] = content
-        disease['pdf_path'] = pdf_path
-        structured_fields = build_record(content)  # sections + case defs + english_name
-        disease.update(structured_fields)
+            disease['content'] = content
+            disease['pdf_path'] = pdf_path
+            structured_fields = build_record(content)  # sections + case defs + english_name
+            disease.update(structured_fields)
+            disease['parser_version'] = PARSER_VERSION
         
-        # Compute diffs if updated
-        if record.get('updated_now') and old_disease:
-            for k in ["臨床條件", "檢驗條件", "流行病學條件", "通報定義", "疾病分類", "檢體採檢送驗事項", "suspected_case", "probable_case", "confirmed_case"]:
-                val_old = old_disease.get(k, "")
-                val_new = disease.get(k, "")
-                if val_old != val_new:
-                    disease[k + "_diff"] = diff_texts(val_old, val_new)
+            # Compute diffs if updated
+            if record.get('updated_now') and old_disease:
+                for k in ["臨床條件", "檢驗條件", "流行病學條件", "通報定義", "疾病分類", "檢體採檢送驗事項", "suspected_case", "probable_case", "confirmed_case"]:
+                    val_old = old_disease.get(k, "")
+                    val_new = disease.get(k, "")
+                    if val_old != val_new:
+                        disease[k + "_diff"] = compact_diff(val_old, val_new)
         
-        results.append(disease)
+            results.append(disease)
         
-        record['status'] = 'Success'
-        for k in ["臨床條件", "檢驗條件", "流行病學條件", "通報定義", "疾病分類"]:
-            val = disease.get(k)
-            if not val or not val.strip():
-                 record['issues'].append(f"Missing {k}")
-        
-        status_records.append(record)
-        
-        time.sleep(0.5)
+            record['status'] = 'Success'
+            for k in ["臨床條件", "檢驗條件", "流行病學條件", "通報定義", "疾病分類"]:
+                val = disease.get(k)
+                if not val or not val.strip():
+                     record['issues'].append(f"Missing {k}")
         
-        if (i+1) % 10 == 0:
-             with open("diseases.json", "w", encoding="utf-8") as f:
-                json.dump(results, f, ensure_ascii=False, indent=2)
+            status_records.append(record)
+
+    link_cache.save()
+    if get_text_cache() is not None:
+        get_text_cache().evict()
+    if get_validator_store() is not None:
+        get_validator_store().save()
+        logger.info(get_validator_store().summary())
+    logger.info(get_limiter().summary())
+    if get_breaker().trips:
+        logger.warning("Circuit breaker opened %d time(s) during this run.", get_breaker().trips)
 
-    with open("diseases.json", "w", encoding="utf-8") as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    # The journal holds this run's and any resumed run's documents; rebuild
+    # the outputs from it in link order and store them in one go.
+    results, status_records, updated_diseases = journal.collect([d['name'] for d in links], 3)
+    SectionHistory.open("cases").record_all(results, section_fields("cases"), now_date_str)
+    get_store().save("cases", results)
+    journal.finish()
+    get_store().log_run("cases", total=len(links), updated=len(updated_diseases),
+                        failed=sum(1 for r in status_records if r['status'] != 'Success'))
     
     cols = ["name", "url", "source_category", "pdf_path", "臨床條件", "檢驗條件", "流行病學條件", "通報定義", "疾病分類", "檢體採檢送驗事項"]
     write_csv("diseases.csv", results, columns=cols)
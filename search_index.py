@@ -0,0 +1,330 @@
+"""
+search_index.py - Build-time inverted index for the dashboards' search box.
+
+Both dashboards used to answer every keystroke by lower-casing and scanning
+every searchable field of every record (`includes()` over ~1.5 MB of manual
+text). build_dashboard.py / build_manuals_dashboard.py now also write an
+inverted index next to the page (search/cases.json, search/manuals.json):
+
+    {"version": 1, "docs": 73, "fields": ["name", "english_name", "content"],
+     "terms": {"登革": [0, 5, 12, ...], "dengue": [1, ...], ...}}
+
+Terms are lowercase ASCII words ([a-z0-9]+) and, for runs of CJK characters,
+overlapping character bigrams (a lone CJK character is indexed by itself).
+A posting is doc * len(fields) + field, ascending, where doc is the record's
+position in the page's embedded DATA, so one list says which fields of which
+records contain the term.
+
+The page's searchRecords() (SEARCH_JS) splits the query the same way,
+intersects the posting lists of its terms (an ASCII word or a single CJK
+character matches every indexed term containing it, which keeps the old
+substring semantics), then confirms the remaining candidate fields with one
+indexOf pass that also yields the hit offsets used for highlighting.
+Queries wait until the index has loaded or failed to; if it can't be loaded
+(e.g. the page opened from file://), or for a query with no indexable terms,
+it falls back to the old scan -- over what the page embeds, so a slim
+record's unloaded sections are only searched through their previews.
+
+The search runs in a Web Worker the page starts from a Blob of
+SEARCH_WORKER_JS, holding its own copy of DATA: the page posts each query and
+gets back only the ids of the hit records (offsets are found for the rows
+actually marked), and a query overtaken by a newer one is dropped both in the
+worker's queue and on the page. The worker also computes the tables' name
+orders (Intl.Collator, once). Where a worker can't start, the same code runs
+on the page.
+"""
+import os
+import re
+import json
+import logging
+
+from dashboard_common import embed_json
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+SEARCH_DIR = "search"
+# Keep in sync with SEARCH_TOKEN_RE in SEARCH_JS.
+_CJK = "㐀-䶿一-鿿豈-﫿"
+TOKEN_RE = re.compile(f"[a-z0-9]+|[{_CJK}]+")
+
+
+def terms(text):
+    """Index terms of text: lowercase ASCII words and CJK bigrams (see the module docstring)."""
+    for m in TOKEN_RE.finditer(text.lower()):
+        token = m.group()
+        if token.isascii() or len(token) == 1:
+            yield token
+        else:
+            for i in range(len(token) - 1):
+                yield token[i:i + 2]
+
+
+def build_index(records, fields):
+    """The index (a JSON-serialisable dict) of fields over records, in their order."""
+    n = len(fields)
+    postings = {}
+    for doc, record in enumerate(records):
+        for f, field in enumerate(fields):
+            value = record.get(field)
+            if not isinstance(value, str) or not value:
+                continue
+            posting = doc * n + f
+            for term in set(terms(value)):
+                postings.setdefault(term, []).append(posting)
+    return {"version": INDEX_VERSION, "docs": len(records), "fields": list(fields),
+            "terms": {t: postings[t] for t in sorted(postings)}}
+
+
+def write_index(name, records, fields, out_dir=SEARCH_DIR):
+    """Write out_dir/<name>.json and return its path."""
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"{name}.json")
+    index = build_index(records, fields)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+    logger.info("Wrote search index %s (%d terms).", path, len(index["terms"]))
+    return path
+
+
+# The search itself, shared by the page (SEARCH_JS) and the search worker
+# (SEARCH_WORKER_JS), each over its own DATA. loadSearchIndex(url, fields) is
+# called once; searchRecords(query) returns null for an empty query, else a
+# Map of DATA position -> {field: [offsets of the query in the lowercased
+# field]}. Its .pending holds the index's candidates whose fields aren't
+# loaded yet (lazy details): they count as hits until loadDetails() brings
+# them in and the search runs again. Without the index a search scans only
+# what the page embeds (previews included) -- marking every slim record
+# pending would fetch every details file -- and callers hold queries until
+# loadSearchIndex()'s promise (searchIndexReady) settles. hitIds() turns that into the two id lists
+# the worker sends back; sortOrders() computes each table order once.
+SEARCH_CORE_JS = r"""
+        // --- Search -------------------------------------------------------
+        // search_index.py builds an inverted index (ASCII words and CJK
+        // bigrams -> doc * fields.length + field); candidates come from
+        // intersecting posting lists and are confirmed with indexOf.
+        const SEARCH_TOKEN_RE = /[a-z0-9]+|[㐀-䶿一-鿿豈-﫿]+/g;
+        let SEARCH_FIELDS = [];
+        let searchIndex = null;
+        let searchIndexReady = null;  // settles once the index has loaded or failed to
+        const partialTerms = new Map();  // ASCII word / lone CJK char -> terms containing it
+
+        const loadSearchIndex = (url, fields) => {
+            SEARCH_FIELDS = fields;
+            return searchIndexReady = fetch(url).then(r => r.ok ? r.json() : null).then(idx => {
+                if (idx && idx.version === 1 && idx.docs === DATA.length
+                        && idx.fields.join('\n') === fields.join('\n')) {
+                    searchIndex = idx;
+                    searchIndex.keys = Object.keys(idx.terms);
+                }
+            }).catch(() => {});  // no index (e.g. file://): keep scanning
+        };
+
+        const findAll = (haystack, needle) => {
+            const out = [];
+            for (let i = haystack.indexOf(needle); i !== -1; i = haystack.indexOf(needle, i + needle.length))
+                out.push(i);
+            return out;
+        };
+
+        // One posting set per query term; every term must match.
+        const queryPostings = (q) => {
+            const groups = [];
+            for (const token of q.match(SEARCH_TOKEN_RE) || []) {
+                const ascii = /^[a-z0-9]/.test(token);
+                if (ascii || token.length === 1) {
+                    if (!partialTerms.has(token))
+                        partialTerms.set(token, searchIndex.keys.filter(k => k.includes(token)));
+                    const set = new Set();
+                    partialTerms.get(token).forEach(k => searchIndex.terms[k].forEach(p => set.add(p)));
+                    groups.push(set);
+                } else {
+                    for (let i = 0; i < token.length - 1; i++)
+                        groups.push(new Set(searchIndex.terms[token.slice(i, i + 2)] || []));
+                }
+            }
+            return groups;
+        };
+
+        const searchRecords = (query) => {
+            const q = String(query || '').toLowerCase();
+            if (!q) return null;
+            const hits = new Map();
+            hits.pending = new Set();
+            const check = (doc, field, indexed) => {
+                let value = DATA[doc][field];
+                if (value === undefined && DATA[doc].detail) {
+                    if (!indexed) {
+                        // No index to vouch for it: search the embedded preview only.
+                        value = DATA[doc].preview && DATA[doc].preview[field];
+                    } else {
+                        // Not fetched yet (DETAILS_JS): a hit until its details say otherwise.
+                        hits.pending.add(doc);
+                        if (!hits.has(doc)) hits.set(doc, {});
+                        return;
+                    }
+                }
+                if (typeof value !== 'string') return;
+                const offsets = findAll(value.toLowerCase(), q);
+                if (!offsets.length) return;
+                if (!hits.has(doc)) hits.set(doc, {});
+                hits.get(doc)[field] = offsets;
+            };
+            const groups = searchIndex ? queryPostings(q) : [];
+            if (!groups.length) {
+                DATA.forEach((d, doc) => SEARCH_FIELDS.forEach(field => check(doc, field, false)));
+                return hits;
+            }
+            groups.sort((a, b) => a.size - b.size);
+            let candidates = [...groups[0]];
+            for (const g of groups.slice(1)) {
+                if (!candidates.length) break;
+                candidates = candidates.filter(p => g.has(p));
+            }
+            const n = SEARCH_FIELDS.length;
+            candidates.sort((a, b) => a - b).forEach(p => check(Math.floor(p / n), SEARCH_FIELDS[p % n], true));
+            return hits;
+        };
+
+        const hitIds = (hits) => hits === null ? {docs: null, pending: []}
+            : {docs: [...hits.keys()], pending: [...hits.pending]};
+
+        // {label: {keys, locale}} -> {label: DATA positions ordered by each
+        // record's first non-empty key, lowercased}.
+        const sortOrders = (sorts) => {
+            const orders = {};
+            for (const [label, {keys, locale}] of Object.entries(sorts || {})) {
+                const collator = new Intl.Collator(locale);
+                const sortKey = DATA.map(d => String(keys.map(k => d[k]).find(v => v) || '').toLowerCase());
+                orders[label] = DATA.map((d, i) => i).sort((a, b) => collator.compare(sortKey[a], sortKey[b]));
+            }
+            return orders;
+        };""".lstrip("\n")
+
+# The worker's script: the search core over its own copy of DATA. Messages are
+# {type: 'init', id, data, fields, url, sorts} (answered with {id, orders}),
+# {type: 'details', doc, fields} (a lazily loaded record's other fields) and
+# {type: 'search', id, q} (answered with {id, docs, pending}, or {id,
+# cancelled: true} when a newer search arrived before it ran). Searches wait
+# for the index to settle.
+SEARCH_WORKER_JS = SEARCH_CORE_JS + r"""
+
+        // --- Worker side --------------------------------------------------
+        let DATA = [];
+        let queued = null;  // the newest search not run yet
+
+        const runQueued = () => {
+            const {id, q} = queued;
+            queued = null;
+            postMessage({id, ...hitIds(searchRecords(q))});
+        };
+
+        onmessage = ({data: msg}) => {
+            if (msg.type === 'init') {
+                DATA = msg.data;
+                postMessage({id: msg.id, orders: sortOrders(msg.sorts)});
+                loadSearchIndex(msg.url, msg.fields);
+            } else if (msg.type === 'details') {
+                Object.assign(DATA[msg.doc], msg.fields);
+                delete DATA[msg.doc].detail;
+                delete DATA[msg.doc].preview;
+            } else if (msg.type === 'search') {
+                // Searches run from a zero-delay timer (after the index has
+                // settled), so a burst of queued keystrokes only runs the last one.
+                if (queued) postMessage({id: queued.id, cancelled: true});
+                else Promise.resolve(searchIndexReady).then(() => setTimeout(runQueued, 0));
+                queued = msg;
+            }
+        };"""
+
+# Injected into each dashboard's <script> via the __SEARCH_JS__ placeholder,
+# after __SECURITY_JS__ (it uses esc()). The page keeps SEARCH_CORE_JS as a
+# fallback and runs the searches in a Web Worker started from a Blob of
+# SEARCH_WORKER_JS, so typing never blocks scrolling:
+#   startSearch(url, fields, sorts, onReady) starts the worker (or, where
+#     workers are unavailable, searches on the page), loads the index and
+#     calls onReady(orders) with sortOrders(sorts);
+#   runSearch(query, show) calls show(hits) -- at once for an empty query,
+#     else when the worker (or, without one, the settled index) answers -- unless a newer runSearch() came first:
+#     stale queries are dropped, on the page and in the worker's queue.
+#     From the worker, hits maps each hit doc to {} (the page computes
+#     offsets for the rows it marks) and .pending is kept;
+#   updateSearchRecord(doc, fields) passes a record's lazily loaded fields on.
+# markHits(text, offsets, length) escapes text and wraps the hits in <mark>.
+SEARCH_JS = SEARCH_CORE_JS + r"""
+
+        const markHits = (text, offsets, length) => {
+            const s = text == null ? '' : String(text);
+            if (!offsets || !offsets.length || !length) return esc(s);
+            let out = '', pos = 0;
+            offsets.forEach(i => {
+                out += esc(s.slice(pos, i)) + '<mark>' + esc(s.slice(i, i + length)) + '</mark>';
+                pos = i + length;
+            });
+            return out + esc(s.slice(pos));
+        };
+
+        // --- Search worker ------------------------------------------------
+        const SEARCH_WORKER_SRC = __SEARCH_WORKER_SRC__;
+        let searchWorker = null, searchSeq = 0, latestSearch = 0;
+        const searchReplies = new Map();  // request id -> {answer(reply), local() -> reply}
+
+        const askWorker = (msg, answer, local) => {
+            msg.id = ++searchSeq;
+            searchReplies.set(msg.id, {answer, local});
+            searchWorker.postMessage(msg);
+        };
+
+        const startSearch = (url, fields, sorts, onReady) => {
+            try {
+                if (typeof Worker !== 'undefined')
+                    searchWorker = new Worker(URL.createObjectURL(
+                        new Blob([SEARCH_WORKER_SRC], {type: 'text/javascript'})));
+            } catch (e) {
+                searchWorker = null;  // e.g. a CSP without blob: workers
+            }
+            if (!searchWorker) {
+                onReady(sortOrders(sorts));
+                loadSearchIndex(url, fields);
+                return;
+            }
+            SEARCH_FIELDS = fields;
+            searchWorker.onmessage = ({data: reply}) => {
+                const request = searchReplies.get(reply.id);
+                searchReplies.delete(reply.id);
+                if (request && !reply.cancelled) request.answer(reply);
+            };
+            searchWorker.onerror = (e) => {
+                // The worker didn't start: answer what it owed on the page from now on.
+                e.preventDefault();
+                searchWorker.terminate();
+                searchWorker = null;
+                const owed = [...searchReplies.values()];
+                searchReplies.clear();
+                loadSearchIndex(url, fields).then(() => owed.forEach(request => request.answer(request.local())));
+            };
+            askWorker({type: 'init', data: DATA, fields, sorts, url: new URL(url, location.href).href},
+                      reply => onReady(reply.orders), () => ({orders: sortOrders(sorts)}));
+        };
+
+        const runSearch = (query, show) => {
+            const q = String(query || '').toLowerCase();
+            const mine = ++latestSearch;
+            if (!q) return show(null);
+            if (!searchWorker) {
+                Promise.resolve(searchIndexReady).then(() => {
+                    if (mine === latestSearch) show(searchRecords(q));
+                });
+                return;
+            }
+            askWorker({type: 'search', q}, reply => {
+                if (mine !== latestSearch) return;
+                const hits = new Map(reply.docs.map(doc => [doc, {}]));
+                hits.pending = new Set(reply.pending);
+                show(hits);
+            }, () => hitIds(searchRecords(q)));
+        };
+
+        const updateSearchRecord = (doc, fields) => {
+            if (searchWorker) searchWorker.postMessage({type: 'details', doc, fields});
+        };""".replace("__SEARCH_WORKER_SRC__", embed_json(SEARCH_WORKER_JS))
@@ -0,0 +1,139 @@
+"""
+section_grammar.py - Declarative section splitting for CDC PDF text.
+
+Every CDC document type is parsed the same way: walk the lines, recognise a
+numbered header ("一、臨床條件", "（二）極可能病例：..."), collect the lines
+under it until the next one, and drop page-footer / form noise on the way.
+Only the vocabulary differs -- which headers exist (and their aliases), which
+numbering style precedes them, what may follow them on the line, which lines
+are noise. A SectionGrammar declares exactly that and compiles it ONCE into a
+single combined regex, so the one scan loop in parse() serves:
+
+  * data_parser.CASE_SECTIONS      -- 傳染病病例定義 top-level sections
+  * data_parser.CASE_DEFINITIONS   -- 可能/極可能/確定病例 inside 疾病分類
+  * manual_scraper.MANUAL_SECTIONS -- 防治工作手冊 chapters
+
+and the next CDC document type is another instance, not another copy of the
+buffer/flush loop. The shared noise filters (page footers, date stamps, the
+agency contact line, the 【密件】 case-report-form boundary) live here too.
+"""
+import re
+
+# --- numbering styles (the text before the header label) --------------------
+
+# One numeral + 、 or . : "一、", "壹、", "1."
+NUMBERED_SINGLE = r'[一二三四五六壹貳參肆伍陸0-9]\s*[、.]'
+# Any run of Chinese numerals + 、 or . : "十一、"
+NUMBERED_CHINESE = r'[一二三四五六七八九十壹貳參肆伍陸柒捌玖拾]+\s*[、.]'
+# Sub-item markers: "（一）", "(2)", "1.", "三、"
+NUMBERED_SUBITEM = r'(?:[\(（][一二三四0-9]+[\)）]|[0-9]+\.|[一二三四]\、)'
+
+# --- noise filters -----------------------------------------------------------
+
+# Page-footer / boilerplate that PDF extraction sometimes leaves inside a
+# parsed section. All are matched against a single (stripped) line so they
+# cannot eat legitimate content that merely mentions, e.g., 疾病管制署 mid-sentence.
+FOOTER_PAGE = re.compile(
+    r'^(?:\d+\s*/\s*\d+|第?\s*\d+\s*頁(?:\s*/\s*共?\s*\d+\s*頁)?|[-–—]\s*\d+\s*[-–—])$'
+)
+FOOTER_DATE = re.compile(
+    r'^\d{2,3}\s*年\s*\d{1,2}\s*月\s*\d{1,2}\s*日\s*'
+    r'(?:修訂|核定|公告|訂定|制定|增訂|修正|發布)?$'
+)
+FOOTER_AGENCY = re.compile(r'疾病管制署.*(?:FAX|傳真|電話|（0\d|\(0\d)')
+PAGE_FOOTERS = (FOOTER_PAGE, FOOTER_DATE, FOOTER_AGENCY)
+
+# Some case-definition PDFs append a blank case-report form; it starts with a
+# 【密件】 title line. Everything from there on is form noise, not a definition.
+FORM_BOUNDARY = re.compile(r'^\s*【密件】')
+
+
+def is_noise(stripped_line, patterns=PAGE_FOOTERS):
+    """True if a (stripped) line matches any of the noise patterns."""
+    return any(p.search(stripped_line) for p in patterns)
+
+
+class SectionGrammar:
+    """
+    A compiled section schema; parse(text) -> {key: section text}.
+
+    headers      -- {label: key} (or a list of labels, each its own key); several
+                    labels may share a key (aliases). Output keys keep the order
+                    they first appear in.
+    numbering    -- regex for the numbering before a label (NUMBERED_*);
+                    numbering_optional allows headers without one.
+    label_prefix -- regex allowed between numbering and label (e.g. "AFP ").
+    trailer      -- regex allowed after the label (colon, English title ...).
+    full_line    -- the header must be the whole line; otherwise the rest of
+                    the line after the header becomes the section's first line
+                    (inline content, as in "（一）可能病例：具有...").
+    skip         -- patterns for lines dropped before header matching
+                    (running page headers that could look like a header).
+    noise        -- patterns for lines dropped inside a section.
+    boundary     -- a line matching it drops the rest of the section.
+    strip_lines  -- keep section lines stripped instead of verbatim.
+
+    Lines before the first header are ignored; a repeated header starts its
+    section over. Every line is matched against one combined regex, compiled
+    when the grammar is built (labels longest first, so 極可能病例 wins over
+    可能病例).
+    """
+
+    def __init__(self, headers, numbering, numbering_optional=False, label_prefix='',
+                 trailer='', full_line=True, skip=(), noise=PAGE_FOOTERS,
+                 boundary=FORM_BOUNDARY, strip_lines=False, flags=0):
+        if not isinstance(headers, dict):
+            headers = {label: label for label in headers}
+        self.headers = dict(headers)
+        self.keys = list(dict.fromkeys(self.headers.values()))
+        self.full_line = full_line
+        self.skip = tuple(skip)
+        self.noise = tuple(noise)
+        self.boundary = boundary
+        self.strip_lines = strip_lines
+
+        labels = '|'.join(re.escape(label) for label in
+                          sorted(self.headers, key=len, reverse=True))
+        # With re.IGNORECASE the matched label may differ in case from the schema's.
+        self._fold = str.lower if flags & re.IGNORECASE else str
+        self._keys_by_label = {self._fold(label): key for label, key in self.headers.items()}
+        numbering = f'(?:{numbering})?' if numbering_optional else numbering
+        self.pattern = re.compile(
+            r'^\s*' + numbering + r'\s*' + label_prefix
+            + r'(?P<label>' + labels + r')' + trailer
+            + (r'\s*$' if full_line else ''),
+            flags,
+        )
+
+    def parse(self, text):
+        """Split text into {key: stripped section text}; missing sections are ""."""
+        match_header = self.pattern.match
+        boundary = self.boundary.match if self.boundary is not None else None
+        noise = [p.search for p in self.noise]
+        skip = [p.search for p in self.skip]
+        kept = {}
+        section = None  # the current section's line list
+        cut = False
+
+        for line in text.split('\n'):
+            stripped = line.strip()
+            if skip and any(s(stripped) for s in skip):
+                continue
+            match = match_header(stripped)
+            if match:
+                section = kept[self._keys_by_label[self._fold(match.group('label'))]] = []
+                cut = False
+                if self.full_line:
+                    continue
+                # Inline content: the rest of the header line is the first line.
+                line = stripped = stripped[match.end():].strip()
+                if not line:
+                    continue
+            if section is None or cut:
+                continue
+            if boundary and boundary(line):
+                cut = True  # form block begins here -> drop it up to the next header
+            elif not any(n(stripped) for n in noise):
+                section.append(stripped if self.strip_lines else line)
+
+        return {key: '\n'.join(kept.get(key, ())).strip() for key in self.keys}
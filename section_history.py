@@ -0,0 +1,257 @@
+"""
+section_history.py - Every version of every section, delta-compressed.
+
+The records only hold the latest text of a section plus one *_diff against
+the previous run, so a second change wipes out the first. SectionHistory
+keeps them all: one append-only JSONL file per dataset
+(diseases.history.jsonl, disease_manuals.history.jsonl), one line per
+section version, dated by the record's last_pdf_update:
+
+    {"name": "登革熱", "section": "臨床條件", "date": "2026-08-22", "v": 0, "text": "..."}
+    {"name": "登革熱", "section": "臨床條件", "date": "2026-10-01", "v": 1, "delta": [...]}
+
+A delta rebuilds version v from version v - 1; its ops are an int n (copy the
+next n characters of the previous text), a negative int -n (skip n of them)
+or a string (insert it). Every KEYFRAME_EVERY-th version is stored in full,
+so rebuilding any version applies at most that many deltas. Unchanged
+sections add nothing: scraper.main / manual_scraper.main call record_all()
+once per run and only sections whose text differs from their latest version
+get a line.
+
+    as_of(name, date)                 -> {section: text} as of that date
+    diff(name, section, date_a, date_b) -> compact diff (text_diff.compact_diff)
+
+Rebuilt texts and diffs are memoized per version (versions never change once
+written), so repeated queries are dictionary lookups.
+
+A final line with no newline that isn't valid JSON is an append torn by a
+crash: loading skips it and the next record_all() cuts it off before
+appending. Loading never rewrites the file, and any other unreadable or
+out-of-order line (e.g. from a merge that interleaved two runs' appends)
+raises ValueError rather than losing history.
+
+    python section_history.py as-of 登革熱 2026-01-01 [--manuals]
+    python section_history.py diff 登革熱 臨床條件 2025-01-01 2026-01-01
+    python section_history.py stats
+"""
+import os
+import sys
+import json
+import bisect
+import logging
+import argparse
+from datetime import datetime
+from functools import lru_cache
+
+from text_diff import diff_opcodes, compact_diff
+
+logger = logging.getLogger(__name__)
+
+HISTORY_PATHS = {"cases": "diseases.history.jsonl", "manuals": "disease_manuals.history.jsonl"}
+KEYFRAME_EVERY = 16
+
+
+def make_delta(old, new):
+    """Ops turning old into new (see the module docstring)."""
+    ops = []
+    for tag, i1, i2, j1, j2 in diff_opcodes(old, new):
+        if tag == 'equal':
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if j2 > j1:
+            ops.append(new[j1:j2])
+    return ops
+
+
+def apply_delta(old, ops):
+    out = []
+    pos = 0
+    for op in ops:
+        if isinstance(op, str):
+            out.append(op)
+        elif op >= 0:
+            out.append(old[pos:pos + op])
+            pos += op
+        else:
+            pos -= op
+    return "".join(out)
+
+
+class SectionHistory:
+    """The version chains of one dataset, loaded from (and appended to) path."""
+
+    def __init__(self, path, keyframe_every=KEYFRAME_EVERY):
+        self.path = path
+        self.keyframe_every = keyframe_every
+        self._versions = {}   # (name, section) -> [version dict, ...] in order
+        self._dates = {}      # (name, section) -> [date, ...] (for bisect)
+        self._latest = {}     # (name, section) -> latest text
+        self._sections = {}   # name -> [section, ...]
+        self._good_size = None  # bytes before a torn last line, if there is one
+        self._needs_newline = False
+        self.text_at = lru_cache(maxsize=8192)(self._rebuild)
+        self._diff = lru_cache(maxsize=4096)(self._diff_versions)
+        self._load()
+
+    @classmethod
+    def open(cls, dataset, **kwargs):
+        return cls(HISTORY_PATHS[dataset], **kwargs)
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        lines = data.split(b"\n")
+        tail = lines.pop()  # b"" when the file ends with a newline
+        if tail:
+            try:
+                json.loads(tail)
+                lines.append(tail)
+                self._needs_newline = True
+            except ValueError:
+                logger.warning("History %s: ignoring a torn last line.", self.path)
+                self._good_size = len(data) - len(tail)
+        for n, line in enumerate(lines, 1):
+            try:
+                self._add(json.loads(line))
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"{self.path}:{n}: unreadable history line ({e!r})") from e
+
+    def _add(self, version):
+        key = (version["name"], version["section"])
+        chain = self._versions.get(key, [])
+        if version["v"] != len(chain):
+            raise ValueError(f"{key}: version {version['v']} out of order")
+        if not chain:
+            self._versions[key] = chain
+            self._sections.setdefault(key[0], []).append(key[1])
+        chain.append(version)
+        self._dates.setdefault(key, []).append(version["date"])
+        self._latest[key] = (version["text"] if "text" in version
+                             else apply_delta(self._latest[key], version["delta"]))
+
+    def _rebuild(self, name, section, v):
+        chain = self._versions[(name, section)]
+        version = chain[v]
+        if "text" in version:
+            return version["text"]
+        return apply_delta(self.text_at(name, section, v - 1), version["delta"])
+
+    def _diff_versions(self, name, section, va, vb):
+        old = self.text_at(name, section, va) if va is not None else ""
+        new = self.text_at(name, section, vb) if vb is not None else ""
+        return compact_diff(old, new)
+
+    def names(self):
+        return sorted(self._sections)
+
+    def versions(self, name, section):
+        """[(v, date)] of one section."""
+        return [(v["v"], v["date"]) for v in self._versions.get((name, section), ())]
+
+    def latest(self, name, section):
+        return self._latest.get((name, section))
+
+    def version_at(self, name, section, date):
+        """Index of the section's last version dated <= date, or None."""
+        idx = bisect.bisect_right(self._dates.get((name, section), []), date)
+        return idx - 1 if idx else None
+
+    def as_of(self, name, date):
+        """{section: text} of every section of `name` that existed on `date`."""
+        out = {}
+        for section in self._sections.get(name, ()):
+            v = self.version_at(name, section, date)
+            if v is not None:
+                out[section] = self.text_at(name, section, v)
+        return out
+
+    def diff(self, name, section, date_a, date_b):
+        """Compact diff of a section from its state on date_a to date_b (memoized)."""
+        return self._diff(name, section, self.version_at(name, section, date_a),
+                          self.version_at(name, section, date_b))
+
+    def record(self, name, section, text, date):
+        """Append a version if text differs from the latest one; returns the line or None."""
+        key = (name, section)
+        latest = self._latest.get(key)
+        text = text or ""
+        if latest == text or (latest is None and not text):
+            return None
+        v = len(self._versions.get(key, ()))
+        version = {"name": name, "section": section, "date": date, "v": v}
+        if latest is None or v % self.keyframe_every == 0:
+            version["text"] = text
+        else:
+            version["delta"] = make_delta(latest, text)
+        self._add(version)
+        return version
+
+    def record_all(self, records, fields, default_date=None):
+        """Record every changed section of every record; one fsync'ed append."""
+        default_date = default_date or datetime.now().strftime("%Y-%m-%d")
+        lines = []
+        for r in records:
+            for section in fields:
+                version = self.record(r["name"], section, r.get(section),
+                                      r.get("last_pdf_update") or default_date)
+                if version is not None:
+                    lines.append(json.dumps(version, ensure_ascii=False) + "\n")
+        if lines:
+            if self._good_size is not None:
+                os.truncate(self.path, self._good_size)
+                self._good_size = None
+            if self._needs_newline:
+                lines.insert(0, "\n")
+                self._needs_newline = False
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            logger.info("Section history: %d new version(s) in %s.", len(lines), self.path)
+        return len(lines)
+
+    def stats(self):
+        chains = self._versions.values()
+        return {
+            "sections": len(self._versions),
+            "versions": sum(len(c) for c in chains),
+            "keyframes": sum(1 for c in chains for v in c if "text" in v),
+            "bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
+
+
+def main(argv=None):
+    from cdc_common import setup_logging
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Query the section version history.")
+    parser.add_argument("--manuals", action="store_true", help="use the disease manuals' history")
+    sub = parser.add_subparsers(dest="command", required=True)
+    asof = sub.add_parser("as-of", help="every section of a disease as of a date")
+    asof.add_argument("name")
+    asof.add_argument("date", help="YYYY-MM-DD")
+    d = sub.add_parser("diff", help="a section's diff between two dates")
+    d.add_argument("name")
+    d.add_argument("section")
+    d.add_argument("date_a")
+    d.add_argument("date_b")
+    sub.add_parser("stats", help="version and keyframe counts")
+    args = parser.parse_args(argv)
+
+    history = SectionHistory.open("manuals" if args.manuals else "cases")
+    if args.command == "as-of":
+        result = history.as_of(args.name, args.date)
+    elif args.command == "diff":
+        result = history.diff(args.name, args.section, args.date_a, args.date_b)
+    else:
+        result = history.stats()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+"""Tests for the bookkeeping in bench_parsers.py (not the timings themselves)."""
+import random
+
+from bench_parsers import compare, edit, measure
+
+
+def test_edit_is_seeded():
+    text = "一、臨床條件\n發燒。頭痛；\n" * 20
+    assert edit(text, random.Random(3)) == edit(text, random.Random(3))
+    assert edit(text, random.Random(3)) != text
+
+
+def test_measure_reports_ops_and_memory():
+    r = measure(lambda n: [0] * n, [1000, 2000], min_time=0.0)
+    assert r["ops"] == 2 and r["passes"] >= 5
+    assert r["ops_per_sec"] > 0
+    assert r["peak_kb"] > 0
+
+
+def test_compare_flags_slowdowns_and_memory_growth_beyond_threshold():
+    baseline = {"results": {
+        "a": {"ops_per_sec": 100.0, "peak_kb": 10.0},
+        "b": {"ops_per_sec": 100.0, "peak_kb": 10.0},
+        "c": {"ops_per_sec": 100.0, "peak_kb": 10.0},
+    }}
+    results = {
+        "a": {"ops_per_sec": 80.0, "peak_kb": 12.0},    # within 25%
+        "b": {"ops_per_sec": 70.0, "peak_kb": 10.0},    # slower
+        "c": {"ops_per_sec": 100.0, "peak_kb": 13.0},   # bigger
+        "new": {"ops_per_sec": 1.0, "peak_kb": 1.0},    # not in the baseline
+    }
+    flagged = compare(results, baseline, threshold=0.25)
+    assert [line.split(":")[0] for line in flagged] == ["b", "c"]
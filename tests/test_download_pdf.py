@@ -0,0 +1,87 @@
+"""Tests for cdc_common.download_pdf's streaming, hashing and write-if-changed."""
+import os
+import hashlib
+
+import pytest
+
+import cdc_common
+from cdc_common import download_pdf, DownloadTooLarge
+
+
+class FakeStreamResponse:
+    def __init__(self, body, headers=None, chunk=4):
+        self.body = body
+        self.headers = headers or {}
+        self.url = "https://www.cdc.gov.tw/File/Get/x"
+        self.chunk = chunk
+
+    def iter_content(self, _size):
+        for i in range(0, len(self.body), self.chunk):
+            yield self.body[i:i + self.chunk]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def serve(monkeypatch, tmp_path):
+    """serve(body, **kw) makes the next fetch() stream `body`."""
+    monkeypatch.setattr(cdc_common, "_validators",
+                        cdc_common.ValidatorStore(str(tmp_path / "http")))
+
+    def _serve(body, **kw):
+        def fake_fetch(url, timeout=20, stream=False, conditional=None):
+            assert stream is True
+            return FakeStreamResponse(body, **kw)
+        monkeypatch.setattr(cdc_common, "fetch", fake_fetch)
+    return _serve
+
+
+def test_streams_hashes_and_saves_new_pdf(tmp_path, serve):
+    body = b"%PDF-1.4 version one"
+    serve(body)
+    text, path, h = download_pdf("u", str(tmp_path / "pdfs"), "登革熱", extract=False)
+    assert text is None
+    assert h == hashlib.sha256(body).hexdigest()
+    assert open(path, "rb").read() == body
+    assert os.listdir(tmp_path / "pdfs") == ["登革熱.pdf"]      # no .part left behind
+
+
+def test_unchanged_pdf_is_not_rewritten(tmp_path, serve, monkeypatch):
+    body = b"%PDF-1.4 same bytes"
+    serve(body)
+    _, path, h = download_pdf("u", str(tmp_path / "pdfs"), "瘧疾", extract=False)
+
+    replaced = []
+    monkeypatch.setattr(cdc_common.os, "replace", lambda *a: replaced.append(a))
+    text, path2, h2 = download_pdf("u", str(tmp_path / "pdfs"), "瘧疾", expected_hash=h)
+    assert (text, path2, h2) == (None, path, h)
+    assert replaced == []                               # cached PDF untouched
+    assert os.listdir(tmp_path / "pdfs") == ["瘧疾.pdf"]
+
+
+def test_changed_pdf_replaces_cached_file(tmp_path, serve):
+    serve(b"%PDF old")
+    _, path, old_hash = download_pdf("u", str(tmp_path / "pdfs"), "A", extract=False)
+    serve(b"%PDF new content")
+    _, _, new_hash = download_pdf("u", str(tmp_path / "pdfs"), "A", expected_hash=old_hash,
+                                  extract=False)
+    assert new_hash != old_hash
+    assert open(path, "rb").read() == b"%PDF new content"
+
+
+def test_max_size_enforced_while_streaming(tmp_path, serve):
+    serve(b"x" * 100)
+    with pytest.raises(DownloadTooLarge):
+        download_pdf("u", str(tmp_path / "pdfs"), "big", max_bytes=50, extract=False)
+    assert os.listdir(tmp_path / "pdfs") == []
+
+
+def test_max_size_enforced_from_content_length(tmp_path, serve):
+    serve(b"tiny", headers={"Content-Length": "999999"})
+    with pytest.raises(DownloadTooLarge):
+        download_pdf("u", str(tmp_path / "pdfs"), "big", max_bytes=50, extract=False)
+    assert os.listdir(tmp_path / "pdfs") == []
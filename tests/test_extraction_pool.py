@@ -0,0 +1,42 @@
+"""Tests for the recycled, timeout-guarded PDF extraction process pool."""
+import os
+import time
+
+import pytest
+
+from extraction_pool import ExtractionExecutor, ExtractionTimeout
+
+
+# Worker functions must be importable top-level callables (they are pickled).
+def _worker_pid(_path):
+    return os.getpid()
+
+
+def _hang_on_bad(path):
+    if path == "bad.pdf":
+        time.sleep(60)
+    return f"text of {path}"
+
+
+def test_extract_returns_worker_result():
+    with ExtractionExecutor(workers=1, fn=_hang_on_bad, timeout=30) as ex:
+        assert ex.extract("a.pdf") == "text of a.pdf"
+
+
+def test_workers_are_recycled_after_max_tasks():
+    with ExtractionExecutor(workers=1, max_tasks_per_child=2, fn=_worker_pid,
+                            timeout=30) as ex:
+        pids = [ex.extract("x.pdf") for _ in range(4)]
+        assert ex.generation == 2
+    assert pids[0] == pids[1]
+    assert pids[2] == pids[3]
+    assert pids[0] != pids[2]      # a fresh process after 2 documents
+
+
+def test_timeout_abandons_document_and_next_one_still_works():
+    with ExtractionExecutor(workers=1, fn=_hang_on_bad, timeout=1) as ex:
+        start = time.monotonic()
+        with pytest.raises(ExtractionTimeout):
+            ex.extract("bad.pdf")
+        assert time.monotonic() - start < 10
+        assert ex.extract("good.pdf") == "text of good.pdf"
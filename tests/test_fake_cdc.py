@@ -0,0 +1,67 @@
+"""Tests for the local stand-in CDC site used by bench_scraper.py."""
+import io
+
+import pdfplumber
+import pytest
+import requests
+
+import manual_scraper
+import pdf_fetcher
+from bench_scraper import percentile
+from fake_cdc import (
+    CASE_LIST_PATH, MANUAL_LIST_PATH, Doc, FakeCDC, make_pdf, running,
+)
+
+CASES = [Doc("登革熱", "第二類", "一、臨床條件\n發燒\n"), Doc("伊波拉病毒感染", "第五類", "一、臨床條件\n出血\n")]
+MANUALS = [Doc(f"手冊{n}", "", f"一、疾病概述\n內容{n}\n") for n in range(3)]
+
+
+@pytest.fixture
+def site_url(monkeypatch):
+    monkeypatch.setenv("HTTP_CACHE", "0")  # keep the real .cache/ out of it
+    site = FakeCDC(CASES, MANUALS, page_size=2)
+    with running(site) as base_url:
+        yield site, base_url
+
+
+def test_make_pdf_roundtrips_cjk_text():
+    text = "一、臨床條件（Dengue fever）\n發燒（38°C）且伴隨頭痛"
+    with pdfplumber.open(io.BytesIO(make_pdf(text))) as pdf:
+        assert pdf.pages[0].extract_text() == text
+
+
+def test_case_listing_and_viewer_page_parse_like_cdc(site_url, monkeypatch):
+    site, base = site_url
+    monkeypatch.setattr(pdf_fetcher, "TARGET_URL", base + CASE_LIST_PATH)
+    links = pdf_fetcher.fetch_disease_links()
+    assert [(d["name"], d["source_category"]) for d in links] == [
+        ("登革熱", "第二類"), ("伊波拉病毒感染", "第五類")]
+    assert pdf_fetcher.get_actual_pdf_url(links[0]["url"]) == base + "/Uploads/case-0.pdf"
+
+
+def test_manual_listing_is_paginated(site_url):
+    site, base = site_url
+    links = manual_scraper.get_manual_links(base + MANUAL_LIST_PATH)
+    assert [l["name"] for l in links] == ["手冊0", "手冊1", "手冊2"]
+    assert manual_scraper.get_actual_pdf_link(links[2]["url"]) == base + "/Uploads/manual-2.pdf"
+
+
+def test_etag_revalidation_and_error_injection(site_url):
+    site, base = site_url
+    first = requests.get(base + "/Uploads/case-0.pdf")
+    assert first.content.startswith(b"%PDF")
+    again = requests.get(base + "/Uploads/case-0.pdf",
+                         headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert site.stats["not_modified"] == 1
+
+    site.error_rate = 1.0
+    site.error_statuses = (503,)
+    assert requests.get(base + CASE_LIST_PATH).status_code == 503
+    assert site.stats["errors"] == 1
+
+
+def test_percentile_nearest_rank():
+    assert percentile([], 95) == 0.0
+    assert percentile(list(range(1, 101)), 95) == 95
+    assert percentile([3, 1, 2], 50) == 2
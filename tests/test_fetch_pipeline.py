@@ -0,0 +1,49 @@
+"""Tests for the concurrent fetch pipeline."""
+import time
+import random
+
+from fetch_pipeline import Stage, run_pipeline
+
+
+def test_run_pipeline_yields_in_input_order_despite_concurrency():
+    def slow(job):
+        time.sleep(random.random() / 100)  # finish out of order
+        job["seen"] = job["n"] * 2
+
+    jobs = [{"n": n} for n in range(30)]
+    out = list(run_pipeline(jobs, [Stage("a", slow, 6), Stage("b", slow, 3)]))
+    assert [j["n"] for j in out] == list(range(30))
+    assert all(j["seen"] == j["n"] * 2 for j in out)
+
+
+def test_run_pipeline_done_skips_later_stages():
+    calls = []
+
+    def first(job):
+        if job["n"] == 1:
+            job["done"] = True
+
+    def second(job):
+        calls.append(job["n"])
+
+    out = list(run_pipeline([{"n": 0}, {"n": 1}, {"n": 2}],
+                            [Stage("first", first, 2), Stage("second", second, 1)]))
+    assert len(out) == 3
+    assert sorted(calls) == [0, 2]
+
+
+def test_run_pipeline_records_stage_errors_without_stopping():
+    def boom(job):
+        if job["n"] == 2:
+            raise RuntimeError("bad pdf")
+        job["ok"] = True
+
+    out = list(run_pipeline([{"n": n} for n in range(4)], [Stage("x", boom, 2)]))
+    assert "bad pdf" in out[2]["error"]
+    assert out[2]["done"] is True
+    assert all(out[n].get("ok") for n in (0, 1, 3))
+
+
+def test_run_pipeline_empty():
+    assert list(run_pipeline([], [Stage("x", lambda j: None, 2)])) == []
+
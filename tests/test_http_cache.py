@@ -0,0 +1,164 @@
+"""Tests for the conditional-request (ETag / Last-Modified) cache in cdc_common."""
+import pytest
+import requests
+
+import cdc_common
+from cdc_common import ValidatorStore, fetch, download_pdf
+
+
+def _response(status, body=b"", headers=None, url="https://www.cdc.gov.tw/x"):
+    res = requests.Response()
+    res.status_code = status
+    res._content = body
+    res.headers = requests.structures.CaseInsensitiveDict(headers or {})
+    res.url = url
+    res.raw = None
+    return res
+
+
+class FakeSession:
+    """Answers each GET from a queue of responses and records the headers sent."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.sent = []
+
+    def get(self, url, timeout=None, stream=False, headers=None):
+        self.sent.append(headers or {})
+        res = self.responses.pop(0)
+        res.iter_content = lambda size: iter([res._content])
+        res.close = lambda: None
+        return res
+
+    def head(self, url, timeout=None, allow_redirects=False):
+        self.sent.append("HEAD")
+        res = self.responses.pop(0)
+        res.close = lambda: None
+        return res
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    s = ValidatorStore(str(tmp_path / "http"))
+    monkeypatch.setattr(cdc_common, "_validators", s)
+    return s
+
+
+def test_page_304_is_served_from_cached_body(monkeypatch, store):
+    page = "<html>登革熱</html>".encode("utf-8")
+    session = FakeSession(
+        _response(200, page, {"ETag": '"v1"', "Content-Type": "text/html; charset=utf-8"}),
+        _response(304),
+    )
+    monkeypatch.setattr(cdc_common, "get_session", lambda: session)
+
+    first = fetch("https://www.cdc.gov.tw/page")
+    second = fetch("https://www.cdc.gov.tw/page")
+
+    assert session.sent[0] == {}
+    assert session.sent[1] == {"If-None-Match": '"v1"'}
+    assert second.from_cache is True
+    assert second.text == first.text == "<html>登革熱</html>"
+    assert (store.hits, store.misses, store.bytes_saved) == (1, 1, len(page))
+
+
+def test_validators_persist_across_runs(monkeypatch, store, tmp_path):
+    session = FakeSession(_response(200, b"x", {"Last-Modified": "Tue, 01 Jul 2026 00:00:00 GMT"}))
+    monkeypatch.setattr(cdc_common, "get_session", lambda: session)
+    fetch("https://www.cdc.gov.tw/list")
+    store.save()
+
+    reloaded = ValidatorStore(store.root)
+    assert reloaded.get("https://www.cdc.gov.tw/list")["last_modified"].startswith("Tue")
+
+
+def test_pdf_304_takes_unchanged_path(monkeypatch, store, tmp_path):
+    monkeypatch.setattr(cdc_common, "PROBE_MODE", "off")
+    body = b"%PDF-1.4 manual"
+    session = FakeSession(_response(200, body, {"ETag": '"p1"'}), _response(304))
+    monkeypatch.setattr(cdc_common, "get_session", lambda: session)
+    dest = str(tmp_path / "pdfs")
+
+    _, path, h = download_pdf("https://www.cdc.gov.tw/File/Get/a", dest, "A", extract=False)
+    text, path2, h2 = download_pdf("https://www.cdc.gov.tw/File/Get/a", dest, "A",
+                                   expected_hash=h)
+
+    assert session.sent[1] == {"If-None-Match": '"p1"'}
+    assert (text, path2, h2) == (None, path, h)
+    assert store.hits == 1 and store.bytes_saved == len(body)
+
+
+def test_pdf_not_revalidated_when_record_hash_differs(monkeypatch, store, tmp_path):
+    session = FakeSession(_response(200, b"%PDF a", {"ETag": '"p1"'}),
+                          _response(200, b"%PDF a", {"ETag": '"p1"'}))
+    monkeypatch.setattr(cdc_common, "get_session", lambda: session)
+    dest = str(tmp_path / "pdfs")
+    download_pdf("https://www.cdc.gov.tw/File/Get/a", dest, "A", extract=False)
+    download_pdf("https://www.cdc.gov.tw/File/Get/a", dest, "A",
+                 expected_hash="something-else", extract=False)
+    assert session.sent[1] == {}   # full download, validators not sent
+
+
+PDF_URL = "https://www.cdc.gov.tw/File/Get/a"
+LM = "Tue, 01 Jul 2026 00:00:00 GMT"
+
+
+def _first_download(monkeypatch, tmp_path, body, *later):
+    headers = {"ETag": '"p1"', "Last-Modified": LM, "Content-Length": str(len(body))}
+    session = FakeSession(_response(200, body, headers), *later)
+    monkeypatch.setattr(cdc_common, "get_session", lambda: session)
+    dest = str(tmp_path / "pdfs")
+    _, path, h = download_pdf(PDF_URL, dest, "A", extract=False)
+    return session, dest, path, h
+
+
+def test_head_probe_match_skips_download(monkeypatch, store, tmp_path):
+    body = b"%PDF-1.4 case definition"
+    session, dest, path, h = _first_download(
+        monkeypatch, tmp_path, body,
+        _response(200, headers={"ETag": '"p1"', "Last-Modified": LM,
+                                "Content-Length": str(len(body))}))
+
+    assert download_pdf(PDF_URL, dest, "A", expected_hash=h) == (None, path, h)
+    assert session.sent == [{}, "HEAD"]
+    assert (store.hits, store.probe_hits, store.bytes_saved) == (1, 1, len(body))
+
+
+def test_head_probe_mismatch_falls_back_to_download(monkeypatch, store, tmp_path):
+    body = b"%PDF-1.4 v1"
+    new = b"%PDF-1.4 version two"
+    session, dest, path, h = _first_download(
+        monkeypatch, tmp_path, body,
+        # same validators, different size: the server's ETag can't be trusted
+        _response(200, headers={"ETag": '"p1"', "Last-Modified": LM,
+                                "Content-Length": str(len(new))}),
+        _response(200, new, {"ETag": '"p2"'}))
+
+    _, _, h2 = download_pdf(PDF_URL, dest, "A", expected_hash=h, extract=False)
+    assert session.sent[1] == "HEAD"
+    assert h2 != h and store.probe_hits == 0
+    with open(path, "rb") as f:
+        assert f.read() == new
+
+
+def test_range_probe_reads_total_size_from_content_range(monkeypatch, store, tmp_path):
+    monkeypatch.setattr(cdc_common, "PROBE_MODE", "range")
+    body = b"%PDF-1.4 manual"
+    session, dest, path, h = _first_download(
+        monkeypatch, tmp_path, body,
+        _response(206, b"%", {"ETag": '"p1"', "Last-Modified": LM,
+                              "Content-Range": f"bytes 0-0/{len(body)}"}))
+
+    assert download_pdf(PDF_URL, dest, "A", expected_hash=h) == (None, path, h)
+    assert session.sent[1] == {"Range": "bytes=0-0"}
+
+
+def test_full_verify_is_forced_when_due(monkeypatch, store, tmp_path):
+    body = b"%PDF-1.4 manual"
+    session, dest, path, h = _first_download(
+        monkeypatch, tmp_path, body, _response(200, body, {"ETag": '"p1"'}))
+    monkeypatch.setattr(cdc_common, "FULL_VERIFY_DAYS", 0)
+
+    assert download_pdf(PDF_URL, dest, "A", expected_hash=h) == (None, path, h)
+    assert session.sent == [{}, {}]      # no probe, no validators: a real re-hash
+    assert store.misses == 2
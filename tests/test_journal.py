@@ -0,0 +1,105 @@
+"""Tests for the append-only run journal and the scrapers' --resume."""
+import json
+
+import pytest
+
+import manual_scraper
+from fake_cdc import MANUAL_LIST_PATH, Doc, FakeCDC, running
+from journal import RunJournal, journal_path
+
+
+def test_track_journals_what_each_finished_body_appended(tmp_path):
+    path = str(tmp_path / "out.journal.jsonl")
+    journal = RunJournal(path)
+    results, status = [], []
+    for item in journal.track(["a", "b", "c"], lambda x: x, results, status):
+        if item == "b":
+            status.append({"name": "b", "status": "Fail"})
+            continue                      # no record, but b is still done
+        results.append({"name": item})
+        status.append({"name": item, "status": "Success"})
+    journal.close()
+
+    lines = [json.loads(l) for l in open(path, encoding="utf-8")]
+    assert [l["key"] for l in lines] == ["a", "b", "c"]
+    assert lines[1]["out"] == [[], [{"name": "b", "status": "Fail"}]]
+    assert journal.collect(["c", "b", "a"], 2)[0] == [{"name": "c"}, {"name": "a"}]
+
+
+def test_a_body_that_raises_is_not_journaled(tmp_path):
+    journal = RunJournal(str(tmp_path / "j.jsonl"))
+    results = []
+    with pytest.raises(RuntimeError):
+        for item in journal.track(["a", "b"], lambda x: x, results):
+            if item == "b":
+                raise RuntimeError("crash")
+            results.append(item)
+    assert "a" in journal and "b" not in journal
+
+
+def test_resume_drops_a_torn_last_line_and_appends_cleanly(tmp_path):
+    path = str(tmp_path / "j.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"key": "a", "out": [[1]]}\n{"key": "b", "out": [[')
+    journal = RunJournal(path, resume=True)
+    assert "a" in journal and "b" not in journal
+    journal.append("b", [[2]])
+    journal.close()
+    assert RunJournal(path, resume=True).collect(["a", "b"], 1) == [[1, 2]]
+
+
+def test_without_resume_a_leftover_journal_is_discarded(tmp_path):
+    path = str(tmp_path / "j.jsonl")
+    RunJournal(path).append("a", [[1]])
+    assert "a" not in RunJournal(path)
+
+
+def test_compact_replaces_the_output_and_removes_the_journal(tmp_path):
+    out = tmp_path / "diseases.json"
+    out.write_text("[]", encoding="utf-8")
+    journal = RunJournal(journal_path(str(out)))
+    journal.append("登革熱", [[{"name": "登革熱"}]])
+    journal.compact(str(out), journal.collect(["登革熱"], 1)[0], indent=2)
+    assert json.loads(out.read_text(encoding="utf-8")) == [{"name": "登革熱"}]
+    assert not (tmp_path / "diseases.journal.jsonl").exists()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["diseases.json"]
+
+
+def test_manual_scraper_resumes_after_a_crash(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("HTTP_CACHE", "0")
+    monkeypatch.setenv("TEXT_CACHE", "0")
+    monkeypatch.setenv("EXTRACT_WORKERS", "1")
+    manuals = [Doc(f"手冊{n}", "", f"一、疾病概述\n內容{n}\n") for n in range(3)]
+    parse = manual_scraper.parse_manual_text
+    parsed = []
+
+    def crash_on_second(text):
+        if "內容1" in text:
+            raise RuntimeError("killed mid-run")
+        parsed.append(text)
+        return parse(text)
+
+    def counting(text):
+        parsed.append(text)
+        return parse(text)
+
+    with running(FakeCDC([], manuals, page_size=2)) as base:
+        links = manual_scraper.get_manual_links
+        monkeypatch.setattr(manual_scraper, "get_manual_links",
+                            lambda: links(base + MANUAL_LIST_PATH))
+        monkeypatch.setattr(manual_scraper, "parse_manual_text", crash_on_second)
+        with pytest.raises(RuntimeError):
+            manual_scraper.main([])
+        assert not (tmp_path / "disease_manuals.json").exists()
+        assert (tmp_path / "disease_manuals.journal.jsonl").exists()
+
+        parsed.clear()
+        monkeypatch.setattr(manual_scraper, "parse_manual_text", counting)
+        manual_scraper.main(["--resume"])
+
+    assert len(parsed) == 2                       # 手冊0 came from the journal
+    data = json.loads((tmp_path / "disease_manuals.json").read_text(encoding="utf-8"))
+    assert [d["name"] for d in data] == ["手冊0", "手冊1", "手冊2"]
+    assert [d["疾病概述"] for d in data] == ["內容0", "內容1", "內容2"]
+    assert not (tmp_path / "disease_manuals.journal.jsonl").exists()
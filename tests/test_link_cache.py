@@ -0,0 +1,56 @@
+"""Tests for the persistent viewer-URL -> PDF-URL resolution cache."""
+from datetime import datetime, timedelta
+
+from link_cache import ResolutionCache
+
+
+class Clock:
+    def __init__(self):
+        self.t = datetime(2026, 8, 1, 12, 0, 0)
+
+    def __call__(self):
+        return self.t
+
+
+def test_resolve_caches_and_persists(tmp_path):
+    path = str(tmp_path / "links.json")
+    calls = []
+    resolver = lambda u: calls.append(u) or "https://www.cdc.gov.tw/Uploads/a.pdf"
+
+    cache = ResolutionCache(path, ttl_days=7)
+    assert cache.resolve("登革熱", "https://v/1", resolver) == ("https://www.cdc.gov.tw/Uploads/a.pdf", False)
+    assert cache.resolve("登革熱", "https://v/1", resolver) == ("https://www.cdc.gov.tw/Uploads/a.pdf", True)
+    cache.save()
+
+    reloaded = ResolutionCache(path, ttl_days=7)
+    assert reloaded.resolve("登革熱", "https://v/1", resolver)[1] is True
+    assert calls == ["https://v/1"]            # viewer page fetched only once
+
+
+def test_entries_expire_after_ttl(tmp_path):
+    clock = Clock()
+    cache = ResolutionCache(str(tmp_path / "l.json"), ttl_days=7, now=clock)
+    cache.store("瘧疾", "https://v/2", "https://p/2.pdf")
+    clock.t += timedelta(days=8)
+    assert cache.lookup("瘧疾", "https://v/2") is None
+    assert cache.resolve("瘧疾", "https://v/2", lambda u: "https://p/2b.pdf") == ("https://p/2b.pdf", False)
+
+
+def test_changed_listing_link_drops_old_entry(tmp_path):
+    cache = ResolutionCache(str(tmp_path / "l.json"), ttl_days=7)
+    cache.store("霍亂", "https://v/old", "https://p/old.pdf")
+    assert cache.lookup("霍亂", "https://v/new") is None
+    assert cache.lookup("霍亂", "https://v/old") is None   # forgotten, not just bypassed
+
+
+def test_failures_are_not_cached(tmp_path):
+    cache = ResolutionCache(str(tmp_path / "l.json"), ttl_days=7)
+    assert cache.resolve("A", "https://v/a", lambda u: None) == (None, False)
+    assert cache.lookup("A", "https://v/a") is None
+
+
+def test_invalidate_forces_fresh_resolution(tmp_path):
+    cache = ResolutionCache(str(tmp_path / "l.json"), ttl_days=7)
+    cache.store("A", "https://v/a", "https://p/dead.pdf")
+    cache.invalidate("https://v/a")
+    assert cache.resolve("A", "https://v/a", lambda u: "https://p/live.pdf") == ("https://p/live.pdf", False)
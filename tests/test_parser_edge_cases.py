@@ -187,3 +187,50 @@ def test_build_record_english_name_empty_when_absent():
     rec = build_record("某疾病\n一、臨床條件\n發燒")
     assert rec["english_name"] == ""
     assert rec["臨床條件"] == "發燒"
+
+
+# --- single-pass parse (fused normalize / footer strip / section split) -----
+
+def _dedup_reference(text, n=4):
+    # the original character-by-character loop the regex version replaced
+    out, i = [], 0
+    while i < len(text):
+        if i + n <= len(text) and all(text[i + j] == text[i] for j in range(n)):
+            out.append(text[i])
+            i += n
+        else:
+            out.append(text[i])
+            i += 1
+    return "".join(out)
+
+
+def test_dedup_regex_matches_reference_loop():
+    import random
+    rng = random.Random(7)
+    for _ in range(500):
+        text = "".join(rng.choice("臨床\n a") * rng.randint(1, 9) for _ in range(rng.randint(0, 12)))
+        for n in (2, 4):
+            assert deduplicate_chars(text, n) == _dedup_reference(text, n)
+
+
+def test_is_normalized_agrees_with_normalize_text():
+    from data_parser import _is_normalized
+    for text in ["發燒，頭痛", "發燒, 頭痛", "（一）可能病例：", "ｱｲｳ", "臨床床床床",
+                 "a\n\n\n\nb", "Dengue Fever", "é", "é"]:
+        assert _is_normalized(text) == (normalize_text(text) == text), text
+
+
+def test_form_block_is_dropped_only_until_next_header():
+    content = "一、臨床條件\n發燒\n【密件】報告單\n院所\n二、檢驗條件\n分離病毒\n3/4"
+    sections = parse_disease_content(content)
+    assert sections["臨床條件"] == "發燒"
+    assert sections["檢驗條件"] == "分離病毒"
+
+
+def test_case_definitions_see_the_classification_renormalized():
+    # 16 repeats survive one normalization as 4 and collapse on the second,
+    # which parse_case_definitions has always applied to 疾病分類.
+    content = "五、疾病分類\n（一）可能病例：" + "發" * 16 + "燒"
+    rec = build_record(content)
+    assert rec["疾病分類"] == "（一）可能病例：發發發發燒"
+    assert rec["suspected_case"] == "發燒"
@@ -0,0 +1,118 @@
+"""Tests for the content-addressed PDF store behind download_pdf."""
+import os
+import hashlib
+
+import pytest
+
+import cdc_common
+from cdc_common import download_pdf
+from pdf_store import PdfStore, mmap_sha256, store_for
+
+
+class FakeStreamResponse:
+    def __init__(self, body):
+        self.body = body
+        self.headers = {}
+        self.url = "https://www.cdc.gov.tw/File/Get/x"
+
+    def iter_content(self, _size):
+        yield self.body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def serve(monkeypatch, tmp_path):
+    monkeypatch.setattr(cdc_common, "_validators",
+                        cdc_common.ValidatorStore(str(tmp_path / "http")))
+
+    def _serve(body):
+        monkeypatch.setattr(cdc_common, "fetch",
+                            lambda url, timeout=20, stream=False, conditional=None:
+                            FakeStreamResponse(body))
+    return _serve
+
+
+def _sha(body):
+    return hashlib.sha256(body).hexdigest()
+
+
+def test_same_pdf_under_two_names_is_stored_once(tmp_path, serve):
+    body = b"%PDF-1.4 shared"
+    serve(body)
+    _, a, h = download_pdf("u1", str(tmp_path / "pdfs"), "登革熱", extract=False)
+    _, b, _ = download_pdf("u2", str(tmp_path / "manual_pdfs"), "登革熱", extract=False)
+    blob = tmp_path / "store" / h[:2] / f"{h}.pdf"
+    assert blob.read_bytes() == body
+    assert os.path.samefile(a, blob) and os.path.samefile(b, blob)
+    assert os.stat(blob).st_nlink == 3
+    assert not [p for p in os.listdir(tmp_path / "pdfs") if not p.endswith(".pdf")]
+
+
+def test_unchanged_pdf_is_not_relinked_and_a_new_version_gets_a_new_blob(tmp_path, serve):
+    serve(b"%PDF v1")
+    _, path, h1 = download_pdf("u", str(tmp_path / "pdfs"), "瘧疾", extract=False)
+    inode = os.stat(path).st_ino
+    store = store_for(str(tmp_path / "pdfs"))
+    assert store.link(h1, path) is False
+    download_pdf("u", str(tmp_path / "pdfs"), "瘧疾", expected_hash=h1, extract=False)
+    assert os.stat(path).st_ino == inode
+
+    serve(b"%PDF v2")
+    _, path, h2 = download_pdf("u", str(tmp_path / "pdfs"), "瘧疾", expected_hash=h1, extract=False)
+    assert open(path, "rb").read() == b"%PDF v2"
+    assert set(store.blobs()) == {h1, h2}
+
+
+def test_gc_drops_unreferenced_blobs_and_orphaned_names(tmp_path, serve):
+    serve(b"%PDF old name")
+    _, old_path, old = download_pdf("u", str(tmp_path / "pdfs"), "舊名稱", extract=False)
+    serve(b"%PDF kept")
+    _, kept_path, kept = download_pdf("u", str(tmp_path / "pdfs"), "新名稱", extract=False)
+    store = store_for(str(tmp_path / "pdfs"))
+    keep = {str(tmp_path / "pdfs"): {"新名稱.pdf"}}
+
+    blobs, links = store.gc({kept}, keep, dry_run=True)
+    assert (blobs, links) == ([store.blob_path(old)], [old_path])
+    assert os.path.exists(old_path)
+    store.gc({kept}, keep)
+    assert set(store.blobs()) == {kept}
+    assert os.listdir(tmp_path / "pdfs") == ["新名稱.pdf"]
+    assert open(kept_path, "rb").read() == b"%PDF kept"
+
+
+def test_symlink_mode_and_adopting_an_existing_file(tmp_path):
+    store = PdfStore(str(tmp_path / "store"), link_mode="symlink")
+    legacy = tmp_path / "pdfs" / "霍亂.pdf"
+    legacy.parent.mkdir()
+    legacy.write_bytes(b"%PDF legacy")
+    h = _sha(b"%PDF legacy")
+    store.adopt(str(legacy), h)
+    assert store.is_linked(h, str(legacy))
+    other = tmp_path / "manual_pdfs" / "霍亂.pdf"
+    store.link(h, str(other))
+    assert os.path.islink(other) and not os.path.isabs(os.readlink(other))
+    assert other.read_bytes() == b"%PDF legacy"
+
+
+def test_verify_finds_corrupt_blobs_in_parallel(tmp_path):
+    store = PdfStore(str(tmp_path / "store"))
+    good, bad = _sha(b"good"), _sha(b"bad")
+    for sha, body in ((good, b"good"), (bad, b"bit rot"), (_sha(b""), b"")):
+        os.makedirs(os.path.dirname(store.blob_path(sha)), exist_ok=True)
+        with open(store.blob_path(sha), "wb") as f:
+            f.write(body)
+    assert mmap_sha256(store.blob_path(good)) == good
+    assert store.verify(workers=4) == [(bad, _sha(b"bit rot"))]
+
+
+def test_store_can_be_disabled(tmp_path, serve, monkeypatch):
+    monkeypatch.setenv("PDF_STORE", "0")
+    serve(b"%PDF plain")
+    _, path, _ = download_pdf("u", str(tmp_path / "pdfs"), "登革熱", extract=False)
+    assert os.stat(path).st_nlink == 1
+    assert not (tmp_path / "store").exists()
@@ -0,0 +1,139 @@
+"""Tests for the record repository (JSON and SQLite backends)."""
+import os
+import json
+
+import pytest
+
+import record_store
+from build_api import _summary_row
+from build_feed import build_feed
+from check_coverage import case_ok
+from record_store import DATASETS, JsonStore, LazyRecord, ShardStore, SqliteStore, get_store
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _record(name, text, update="2026-01-01", pdf_hash="h1"):
+    return {"name": name, "url": f"http://x/{name}", "pdf_hash": pdf_hash,
+            "last_pdf_update": update, "臨床條件": text, "檢驗條件": ""}
+
+
+@pytest.fixture
+def db(tmp_path):
+    store = SqliteStore(str(tmp_path / "records.db"))
+    yield store
+    store.close()
+
+
+def test_export_reproduces_the_committed_json_byte_for_byte(db, tmp_path):
+    files = JsonStore({d: os.path.join(ROOT, p) for d, p in DATASETS.items()})
+    for dataset, name in DATASETS.items():
+        db.save(dataset, files.load(dataset))
+        out = db.export(dataset, str(tmp_path / name))
+        with open(out, "rb") as a, open(os.path.join(ROOT, name), "rb") as b:
+            assert a.read() == b.read()
+
+
+def test_save_writes_only_changed_records_and_keeps_order(db):
+    records = [_record("登革熱", "發燒"), _record("瘧疾", "寒顫"), _record("霍亂", "腹瀉")]
+    assert db.save("cases", records) == 3
+    records[1] = _record("瘧疾", "寒顫、發燒", update="2026-02-01", pdf_hash="h2")
+    reordered = [records[2], records[0], records[1]]
+    assert db.save("cases", reordered) == 1
+    assert [r["name"] for r in db.load("cases")] == ["霍亂", "登革熱", "瘧疾"]
+    assert db.get("cases", "瘧疾")["臨床條件"] == "寒顫、發燒"
+
+
+def test_indexes_sections_and_hash_history(db):
+    db.save("cases", [_record("登革熱", "發燒"), _record("瘧疾", "寒顫", update="2026-03-01")])
+    db.save("cases", [_record("瘧疾", "寒顫。", update="2026-04-01", pdf_hash="h2")])
+    assert [r["name"] for r in db.updated_since("cases", "2026-02-01")] == ["瘧疾"]
+    assert db.get("cases", "登革熱") is None                     # dropped from the dataset
+    sections = db._db.execute("SELECT name, section, text FROM sections").fetchall()
+    assert sections == [("瘧疾", "臨床條件", "寒顫。")]           # empty sections not stored
+    hashes = db._db.execute(
+        "SELECT pdf_hash, first_seen FROM pdf_hashes WHERE name = '瘧疾' ORDER BY pdf_hash").fetchall()
+    assert hashes == [("h1", "2026-03-01"), ("h2", "2026-04-01")]
+
+
+def test_unsaved_dataset_raises_like_a_missing_file(db, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        db.load("manuals")
+    db.save("manuals", [])
+    assert db.load("manuals") == []
+    with pytest.raises(FileNotFoundError):
+        JsonStore({"cases": str(tmp_path / "nope.json")}).load("cases")
+
+
+def test_run_log(db):
+    db.log_run("cases", total=73, updated=2, failed=1, started_at="2026-10-18 10:00:00")
+    assert db.stats()["runs"] == 1
+
+
+def test_get_store_picks_the_backend_from_the_environment(tmp_path, monkeypatch):
+    monkeypatch.setattr(record_store, "_store", None)
+    monkeypatch.setenv("RECORD_STORE", "sqlite")
+    monkeypatch.setenv("RECORD_DB", str(tmp_path / "env.db"))
+    store = get_store()
+    assert isinstance(store, SqliteStore) and store.path == str(tmp_path / "env.db")
+    store.close()
+    monkeypatch.setattr(record_store, "_store", None)
+    monkeypatch.setenv("RECORD_STORE", "shards")
+    monkeypatch.setenv("SHARD_DIR", str(tmp_path / "shards"))
+    assert get_store().root == str(tmp_path / "shards")
+    monkeypatch.setattr(record_store, "_store", None)
+    monkeypatch.delenv("RECORD_STORE")
+    assert isinstance(get_store(), JsonStore)
+    monkeypatch.setattr(record_store, "_store", None)
+
+
+def test_shard_export_reproduces_the_committed_json_byte_for_byte(tmp_path):
+    files = JsonStore({d: os.path.join(ROOT, p) for d, p in DATASETS.items()})
+    shards = ShardStore(str(tmp_path / "data"))
+    for dataset, name in DATASETS.items():
+        shards.save(dataset, files.load(dataset))
+        out = shards.export(dataset, str(tmp_path / name))
+        with open(out, "rb") as a, open(os.path.join(ROOT, name), "rb") as b:
+            assert a.read() == b.read()
+
+
+def test_shard_save_rewrites_only_changed_records(tmp_path):
+    store = ShardStore(str(tmp_path))
+    records = [_record("登革熱", "發燒"), _record("瘧疾", "寒顫"), _record("A/B", "x"), _record("A_B", "y")]
+    assert store.save("cases", records) == 4
+    files = sorted(p.name for p in (tmp_path / "cases").iterdir())
+    assert files == ["A_B-2.json", "A_B.json", "index.json", "瘧疾.json", "登革熱.json"]
+    mtime = os.stat(tmp_path / "cases" / "登革熱.json").st_mtime_ns
+
+    records[1] = _record("瘧疾", "寒顫、發燒", update="2026-02-01")
+    assert store.save("cases", records[:2] + records[3:]) == 1        # A/B dropped
+    assert os.stat(tmp_path / "cases" / "登革熱.json").st_mtime_ns == mtime
+    assert not (tmp_path / "cases" / "A_B.json").exists()
+    assert store.get("cases", "A_B")["臨床條件"] == "y"              # keeps its file name
+    assert [r["name"] for r in store.load("cases")] == ["登革熱", "瘧疾", "A_B"]
+
+
+def test_lazy_records_answer_summaries_without_reading_shards(tmp_path):
+    store = ShardStore(str(tmp_path))
+    store.save("cases", [_record("登革熱", "發燒"), _record("瘧疾", "  ", update="")])
+    lazy = store.load_lazy("cases")
+    assert all(isinstance(r, LazyRecord) for r in lazy)
+    assert [case_ok(r) for r in lazy] == [True, False]
+    assert "登革熱" in build_feed(lazy, [])
+    assert [_summary_row(r)["last_pdf_update"] for r in lazy] == ["2026-01-01", ""]
+    assert not any(r.loaded for r in lazy)
+    assert lazy[0]["臨床條件"] == "發燒" and lazy[0].loaded and not lazy[1].loaded
+    assert dict(lazy[0]) == _record("登革熱", "發燒")
+
+
+def test_cli_import_then_export_roundtrips(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    records = [_record("登革熱", "發燒<b>")]
+    JsonStore().save("cases", records)
+    before = (tmp_path / "diseases.json").read_bytes()
+    record_store.main(["--db", "r.db", "import"])
+    (tmp_path / "diseases.json").unlink()
+    record_store.main(["--db", "r.db", "export"])
+    assert (tmp_path / "diseases.json").read_bytes() == before
+    assert not (tmp_path / "disease_manuals.json").exists()
+    assert json.loads(before) == records
@@ -0,0 +1,79 @@
+"""Tests for parser_version stamping and data_parser.main's stale-only re-parse."""
+import json
+
+import pytest
+
+import data_parser
+from cdc_common import file_sha256
+from data_parser import PARSER_VERSION, is_stale
+
+CONTENT = "一、臨床條件\n發燒\n二、檢驗條件\n分離\n"
+
+
+def test_is_stale():
+    current = {"pdf_hash": "abc", "parser_version": PARSER_VERSION}
+    assert not is_stale(current, "abc")
+    assert is_stale(current, "def")                          # new bytes
+    assert is_stale({"pdf_hash": "abc"}, "abc")               # pre-versioning record
+    assert is_stale({**current, "parser_version": PARSER_VERSION - 1}, "abc")
+    assert is_stale(None, "abc")
+    assert not is_stale({"pdf_hash": "abc", "parser_version": 7}, "abc", version=7)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "pdfs").mkdir()
+    extracted = []
+
+    def fake_extract_all(paths):
+        for p in paths:
+            extracted.append(p)
+            yield p, CONTENT, None
+
+    monkeypatch.setattr(data_parser, "_extract_all", fake_extract_all)
+    return tmp_path, extracted
+
+
+def _pdf(root, stem, body):
+    path = root / "pdfs" / f"{stem}.pdf"
+    path.write_bytes(body)
+    return file_sha256(str(path))
+
+
+def test_main_reparses_only_stale_records_and_keeps_the_rest(workdir):
+    root, extracted = workdir
+    fresh = _pdf(root, "登革熱", b"%PDF dengue")
+    old_version = _pdf(root, "A_B型肝炎", b"%PDF hep")
+    records = [
+        {"name": "無PDF", "url": "u0"},
+        {"name": "A/B型肝炎", "url": "u1", "pdf_hash": old_version, "parser_version": 0,
+         "臨床條件_diff": [2]},
+        {"name": "登革熱", "url": "u2", "pdf_hash": fresh,
+         "parser_version": PARSER_VERSION, "臨床條件": "untouched"},
+    ]
+    (root / "diseases.json").write_text(json.dumps(records, ensure_ascii=False), "utf-8")
+    _pdf(root, "新疾病", b"%PDF new")
+
+    data_parser.main([])
+
+    assert [p.rsplit("/", 1)[-1] for p in extracted] == ["A_B型肝炎.pdf", "新疾病.pdf"]
+    out = json.loads((root / "diseases.json").read_text("utf-8"))
+    assert [r["name"] for r in out] == ["無PDF", "A/B型肝炎", "登革熱", "新疾病"]
+    assert out[1]["url"] == "u1" and out[1]["臨床條件"] == "發燒"
+    assert out[1]["parser_version"] == PARSER_VERSION
+    assert "臨床條件_diff" not in out[1]                       # stale after a re-parse
+    assert out[2]["臨床條件"] == "untouched"
+    assert out[3]["pdf_hash"] == file_sha256(str(root / "pdfs" / "新疾病.pdf"))
+
+
+def test_main_all_flag_reparses_everything(workdir):
+    root, extracted = workdir
+    h = _pdf(root, "登革熱", b"%PDF dengue")
+    (root / "diseases.json").write_text(json.dumps(
+        [{"name": "登革熱", "pdf_hash": h, "parser_version": PARSER_VERSION}]), "utf-8")
+
+    data_parser.main([])
+    assert extracted == []
+    data_parser.main(["--all"])
+    assert len(extracted) == 1
@@ -1,4 +1,10 @@
-"""Tests for scraper orchestration helpers."""
+"""Tests for scraper orchestration helpers and scraper.main end to end."""
+import json
+
+import pdf_fetcher
+import scraper
+from data_parser import PARSER_VERSION
+from fake_cdc import CASE_LIST_PATH, Doc, FakeCDC, running
 from scraper import _keep_previous, diff_texts
 
 
@@ -23,3 +29,47 @@ def test_diff_texts_new_only_is_escaped():
     # sanity that diff markup + escaping still holds (guards the XSS invariant)
     out = diff_texts("", "<b>x</b>")
     assert out == "&lt;b&gt;x&lt;/b&gt;"
+
+
+def _case(text):
+    return f"一、臨床條件\n{text}\n二、檢驗條件\n分離\n三、流行病學條件\n接觸\n四、通報定義\n具有\n五、疾病分類\n確定病例\n"
+
+
+def test_main_handles_new_changed_unchanged_and_reparsed_diseases(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("HTTP_CACHE", "0")
+    monkeypatch.setenv("TEXT_CACHE", "0")
+    monkeypatch.setenv("EXTRACT_WORKERS", "1")
+    site = FakeCDC([Doc("登革熱", "第二類", _case("發燒")), Doc("霍亂", "第一類", _case("腹瀉")),
+                    Doc("瘧疾", "第二類", _case("寒顫"))], [])
+    with running(site) as base:
+        monkeypatch.setattr(pdf_fetcher, "TARGET_URL", base + CASE_LIST_PATH)
+        scraper.main([])
+        first = {r["name"]: r for r in json.loads((tmp_path / "diseases.json").read_text("utf-8"))}
+        assert set(first) == {"登革熱", "霍亂", "瘧疾"}
+        assert all(r["parser_version"] == PARSER_VERSION for r in first.values())
+
+        # 登革熱: same PDF, older parser, stale diffs. 霍亂: new PDF bytes (and an
+        # old diff). 瘧疾: unchanged. 鼠疫: new.
+        first["登革熱"].update({"parser_version": PARSER_VERSION - 1, "臨床條件": "舊",
+                               "臨床條件_diff": [1], "last_pdf_update": "2026-01-01"})
+        first["霍亂"].update({"檢驗條件_diff": [2], "last_pdf_update": "2026-01-01"})
+        (tmp_path / "diseases.json").write_text(
+            json.dumps(list(first.values()), ensure_ascii=False), "utf-8")
+        site.cases[1] = Doc("霍亂", "第一類", _case("腹瀉、嘔吐"))
+        site.cases.append(Doc("鼠疫", "第一類", _case("淋巴腺腫")))
+        site._pdfs.clear()
+        scraper.main([])
+
+    out = {r["name"]: r for r in json.loads((tmp_path / "diseases.json").read_text("utf-8"))}
+    assert set(out) == {"登革熱", "霍亂", "瘧疾", "鼠疫"}
+    reparsed = out["登革熱"]
+    assert "發燒" in reparsed["臨床條件"] and reparsed["parser_version"] == PARSER_VERSION
+    assert reparsed["last_pdf_update"] == "2026-01-01"
+    assert not [k for k in reparsed if k.endswith("_diff")]
+    changed = out["霍亂"]
+    assert "嘔吐" in changed["臨床條件"] and changed["last_pdf_update"] != "2026-01-01"
+    assert changed["pdf_hash"] != first["霍亂"]["pdf_hash"]
+    assert "臨床條件_diff" in changed and "檢驗條件_diff" not in changed
+    assert out["瘧疾"] == first["瘧疾"]
+    assert "淋巴腺腫" in out["鼠疫"]["臨床條件"] and "pdf_hash" in out["鼠疫"]
@@ -0,0 +1,353 @@
+"""Tests for the dashboards' search index, client-side search and keyed rows."""
+import os
+import re
+import json
+import shutil
+import subprocess
+
+import pytest
+
+import build_dashboard
+import build_manuals_dashboard
+from dashboard_common import ROWS_JS, SECURITY_JS, split_details, write_details
+from search_index import SEARCH_JS, SEARCH_WORKER_JS, build_index, terms
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+needs_node = pytest.mark.skipif(shutil.which("node") is None, reason="node not installed")
+
+
+def test_terms_are_ascii_words_and_cjk_bigrams():
+    assert list(terms("H5N1 流感、A型")) == ["h5n1", "流感", "a", "型"]
+    assert list(terms("登革熱 Dengue-Fever")) == ["登革", "革熱", "dengue", "fever"]
+
+
+def test_postings_encode_doc_and_field():
+    index = build_index([{"name": "登革熱", "content": "發燒"}, {"name": "瘧疾", "content": "發燒、寒顫"}],
+                        ["name", "content"])
+    assert index["docs"] == 2 and index["fields"] == ["name", "content"]
+    assert index["terms"]["發燒"] == [1, 3]
+    assert index["terms"]["登革"] == [0]
+    assert "燒寒" not in index["terms"]                # bigrams stay inside a CJK run
+
+
+def _search_in_node(data, fields, queries):
+    """[[scan results, indexed results] per query] from the page's searchRecords()."""
+    script = "\n".join([
+        "const input = JSON.parse(require('fs').readFileSync(0, 'utf8'));",
+        "const DATA = input.data;",
+        SECURITY_JS, SEARCH_JS,
+        "SEARCH_FIELDS = input.fields;",
+        "const run = () => input.queries.map(q => {",
+        "    const hits = searchRecords(q);",
+        "    return hits && [...hits].sort((a, b) => a[0] - b[0]);",
+        "});",
+        "const scanned = run();",
+        "searchIndex = input.index;",
+        "searchIndex.keys = Object.keys(input.index.terms);",
+        "process.stdout.write(JSON.stringify(input.queries.map((q, i) => [scanned[i], run()[i]])));",
+    ])
+    payload = {"data": data, "fields": fields, "queries": queries, "index": build_index(data, fields)}
+    out = subprocess.run(["node", "-e", script], input=json.dumps(payload), capture_output=True,
+                         text=True, check=True, timeout=60)
+    return json.loads(out.stdout)
+
+
+@needs_node
+def test_indexed_search_matches_a_full_scan_on_the_corpus():
+    with open(os.path.join(ROOT, "disease_manuals.json"), encoding="utf-8") as f:
+        data = json.load(f)
+    fields = build_manuals_dashboard.SEARCH_FIELDS
+    queries = ["", "登革熱", "發燒", "熱", "蚊", "dengue", "VIRUS", "h5n1", "a型", "發燒、",
+               "潛伏期為", "、", "不存在的詞彙", "38", "covid-19"]
+    results = _search_in_node(data, fields, queries)
+    assert results[0] == [None, None]
+    for q, (scanned, indexed) in zip(queries[1:], results[1:]):
+        assert scanned == indexed, q
+    # Offsets are where the query occurs in the lowercased field.
+    expected = {i for i, d in enumerate(data) if any("登革熱" in (d.get(f) or "") for f in fields)}
+    hits = dict((doc, h) for doc, h in results[1][1])
+    assert set(hits) == expected
+    for doc, by_field in hits.items():
+        for field, offsets in by_field.items():
+            assert offsets == [m.start() for m in re.finditer("登革熱", data[doc][field])]
+
+
+@needs_node
+def test_filter_rows_toggles_and_remarks_only_what_changed():
+    # Rows as the pages build them, with plain objects standing in for the DOM nodes.
+    script = "\n".join([
+        "const DATA = [{name: '登革熱', note: '發熱'}, {name: '瘧疾', note: '寒顫發燒'}];",
+        SECURITY_JS, SEARCH_JS, ROWS_JS,
+        "SEARCH_FIELDS = ['name'];",
+        "const writes = [];",
+        "const cell = (row, key) => ({set innerHTML(v) { writes.push([row, key, v]); }});",
+        "const rows = DATA.map((d, i) => ({d, tr: {hidden: false}, marked: new Set(), measured: false,",
+        "    marks: {name: cell(i, 'name'), note: cell(i, 'note')}}));",
+        "const step = (q) => {",
+        "    writes.length = 0;",
+        "    const first = filterRows(rows, searchRecords(q), q).map(r => r.d.name);",
+        "    return {first, hidden: rows.map(r => r.tr.hidden), writes: writes.slice()};",
+        "};",
+        "process.stdout.write(JSON.stringify([step(''), step('瘧'), step('熱'), step('')]));",
+    ])
+    out = subprocess.run(["node", "-e", script], capture_output=True, text=True, check=True, timeout=30)
+    initial, malaria, fever, cleared = json.loads(out.stdout)
+    assert initial == {"first": ["登革熱", "瘧疾"], "hidden": [False, False], "writes": []}
+    assert malaria == {"first": [], "hidden": [True, False],
+                       "writes": [[1, "name", "<mark>瘧</mark>疾"]]}
+    # note isn't a search field: its hits are only looked up in matching rows.
+    assert fever == {"first": [], "hidden": [False, True],
+                     "writes": [[0, "name", "登革<mark>熱</mark>"], [0, "note", "發<mark>熱</mark>"]]}
+    assert cleared == {"first": [], "hidden": [False, False],
+                       "writes": [[0, "name", "登革熱"], [0, "note", "發熱"], [1, "name", "瘧疾"]]}
+
+
+@needs_node
+def test_generated_pages_load_their_index(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name in ("diseases.json", "disease_manuals.json"):
+        shutil.copy(os.path.join(ROOT, name), tmp_path / name)
+    build_dashboard.main([])
+    build_manuals_dashboard.main([])
+    for page, index, source in (("index.html", "cases", "diseases.json"),
+                                ("manuals.html", "manuals", "disease_manuals.json")):
+        html = (tmp_path / page).read_text(encoding="utf-8")
+        assert f"startSearch('search/{index}.json'" in html and "__SEARCH" not in html
+        script = html.split("<script>")[-1].split("</script>")[0]
+        (tmp_path / "page.js").write_text(script, encoding="utf-8")
+        subprocess.run(["node", "--check", str(tmp_path / "page.js")], check=True, timeout=30)
+        with open(tmp_path / "search" / f"{index}.json", encoding="utf-8") as f, \
+                open(tmp_path / source, encoding="utf-8") as g:
+            assert json.load(f)["docs"] == len(json.load(g))
+    assert "const VIRTUAL_ROWS = true;" in (tmp_path / "manuals.html").read_text(encoding="utf-8")
+    build_manuals_dashboard.main(["--full-render"])
+    assert "const VIRTUAL_ROWS = false;" in (tmp_path / "manuals.html").read_text(encoding="utf-8")
+
+
+@needs_node
+def test_search_worker_sorts_answers_ids_and_drops_stale_queries(tmp_path):
+    script = "const sent = [];\nconst postMessage = (m) => sent.push(m);\n" \
+        "const fetch = () => Promise.reject(new Error('offline'));\nlet onmessage;\n" + SEARCH_WORKER_JS + r"""
+        const send = (data) => onmessage({data});
+        const tick = () => new Promise(resolve => setTimeout(resolve, 5));
+        (async () => {
+            send({type: 'init', id: 1, fields: ['name', 'a'], url: 'search/x.json',
+                  sorts: {name: {keys: ['name'], locale: 'zh-TW'}},
+                  data: [{name: '瘧疾', a: 'Fever'}, {name: '登革熱', a: 'rash'}, {name: 'B', detail: 'b.json', preview: {a: 'fever, bu'}}]});
+            send({type: 'search', id: 2, q: 'fev'});
+            send({type: 'search', id: 3, q: 'fever'});
+            await tick();
+            send({type: 'details', doc: 2, fields: {a: 'no'}});
+            send({type: 'search', id: 4, q: 'fever'});
+            await tick();
+            process.stdout.write(JSON.stringify(sent));
+        })();
+    """
+    (tmp_path / "worker.js").write_text(script, encoding="utf-8")
+    out = subprocess.run(["node", str(tmp_path / "worker.js")], capture_output=True, text=True, timeout=30)
+    assert out.returncode == 0, out.stderr
+    assert json.loads(out.stdout) == [
+        {"id": 1, "orders": {"name": [1, 0, 2]}},             # 登革熱 (12 strokes), 瘧疾 (15), B
+        {"id": 2, "cancelled": True},                         # superseded before it ran
+        {"id": 3, "docs": [0, 2], "pending": []},             # no index: B's preview only
+        {"id": 4, "docs": [0], "pending": []},
+    ]
+
+
+@needs_node
+def test_worker_holds_queries_for_the_index_and_marks_unloaded_candidates_pending(tmp_path):
+    full = [{"name": "瘧疾", "a": "寒顫發燒"}, {"name": "霍亂", "a": "腹瀉"}, {"name": "登革熱", "a": "發燒出疹"}]
+    slim, _ = split_details(full, ["name"], ["a"], limit=1)
+    index = build_index(full, ["name", "a"])
+    script = "const sent = [];\nconst postMessage = (m) => sent.push(m);\nlet release;\n" \
+        "const fetch = () => new Promise(resolve => { release = resolve; });\nlet onmessage;\n" \
+        + SEARCH_WORKER_JS + r"""
+        const tick = () => new Promise(resolve => setTimeout(resolve, 5));
+        (async () => {
+            onmessage({data: {type: 'init', id: 1, fields: ['name', 'a'], url: 'i.json', sorts: {},
+                              data: """ + json.dumps(slim, ensure_ascii=False) + r"""}});
+            onmessage({data: {type: 'search', id: 2, q: '發燒'}});
+            await tick();
+            const before = sent.length;
+            release({ok: true, json: async () => (""" + json.dumps(index, ensure_ascii=False) + r""")});
+            await tick();
+            process.stdout.write(JSON.stringify({before, sent}));
+        })();
+    """
+    (tmp_path / "worker.js").write_text(script, encoding="utf-8")
+    out = subprocess.run(["node", str(tmp_path / "worker.js")], capture_output=True, text=True, timeout=30)
+    assert out.returncode == 0, out.stderr
+    state = json.loads(out.stdout)
+    assert state["before"] == 1                                  # only init answered
+    assert state["sent"][1] == {"id": 2, "docs": [0, 2], "pending": [0, 2]}   # 霍亂 not fetched
+
+
+@needs_node
+def test_page_search_goes_through_the_worker_and_drops_superseded_queries(tmp_path):
+    # A Worker that runs its script in a vm context, answering asynchronously.
+    script = r"""
+        const vm = require('vm');
+        globalThis.location = {href: 'http://x/index.html'};
+        globalThis.fetch = () => Promise.reject(new Error('offline'));
+        globalThis.Worker = class {
+            constructor() {
+                this.ctx = vm.createContext({setTimeout, fetch, Intl,
+                    postMessage: (m) => setTimeout(() => this.onmessage({data: structuredClone(m)}), 1)});
+                vm.runInContext(SEARCH_WORKER_SRC, this.ctx);
+            }
+            postMessage(m) {
+                const copy = structuredClone(m);
+                setTimeout(() => this.ctx.onmessage({data: copy}), 0);
+            }
+        };
+        URL.createObjectURL = () => 'blob:search';
+        const DATA = [{name: '瘧疾', a: 'Fever'}, {name: '登革熱', a: 'rash fever'}];
+    """ + SECURITY_JS + SEARCH_JS + r"""
+        const log = [];
+        startSearch('search/x.json', ['name', 'a'], {name: {keys: ['name'], locale: 'zh-TW'}},
+                    orders => log.push(['ready', orders.name]));
+        runSearch('fe', hits => log.push(['fe', [...hits.keys()]]));
+        runSearch('rash', hits => log.push(['rash', [...hits.keys()]]));
+        runSearch('', hits => log.push(['', hits]));
+        setTimeout(() => {
+            runSearch('fever', hits => log.push(['fever', [...hits.keys()]]));
+            setTimeout(() => process.stdout.write(JSON.stringify(log)), 30);
+        }, 30);
+    """
+    (tmp_path / "page.js").write_text(script, encoding="utf-8")
+    out = subprocess.run(["node", str(tmp_path / "page.js")], capture_output=True, text=True, timeout=30)
+    assert out.returncode == 0, out.stderr
+    assert json.loads(out.stdout) == [["", None], ["ready", [1, 0]], ["fever", [0, 1]]]
+
+
+def test_split_details_keeps_summaries_and_previews(tmp_path):
+    records = [{"name": "登革熱", "url": "u", "pdf_path": "pdfs/x.pdf", "短": "發燒",
+                "長": "字" * 200, "長_diff": [3]},
+               {"name": "瘧疾", "url": "v"}]
+    slim, details = split_details(records, ["name", "url"], ["短", "長"], limit=10)
+    assert slim[1] == {"name": "瘧疾", "url": "v"}                   # nothing to fetch
+    first = slim[0]
+    assert first["短"] == "發燒" and first["preview"] == {"長": "字" * 10}
+    assert json.loads(details[first["detail"]]) == {"長": "字" * 200, "長_diff": [3]}
+    write_details({"stale.json": "{}"}, str(tmp_path))
+    write_details(details, str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == [first["detail"]]
+
+
+def test_pages_embed_slim_records_unless_single_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    shutil.copy(os.path.join(ROOT, "disease_manuals.json"), tmp_path / "disease_manuals.json")
+    build_manuals_dashboard.main([])
+    lazy = (tmp_path / "manuals.html").read_text(encoding="utf-8")
+    assert 'const DETAILS_DIR = "details/manuals/";' in lazy
+    assert len(os.listdir(tmp_path / "details" / "manuals")) > 0
+    build_manuals_dashboard.main(["--single-file"])
+    full = (tmp_path / "manuals.html").read_text(encoding="utf-8")
+    assert "const DETAILS_DIR = null;" in full and "__DETAILS" not in full
+    assert len(lazy) < len(full) / 2
+
+
+# Just enough DOM for the manuals page script: every row is 300px tall.
+_FAKE_DOM = r"""
+const frames = [];
+const el = (id) => ({
+    id, style: {}, dataset: {}, children: [], hidden: false, listeners: {},
+    set innerHTML(v) { this.html = v; this.firstChild = el(); },
+    querySelectorAll: () => [],
+    addEventListener(type, fn) { this.listeners[type] = fn; },
+    getBoundingClientRect() {
+        return id === 'tableBody' ? {top: 100 - window.scrollY} : {height: 300};
+    },
+    replaceChildren(...nodes) { this.children = nodes; },
+    appendChild(node) { this.children.push(node); },
+    scrollIntoView() {},
+});
+const nodes = {};
+globalThis.window = globalThis;
+Object.assign(globalThis, {
+    innerHeight: 800, scrollY: 0, listeners: {},
+    addEventListener(type, fn) { listeners[type] = fn; },
+    scrollTo(x, y) { window.scrollY = y; },
+    requestAnimationFrame: (fn) => frames.push(fn),
+    // Serves the files the build wrote (search/, details/) from the cwd.
+    fetch: (url) => new Promise(resolve => {
+        let text = null;
+        try { text = require('fs').readFileSync(url, 'utf8'); } catch (e) {}
+        resolve(text === null ? {ok: false, status: 404} : {ok: true, json: async () => JSON.parse(text)});
+    }),
+    location: {hash: ''},
+    ResizeObserver: class {
+        constructor(fn) { this.fn = fn; }
+        observe(target) { this.fn([{target}]); }
+        unobserve() {}
+    },
+    document: {
+        getElementById: (id) => nodes[id] || (nodes[id] = el(id)),
+        createElement: () => el(),
+        querySelectorAll: () => [],
+    },
+});
+const flush = () => { while (frames.length) frames.shift()(); };
+const settle = () => new Promise(resolve => setTimeout(resolve, 10));
+const search = (q) => { document.getElementById('searchInput').value = q; render(q); };
+"""
+
+
+@needs_node
+def test_virtual_rows_mount_only_what_is_near_the_viewport(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    shutil.copy(os.path.join(ROOT, "disease_manuals.json"), tmp_path / "disease_manuals.json")
+    build_manuals_dashboard.main([])
+    html = (tmp_path / "manuals.html").read_text(encoding="utf-8")
+    script = _FAKE_DOM + html.split("<script>")[-1].split("</script>")[0] + r"""
+      (async () => {
+        await settle();
+        flush();
+        const state = () => {
+            const [top, ...rest] = tbody.children;
+            const bottom = rest.pop();
+            return {top: parseFloat(top.firstChild.style.height), bottom: parseFloat(bottom.firstChild.style.height),
+                    rows: rest.map(tr => tr.id.replace('manual-', ''))};
+        };
+        const out = {total: DATA.length, names: ordered.map(r => r.d.name), start: state()};
+        window.scrollY = 6000;
+        listeners.scroll();
+        flush();
+        out.scrolled = state();
+        search(ordered[40].d.name);
+        await settle();           // the candidates' details arrive and the search reruns
+        flush();
+        out.searched = state();
+        search('');
+        virtualRows.reveal(ordered[60].d.name);
+        flush();
+        out.revealed = state();
+        out.revealedScroll = window.scrollY;
+        out.built = rows.filter(r => r.tr).length;
+        out.slim = DATA.filter(d => d.detail).length;
+        process.stdout.write(JSON.stringify(out));
+      })();
+    """
+    (tmp_path / "page.js").write_text(script, encoding="utf-8")
+    out = subprocess.run(["node", str(tmp_path / "page.js")], capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    state = json.loads(out.stdout)
+    total, names = state["total"], state["names"]
+
+    def check(view):
+        first = names.index(view["rows"][0])
+        assert view["rows"] == names[first:first + len(view["rows"])]
+        assert view["top"] == 300 * first
+        assert view["top"] + 300 * len(view["rows"]) + view["bottom"] == 300 * total
+
+    start = state["start"]
+    check(start)
+    assert start["rows"][0] == names[0] and len(start["rows"]) == 6        # 0..1500px
+    check(state["scrolled"])
+    assert state["scrolled"]["rows"][0] == names[16]                        # from 5100px
+    assert state["searched"]["rows"][0] == names[40] and state["searched"]["top"] == 0
+    check(state["revealed"])
+    assert names[60] in state["revealed"]["rows"]
+    assert state["revealedScroll"] == 100 + 300 * 60
+    assert state["built"] < total
+    assert 0 < state["slim"] < total          # only some details were fetched
@@ -0,0 +1,62 @@
+"""Tests for the declarative section-grammar engine behind both PDF parsers."""
+import re
+
+from section_grammar import NUMBERED_CHINESE, NUMBERED_SUBITEM, SectionGrammar, is_noise
+
+TEXT = """前言不屬於任何段落
+一、概述（Overview）
+第一行
+  縮排第二行
+3/12
+二、處置
+處置內容
+【密件】 通報單
+表格雜訊
+一、概述
+重新開始的概述
+"""
+
+
+def test_sections_noise_boundary_and_repeated_headers():
+    grammar = SectionGrammar(["概述", "處置", "附錄"], numbering=NUMBERED_CHINESE,
+                             trailer=r'(?:\s*[（\(][A-Za-z\s\-]+[）\)])?')
+    # a repeated header starts over; the form block is cut; footers dropped
+    assert grammar.parse(TEXT) == {"概述": "重新開始的概述", "處置": "處置內容", "附錄": ""}
+    assert grammar.keys == ["概述", "處置", "附錄"]
+
+
+def test_aliases_share_a_key_and_keep_key_order():
+    grammar = SectionGrammar({"甲": "a", "乙": "b", "甲別名": "a"}, numbering=NUMBERED_CHINESE)
+    assert grammar.parse("一、甲別名\nx\n二、乙\ny") == {"a": "x", "b": "y"}
+
+
+def test_inline_content_and_longest_label_first():
+    grammar = SectionGrammar({"可能病例": "suspected", "極可能病例": "probable"},
+                             numbering=NUMBERED_SUBITEM, numbering_optional=True,
+                             trailer=r'\s*[:：]?', full_line=False, strip_lines=True)
+    out = grammar.parse("（一）可能病例：第一句\n  第二句  \n極可能病例\n  內容")
+    assert out == {"suspected": "第一句\n第二句", "probable": "內容"}
+
+
+def test_full_line_headers_reject_trailing_text():
+    grammar = SectionGrammar(["概述"], numbering=NUMBERED_CHINESE)
+    assert grammar.parse("一、概述之外的句子\n內容") == {"概述": ""}
+
+
+def test_skip_filters_apply_before_header_matching():
+    running_header = re.compile(r'手冊－')
+    grammar = SectionGrammar(["概述", "處置"], numbering=NUMBERED_CHINESE, trailer=r'.*',
+                             skip=(running_header,), noise=())
+    text = "一、概述\n內容\n二、處置 手冊－頁首\n仍屬概述"
+    assert grammar.parse(text) == {"概述": "內容\n仍屬概述", "處置": ""}
+
+
+def test_ignorecase_labels_map_back_to_their_key():
+    grammar = SectionGrammar({"Summary": "summary"}, numbering=NUMBERED_CHINESE,
+                             flags=re.IGNORECASE)
+    assert grammar.parse("一、SUMMARY\ntext") == {"summary": "text"}
+
+
+def test_is_noise_default_footers():
+    assert is_noise("1/3") and is_noise("第 2 頁") and is_noise("104年7月16日核定")
+    assert not is_noise("傳統檢測須為疾病管制署或認可實驗室。")
@@ -0,0 +1,109 @@
+"""Tests for the delta-compressed section history."""
+import json
+import random
+
+import pytest
+
+import manual_scraper
+from fake_cdc import MANUAL_LIST_PATH, Doc, FakeCDC, running
+from section_history import SectionHistory, apply_delta, make_delta
+from text_diff import compact_diff
+
+
+def test_delta_roundtrips_random_edits():
+    rng = random.Random(19)
+    alphabet = "發燒寒顫腹瀉，。、abc\n"
+    for _ in range(200):
+        old = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 60)))
+        new = list(old)
+        for _ in range(rng.randint(0, 4)):
+            pos = rng.randint(0, len(new))
+            new[pos:pos + rng.randint(0, 3)] = rng.choice(alphabet) * rng.randint(0, 3)
+        new = "".join(new)
+        assert apply_delta(old, make_delta(old, new)) == new
+
+
+def test_versions_keyframes_and_as_of(tmp_path):
+    history = SectionHistory(str(tmp_path / "h.jsonl"), keyframe_every=3)
+    texts = [f"第{n}版：發燒、寒顫" for n in range(7)]
+    for n, text in enumerate(texts):
+        assert history.record("瘧疾", "臨床條件", text, f"2026-01-{n + 10:02d}") is not None
+    history.record("瘧疾", "檢驗條件", "血液抹片", "2026-01-13")
+
+    chain = history._versions[("瘧疾", "臨床條件")]
+    assert [("text" in v) for v in chain] == [True, False, False, True, False, False, True]
+    assert [history.text_at("瘧疾", "臨床條件", v) for v in range(7)] == texts
+    assert history.as_of("瘧疾", "2026-01-09") == {}
+    assert history.as_of("瘧疾", "2026-01-12") == {"臨床條件": texts[2]}
+    assert history.as_of("瘧疾", "2026-02-01") == {"臨床條件": texts[6], "檢驗條件": "血液抹片"}
+    assert history.diff("瘧疾", "臨床條件", "2026-01-10", "2026-01-16") == compact_diff(texts[0], texts[6])
+    assert history.diff("瘧疾", "臨床條件", "2026-01-10", "2026-01-16") is \
+        history.diff("瘧疾", "臨床條件", "2026-01-10", "2026-01-16")       # memoized
+
+
+def test_record_all_appends_only_changed_sections_and_reloads(tmp_path):
+    path = str(tmp_path / "h.jsonl")
+    records = [{"name": "登革熱", "last_pdf_update": "2026-08-22", "臨床條件": "發燒", "檢驗條件": ""},
+               {"name": "霍亂", "臨床條件": "腹瀉", "檢驗條件": "糞便培養"}]
+    fields = ["臨床條件", "檢驗條件"]
+    assert SectionHistory(path).record_all(records, fields, "2026-09-01") == 3
+    assert SectionHistory(path).record_all(records, fields, "2026-09-02") == 0
+
+    records[0].update({"臨床條件": "發燒、頭痛", "last_pdf_update": "2026-10-01"})
+    assert SectionHistory(path).record_all(records, fields, "2026-10-01") == 1
+    history = SectionHistory(path)
+    assert history.versions("登革熱", "臨床條件") == [(0, "2026-08-22"), (1, "2026-10-01")]
+    assert history.versions("霍亂", "檢驗條件") == [(0, "2026-09-01")]
+    assert history.as_of("登革熱", "2026-09-30") == {"臨床條件": "發燒"}
+    assert history.latest("登革熱", "臨床條件") == "發燒、頭痛"
+
+
+def test_a_torn_last_line_is_dropped(tmp_path):
+    path = tmp_path / "h.jsonl"
+    good = json.dumps({"name": "a", "section": "s", "date": "2026-01-01", "v": 0, "text": "x"})
+    path.write_text(good + '\n{"name": "a", "sect', encoding="utf-8")
+    history = SectionHistory(str(path))
+    assert history.latest("a", "s") == "x"
+    assert path.read_text(encoding="utf-8").endswith('"sect')      # reading never rewrites
+    history.record_all([{"name": "a", "s": "xy"}], ["s"], "2026-01-02")
+    assert path.read_text(encoding="utf-8").count("\n") == 2
+    assert SectionHistory(str(path)).latest("a", "s") == "xy"
+
+
+def test_unreadable_or_out_of_order_lines_raise(tmp_path):
+    path = tmp_path / "h.jsonl"
+    v0 = json.dumps({"name": "a", "section": "s", "date": "2026-01-01", "v": 0, "text": "x"})
+    v2 = json.dumps({"name": "b", "section": "s", "date": "2026-01-01", "v": 2, "text": "y"})
+    for body in (v0 + "\nnot json\n" + v0 + "\n", v0 + "\n" + v2 + "\n"):
+        path.write_text(body, encoding="utf-8")
+        with pytest.raises(ValueError):
+            SectionHistory(str(path))
+        assert path.read_text(encoding="utf-8") == body
+    history = SectionHistory(str(tmp_path / "new.jsonl"))
+    with pytest.raises(ValueError):
+        history._add(json.loads(v2))
+    assert history.names() == [] and history.versions("b", "s") == []
+
+
+def test_a_complete_last_line_without_newline_is_kept(tmp_path):
+    path = tmp_path / "h.jsonl"
+    path.write_text(json.dumps({"name": "a", "section": "s", "date": "2026-01-01", "v": 0, "text": "x"}),
+                    encoding="utf-8")
+    SectionHistory(str(path)).record_all([{"name": "a", "s": "xy"}], ["s"], "2026-01-02")
+    assert SectionHistory(str(path)).versions("a", "s") == [(0, "2026-01-01"), (1, "2026-01-02")]
+
+
+def test_manual_scraper_records_history(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("HTTP_CACHE", "0")
+    monkeypatch.setenv("TEXT_CACHE", "0")
+    monkeypatch.setenv("EXTRACT_WORKERS", "1")
+    with running(FakeCDC([], [Doc("手冊0", "", "一、疾病概述\n內容0\n")])) as base:
+        links = manual_scraper.get_manual_links
+        monkeypatch.setattr(manual_scraper, "get_manual_links",
+                            lambda: links(base + MANUAL_LIST_PATH))
+        manual_scraper.main([])
+        manual_scraper.main([])
+    history = SectionHistory.open("manuals")
+    assert history.names() == ["手冊0"]
+    assert len(history.versions("手冊0", "疾病概述")) == 1
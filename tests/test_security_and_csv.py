@@ -1,8 +1,15 @@
-"""Tests for diff_texts XSS-escaping and the stdlib write_csv helper."""
+"""Tests for diff XSS-escaping (diff_texts / renderDiff) and the stdlib write_csv helper."""
 import csv
+import json
+import shutil
+import subprocess
+
+import pytest
 
 from scraper import diff_texts
+from text_diff import compact_diff
 from cdc_common import write_csv
+from dashboard_common import SECURITY_JS
 
 
 def test_diff_texts_escapes_injected_markup_on_first_seen():
@@ -31,6 +38,30 @@ def test_diff_texts_equal_segment_is_escaped():
     assert out == "a&lt;b&gt;c"
 
 
+def _render_in_node(cases):
+    script = SECURITY_JS + (
+        "\nconst cases = JSON.parse(require('fs').readFileSync(0, 'utf8'));"
+        "\nprocess.stdout.write(JSON.stringify(cases.map(c => renderDiff(c[0], c[1]))));")
+    out = subprocess.run(["node", "-e", script], input=json.dumps(cases), capture_output=True,
+                         text=True, check=True, timeout=30)
+    return json.loads(out.stdout)
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node not installed")
+def test_renderdiff_js_matches_diff_texts():
+    pairs = [("發燒。頭痛", "發燒。咳嗽頭痛"), ("AAAA", "<img onerror=x>"),
+             ("😀<a>", "😀😀<a>&b"), ("", "<script>"), ("x", "")]
+    cases = [[compact_diff(a, b), b] for a, b in pairs]
+    # A legacy HTML diff string: only the four diff tags survive.
+    cases.append(['<del style="color: #9ca3af;">x</del><img src=x onerror=alert(1)>', None])
+    rendered = _render_in_node(cases + [[[2, ["+", 1]], "ab<c>d"]])
+    # Runs that don't add up to the text (a diff of an earlier parse): plain text.
+    assert rendered.pop() == "ab&lt;c&gt;d" == diff_texts("ab<c>d", "ab<c>d")
+    # Python's html.escape writes ' as &#x27;, esc() as &#39;; no quotes here.
+    assert rendered[:len(pairs)] == [diff_texts(a, b) for a, b in pairs]
+    assert rendered[-1] == '<del style="color: #9ca3af;">x</del>&lt;img src=x onerror=alert(1)&gt;'
+
+
 def test_write_csv_filters_columns_and_writes_bom(tmp_path):
     path = tmp_path / "out.csv"
     records = [
@@ -0,0 +1,51 @@
+"""Tests for the sha256-keyed extracted-text cache."""
+import cdc_common
+import text_cache
+from text_cache import TextCache
+
+
+def test_put_get_roundtrip(tmp_path):
+    cache = TextCache(str(tmp_path), max_bytes=10_000)
+    assert cache.get("abc") is None
+    cache.put("abc", "登革熱 內文", source="登革熱.pdf")
+    assert cache.get("abc") == "登革熱 內文"
+    assert cache.entries()["abc"]["source"] == "登革熱.pdf"
+
+
+def test_evict_drops_least_recently_used(tmp_path):
+    cache = TextCache(str(tmp_path), max_bytes=10_000)
+    for sha in ("old", "mid", "new"):
+        cache.put(sha, "x" * 100)
+    # touching "old" makes "mid" the least recently used
+    entries = cache.entries()
+    cache._append_index({"sha256": "old", "size": 100, "used": entries["new"]["used"] + 1})
+
+    removed = cache.evict(max_bytes=200)
+    assert removed == 1
+    assert cache.get("mid") is None
+    assert cache.get("old") == "x" * 100
+    assert cache.get("new") == "x" * 100
+    assert cache.total_bytes() == 200
+
+
+def test_evict_compacts_index_and_tolerates_torn_lines(tmp_path):
+    cache = TextCache(str(tmp_path), max_bytes=10_000)
+    cache.put("a", "text")
+    cache.get("a")
+    with open(cache.index_path, "a", encoding="utf-8") as f:
+        f.write('{"sha256": "a", "si')      # crashed writer
+    cache.evict()
+    with open(cache.index_path, encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 1
+
+
+def test_extract_pdf_text_serves_cache_hit_without_pdfplumber(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_cache, "_default", TextCache(str(tmp_path / "cache")))
+    monkeypatch.delenv("TEXT_CACHE", raising=False)
+    pdf = tmp_path / "not_really.pdf"
+    pdf.write_bytes(b"%PDF-1.4 not a parseable pdf")
+    sha = cdc_common.file_sha256(str(pdf))
+    text_cache.get_cache().put(sha, "cached text")
+
+    assert cdc_common.extract_pdf_text(str(pdf)) == "cached text"
+    assert cdc_common.extract_pdf_text(str(pdf), sha256=sha) == "cached text"
@@ -0,0 +1,156 @@
+"""Tests for the size-adaptive diff engine and the compact *_diff format."""
+import re
+import html
+import random
+import difflib
+
+from scraper import diff_from_html, diff_texts, render_diff, upgrade_diffs
+from text_diff import SMALL_CELLS, _myers_blocks, compact_diff, diff_opcodes, tokenize
+
+ALLOWED_TAGS = {'<del style="color: #9ca3af;">', '</del>',
+                '<b style="color: #ea580c; background: #ffedd5;">', '</b>'}
+
+
+def _apply(ops, a, b):
+    """Rebuild b from a and the opcodes, checking they tile both strings."""
+    out, i, j = [], 0, 0
+    for tag, i1, i2, j1, j2 in ops:
+        assert (i1, j1) == (i, j)
+        if tag == 'equal':
+            assert a[i1:i2] == b[j1:j2]
+        out.append(b[j1:j2])
+        i, j = i2, j2
+    assert (i, j) == (len(a), len(b))
+    return "".join(out)
+
+
+def _long_section(rng, sentences=600):
+    words = ["發燒", "頭痛", "接觸者", "追蹤", "疫苗", "檢體", "送驗", "隔離", "通報"]
+    return "".join("".join(rng.choice(words) for _ in range(rng.randint(2, 8)))
+                   + rng.choice("。；\n") for _ in range(sentences))
+
+
+def test_tokenize_roundtrips():
+    text = "第一句。第二句；\n\n第三行\n尾巴"
+    assert tokenize(text) == ["第一句。", "第二句；\n\n", "第三行\n", "尾巴"]
+    assert "".join(tokenize(text)) == text
+
+
+def test_myers_finds_a_longest_common_subsequence():
+    rng = random.Random(1)
+    for _ in range(300):
+        a = [rng.randint(0, 3) for _ in range(rng.randint(0, 15))]
+        b = [rng.randint(0, 3) for _ in range(rng.randint(0, 15))]
+        blocks = _myers_blocks(a, b, 100)
+        lcs = sum(m.size for m in difflib.SequenceMatcher(None, a, b, autojunk=False)
+                  .get_matching_blocks())
+        assert sum(size for _, _, size in blocks) >= lcs
+        assert all(a[i:i + n] == b[j:j + n] for i, j, n in blocks)
+
+
+def test_small_inputs_diff_exactly_like_sequence_matcher():
+    a, b = "發燒且頭痛。", "發燒、頭痛且嘔吐。"
+    assert diff_opcodes(a, b) == difflib.SequenceMatcher(None, a, b).get_opcodes()
+
+
+def test_long_sections_refine_only_the_changed_sentence():
+    rng = random.Random(2)
+    a = _long_section(rng)
+    cut = len(a) // 2
+    b = a[:cut] + "新增的防疫措施" + a[cut:]
+    assert len(a) * len(b) > SMALL_CELLS
+    ops = diff_opcodes(a, b)
+    assert _apply(ops, a, b) == b
+    assert [op[0] for op in ops] == ["equal", "insert", "equal"]
+
+
+def test_over_budget_falls_back_to_one_coarse_replace():
+    rng = random.Random(3)
+    a, b = _long_section(rng), _long_section(rng)
+    ops = diff_opcodes(a, b, budget=10)
+    assert [op[0] for op in ops if op[0] != 'equal'] == ['replace']
+    assert _apply(ops, a, b) == b
+
+
+def test_random_edits_always_tile_both_strings():
+    rng = random.Random(4)
+    base = _long_section(rng, 300)
+    for budget in (50, 20_000, 4_000_000):
+        for _ in range(20):
+            b = list(base)
+            for _ in range(rng.randint(1, 10)):
+                p = rng.randint(0, len(b))
+                b[p:p + rng.randint(0, 50)] = list("修訂。<b>")
+            b = "".join(b)
+            assert _apply(diff_opcodes(base, b, budget), base, b) == b
+
+
+def test_long_diff_markup_stays_within_the_renderdiff_allow_list():
+    rng = random.Random(5)
+    a = _long_section(rng)
+    b = a.replace("發燒", "<script>x</script>", 3)
+    out = diff_texts(a, b)
+    tags = set(re.findall(r"<[^>]*>", out))
+    assert tags <= ALLOWED_TAGS
+    assert "&lt;script&gt;" in out
+
+
+def _legacy_diff_texts(old_text, new_text):
+    """diff_texts() as it was when records stored HTML diffs."""
+    if not old_text:
+        return html.escape(new_text or "")
+    if not new_text:
+        return ""
+    result = []
+    for tag, i1, i2, j1, j2 in diff_opcodes(old_text, new_text):
+        if tag == 'equal':
+            result.append(html.escape(new_text[j1:j2]))
+            continue
+        if i2 > i1:
+            result.append(f'<del style="color: #9ca3af;">{html.escape(old_text[i1:i2])}</del>')
+        if j2 > j1:
+            result.append(f'<b style="color: #ea580c; background: #ffedd5;">{html.escape(new_text[j1:j2])}</b>')
+    return "".join(result)
+
+
+def test_compact_diff_format():
+    assert compact_diff("發燒。頭痛", "發燒。咳嗽頭痛") == [3, ["+", 2], 2]
+    assert compact_diff("發燒。頭痛", "發燒。") == [3, ["-", "頭痛"]]
+    assert compact_diff("AAAA", "BB") == [["-", "AAAA"], ["+", 2]]
+    assert compact_diff("", "新") == [1]
+    assert compact_diff("舊", "") == []
+
+
+def test_compact_diff_renders_like_the_old_html_diffs():
+    rng = random.Random(6)
+    pairs = [("a<b>c", "a<b>c"), ("", "<x>"), ("x", ""), ("😀a&b", "😀ab\U0001F600")]
+    for _ in range(200):
+        a = "".join(rng.choice("發燒頭痛。<&\n😀") for _ in range(rng.randint(0, 40)))
+        b = "".join(rng.choice("發燒咳嗽。<&\n😀") for _ in range(rng.randint(0, 40)))
+        pairs.append((a, b))
+    long_a = _long_section(rng)
+    pairs.append((long_a, long_a.replace("追蹤", "<b>追</b>", 5)))
+    for a, b in pairs:
+        legacy = _legacy_diff_texts(a, b)
+        assert render_diff(b, compact_diff(a, b)) == legacy == diff_texts(a, b)
+        if a:
+            assert diff_from_html(legacy) == compact_diff(a, b)
+
+
+def test_render_diff_shows_plain_text_when_the_runs_do_not_cover_it():
+    ops = compact_diff("發燒", "發燒<咳嗽>")
+    assert render_diff("發燒<咳嗽>，頭痛", ops) == "發燒&lt;咳嗽&gt;，頭痛"   # re-parsed: longer
+    assert render_diff("發", ops) == "發"
+
+
+def test_upgrade_diffs_converts_only_diffs_that_replay():
+    record = {"臨床條件": "發燒<3天", "臨床條件_diff": _legacy_diff_texts("發燒", "發燒<3天"),
+              # written before diff_texts() escaped its segments
+              "檢驗條件": "A>B", "檢驗條件_diff": 'A><b style="color: #ea580c; background: #ffedd5;">B</b>',
+              "通報定義": "現行文字", "通報定義_diff": "過時的 diff",
+              "防疫措施_diff": [1]}
+    assert upgrade_diffs(record) is record
+    assert record["臨床條件_diff"] == [2, ["+", 3]]
+    assert record["檢驗條件_diff"] == [2, ["+", 1]]
+    assert record["通報定義_diff"] == "過時的 diff"
+    assert record["防疫措施_diff"] == [1]
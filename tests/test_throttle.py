@@ -0,0 +1,161 @@
+"""Tests for the adaptive limiter, circuit breaker and fetch()'s retry loop."""
+import threading
+
+import pytest
+import requests
+
+import cdc_common
+from cdc_common import fetch
+from throttle import TokenBucket, AdaptiveLimiter, CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, s):
+        with self._lock:
+            self.now += s
+
+
+def test_token_bucket_limits_rate_across_threads():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, capacity=1, clock=clock, sleep=clock.sleep)
+    for _ in range(11):
+        bucket.acquire()
+    # first token is free (full bucket), the next 10 need 0.1s each
+    assert abs(clock.now - 1.0) < 1e-6
+
+
+def test_limiter_increases_additively_and_halves_on_failure():
+    clock = FakeClock()
+    limiter = AdaptiveLimiter(rate=2, min_rate=0.5, max_rate=3, latency_target=1,
+                              step=0.5, clock=clock, sleep=clock.sleep)
+    limiter.record_success(0.1)
+    limiter.record_success(0.1)
+    assert limiter.rate == 3
+    limiter.record_success(0.1)
+    assert limiter.rate == 3            # capped at max_rate
+    limiter.record_failure()
+    assert limiter.rate == 1.5
+    limiter.record_failure()
+    limiter.record_failure()
+    assert limiter.rate == 0.5          # floored at min_rate
+    assert limiter.throttled == 3
+
+
+def test_limiter_backs_off_when_latency_exceeds_target():
+    limiter = AdaptiveLimiter(rate=4, min_rate=0.5, max_rate=8, latency_target=1)
+    limiter.record_success(5.0)
+    assert limiter.rate == pytest.approx(3.6)
+    assert "latency EWMA 5.00s" in limiter.summary()
+
+
+def test_retry_after_pauses_every_caller():
+    clock = FakeClock()
+    limiter = AdaptiveLimiter(rate=100, max_rate=100, clock=clock, sleep=clock.sleep)
+    limiter.record_failure(pause=5)
+    limiter.acquire()
+    assert clock.now >= 5
+    before = clock.now
+    limiter.acquire()                   # pause is over: only the token wait remains
+    assert clock.now - before < 0.1
+
+
+def test_breaker_opens_then_half_opens_then_closes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(threshold=3, cooldown=10, clock=clock)
+    for _ in range(3):
+        breaker.before_request()
+        breaker.record_failure()
+    assert breaker.state == "open" and breaker.trips == 1
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    clock.now += 10
+    assert breaker.state == "half-open"
+    breaker.before_request()            # the single trial request
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()        # others keep failing fast meanwhile
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_request()
+
+
+def test_breaker_reopens_when_trial_fails():
+    clock = FakeClock()
+    breaker = CircuitBreaker(threshold=1, cooldown=10, clock=clock)
+    breaker.record_failure()
+    clock.now += 10
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.trips == 2
+
+
+def _response(status, body=b"", headers=None):
+    res = requests.Response()
+    res.status_code = status
+    res._content = body
+    res.headers = requests.structures.CaseInsensitiveDict(headers or {})
+    res.url = "https://www.cdc.gov.tw/x"
+    res.close = lambda: None
+    return res
+
+
+class QueueSession:
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+@pytest.fixture
+def no_cache(monkeypatch):
+    monkeypatch.setenv("HTTP_CACHE", "0")
+    monkeypatch.setattr(cdc_common, "_validators", None)
+
+
+def test_fetch_retries_429_and_honours_retry_after(monkeypatch, no_cache):
+    pauses = []
+    limiter = AdaptiveLimiter(rate=1000, max_rate=1000, sleep=lambda s: None)
+    monkeypatch.setattr(limiter, "record_failure", lambda pause=None: pauses.append(pause))
+    monkeypatch.setattr(cdc_common, "_limiter", limiter)
+    session = QueueSession(_response(429, headers={"Retry-After": "3"}),
+                           requests.ConnectionError("reset"),
+                           _response(200, b"ok"))
+    monkeypatch.setattr(cdc_common, "get_session", lambda: session)
+
+    assert fetch("https://www.cdc.gov.tw/x").content == b"ok"
+    assert session.calls == 3
+    assert pauses == [3.0, 2]           # Retry-After, then exponential backoff
+
+
+def test_fetch_gives_up_after_retries(monkeypatch, no_cache):
+    session = QueueSession(*[_response(503) for _ in range(cdc_common.RETRIES + 1)])
+    monkeypatch.setattr(cdc_common, "get_session", lambda: session)
+
+    with pytest.raises(requests.HTTPError):
+        fetch("https://www.cdc.gov.tw/x")
+    assert session.calls == cdc_common.RETRIES + 1
+
+
+def test_open_breaker_fails_fast_without_a_request(monkeypatch, no_cache):
+    breaker = CircuitBreaker(threshold=1, cooldown=60)
+    breaker.record_failure()
+    monkeypatch.setattr(cdc_common, "_breaker", breaker)
+    session = QueueSession()
+    monkeypatch.setattr(cdc_common, "get_session", lambda: session)
+
+    with pytest.raises(CircuitOpenError):
+        fetch("https://www.cdc.gov.tw/x")
+    assert session.calls == 0
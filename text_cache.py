@@ -0,0 +1,202 @@
+"""
+text_cache.py - Content-addressed cache of extracted PDF text.
+
+pdfplumber extraction is by far the most expensive step per document, and its
+output depends only on the PDF bytes. So the text is cached on disk keyed by the
+PDF's sha256 (the same hash download_pdf already records as pdf_hash):
+
+    .cache/text/<sha256>.txt     the extracted text
+    .cache/text/index.jsonl      one {"sha256", "size", "used", "source"} line
+                                 per store/hit; later lines win
+
+cdc_common.extract_pdf_text consults the cache before opening the PDF, which
+covers every caller (both scrapers' extract stages and data_parser.main), so a
+PDF that has been seen once is never extracted again — reprocessing pdfs/ after
+a parser fix only pays for parsing.
+
+The index is append-only so that extraction worker processes can record hits
+and stores concurrently without locking; text files are written via a temp file
+and os.replace so readers never see a partial file. The size cap
+(TEXT_CACHE_MAX_MB, default 200) is enforced by evict(), which drops the least
+recently used entries and compacts the index; the scrapers call it at the end
+of a run, and it can be run by hand:
+
+    python text_cache.py evict [--max-mb N]
+    python text_cache.py stats
+
+Set TEXT_CACHE=0 to bypass the cache entirely.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get("TEXT_CACHE_DIR", os.path.join(".cache", "text"))
+INDEX_NAME = "index.jsonl"
+DEFAULT_MAX_MB = 200
+
+
+def _max_bytes_from_env():
+    try:
+        mb = float(os.environ.get("TEXT_CACHE_MAX_MB", DEFAULT_MAX_MB))
+    except ValueError:
+        mb = DEFAULT_MAX_MB
+    return int(mb * 1024 * 1024)
+
+
+class TextCache:
+    """sha256 -> extracted text, stored under `root` with an LRU index."""
+
+    def __init__(self, root=CACHE_DIR, max_bytes=None):
+        self.root = root
+        self.max_bytes = _max_bytes_from_env() if max_bytes is None else max_bytes
+        self.index_path = os.path.join(root, INDEX_NAME)
+
+    def _path(self, sha256):
+        return os.path.join(self.root, f"{sha256}.txt")
+
+    def _append_index(self, entry):
+        # A single small O_APPEND write: safe to interleave across processes.
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def get(self, sha256):
+        """Return the cached text for sha256, or None (and mark it recently used)."""
+        if not sha256:
+            return None
+        try:
+            with open(self._path(sha256), encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            self._append_index({"sha256": sha256, "size": len(text.encode("utf-8")),
+                                "used": time.time()})
+        except OSError:
+            pass  # the LRU timestamp is best-effort
+        return text
+
+    def put(self, sha256, text, source=None):
+        """Store text under sha256 (atomically) and record it in the index."""
+        if not sha256 or text is None:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(sha256)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+        entry = {"sha256": sha256, "size": len(text.encode("utf-8")), "used": time.time()}
+        if source:
+            entry["source"] = source
+        self._append_index(entry)
+
+    def entries(self):
+        """
+        Current {sha256: entry} view: index lines folded (latest wins), limited
+        to files that still exist; stray files get their mtime as "used".
+        """
+        entries = {}
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        e = json.loads(line)
+                    except ValueError:
+                        continue  # torn line from a crashed writer
+                    prev = entries.get(e.get("sha256"), {})
+                    entries[e["sha256"]] = {**prev, **e}
+        except FileNotFoundError:
+            pass
+
+        present = {}
+        if os.path.isdir(self.root):
+            for name in os.listdir(self.root):
+                if not name.endswith(".txt"):
+                    continue
+                sha = name[:-4]
+                path = os.path.join(self.root, name)
+                e = entries.get(sha) or {"sha256": sha, "used": os.path.getmtime(path)}
+                e["size"] = os.path.getsize(path)
+                present[sha] = e
+        return present
+
+    def total_bytes(self):
+        return sum(e["size"] for e in self.entries().values())
+
+    def evict(self, max_bytes=None):
+        """
+        Drop least-recently-used entries until the cache fits in max_bytes
+        (default: the configured cap), then compact the index. Returns the
+        number of entries removed.
+        """
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(e["size"] for e in entries.values())
+        removed = 0
+        for e in sorted(entries.values(), key=lambda e: e.get("used", 0)):
+            if total <= limit:
+                break
+            try:
+                os.remove(self._path(e["sha256"]))
+            except FileNotFoundError:
+                pass
+            total -= e["size"]
+            del entries[e["sha256"]]
+            removed += 1
+
+        if os.path.isdir(self.root):
+            tmp = self.index_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for e in sorted(entries.values(), key=lambda e: e.get("used", 0)):
+                    f.write(json.dumps(e, ensure_ascii=False) + "\n")
+            os.replace(tmp, self.index_path)
+        if removed:
+            logger.info("Text cache: evicted %d entries, %.1f MB left.",
+                        removed, total / 1024 / 1024)
+        return removed
+
+
+_default = None
+
+
+def get_cache():
+    """The process-wide cache, or None when disabled via TEXT_CACHE=0."""
+    global _default
+    if os.environ.get("TEXT_CACHE", "1") == "0":
+        return None
+    if _default is None:
+        _default = TextCache()
+    return _default
+
+
+def main(argv=None):
+    from cdc_common import setup_logging
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Manage the extracted-text cache.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ev = sub.add_parser("evict", help="drop least-recently-used entries over the size cap")
+    ev.add_argument("--max-mb", type=float, default=None,
+                    help="size cap in MB (default: TEXT_CACHE_MAX_MB or %d)" % DEFAULT_MAX_MB)
+    sub.add_parser("stats", help="show entry count and total size")
+    args = parser.parse_args(argv)
+
+    cache = TextCache()
+    if args.command == "evict":
+        limit = None if args.max_mb is None else int(args.max_mb * 1024 * 1024)
+        removed = cache.evict(limit)
+        logger.info("Evicted %d entries from %s.", removed, cache.root)
+    else:
+        entries = cache.entries()
+        logger.info("%s: %d entries, %.1f MB (cap %.1f MB).", cache.root, len(entries),
+                    sum(e["size"] for e in entries.values()) / 1024 / 1024,
+                    cache.max_bytes / 1024 / 1024)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
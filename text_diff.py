@@ -0,0 +1,221 @@
+"""
+text_diff.py - Size-adaptive text diff behind scraper.diff_texts.
+
+A character-level difflib.SequenceMatcher over a whole section is fine for a
+short 臨床條件 but roughly quadratic on long manual sections (防疫措施,
+流行病學), and a run where many manuals change at once could spend most of its
+time there. diff_opcodes() therefore picks its strategy by size:
+
+  * small inputs (len(a) * len(b) <= SMALL_CELLS) -- plain character-level
+    SequenceMatcher, exactly as before, so short sections diff identically;
+  * larger ones -- common prefix/suffix trimmed, the middle split into
+    sentence/line tokens (ending at 。；！？ or a newline) and diffed with
+    Myers' O(ND) algorithm, then only the changed hunks are refined to
+    characters with SequenceMatcher.
+
+All of it is charged against one hard budget of comparison "cells" (default
+DIFF_BUDGET = 4M): the token pass may use at most budget / (N + M) edit steps,
+and a hunk is refined only while len(old) * len(new) still fits in what is
+left. Whatever doesn't fit is reported coarsely as one 'replace', which the
+renderer shows as the old text struck out followed by the new text.
+
+The result is a SequenceMatcher-style opcode list over character offsets.
+compact_diff() turns it into the form stored in the records' *_diff fields:
+just the deleted strings and run lengths into the new text, which the
+dashboards' renderDiff() (dashboard_common.SECURITY_JS) turns into the allowed
+<del>/<b> markup client-side.
+"""
+import os
+import re
+import difflib
+
+DEFAULT_BUDGET = 4_000_000
+SMALL_CELLS = 250_000
+
+# A sentence (up to and including its 。；！？ / newline run) or a trailing fragment.
+_TOKEN = re.compile(r'[^\n。；！？]*[\n。；！？]+|[^\n。；！？]+')
+
+
+def configured_budget():
+    """Comparison budget from DIFF_BUDGET (> 0)."""
+    try:
+        budget = int(os.environ.get("DIFF_BUDGET", DEFAULT_BUDGET))
+    except ValueError:
+        return DEFAULT_BUDGET
+    return budget if budget > 0 else DEFAULT_BUDGET
+
+
+def tokenize(text):
+    """Split text into sentence/line tokens; ''.join(tokenize(t)) == t."""
+    return _TOKEN.findall(text)
+
+
+def _myers_blocks(a, b, max_d):
+    """
+    Matching blocks (i, j, size) of a shortest edit script between sequences
+    a and b (Myers 1986, greedy forward search), or None if it needs more
+    than max_d insertions + deletions.
+    """
+    n, m = len(a), len(b)
+    max_d = min(max_d, n + m)
+    offset = max_d + 1
+    v = [0] * (2 * max_d + 3)
+    trace = []
+    for d in range(max_d + 1):
+        # v as it was before step d, for k in -d-1 .. d+1 (backtracking needs it).
+        trace.append(v[offset - d - 1:offset + d + 2])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]          # step down (insertion)
+            else:
+                x = v[offset + k - 1] + 1      # step right (deletion)
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, n, m)
+    return None
+
+
+def _backtrack(trace, x, y):
+    blocks = []
+    for d in range(len(trace) - 1, 0, -1):
+        v, base = trace[d], d + 1      # v[k + base] is diagonal k after step d-1
+        k = x - y
+        if k == -d or (k != d and v[k - 1 + base] < v[k + 1 + base]):
+            prev_k = k + 1             # came down: insertion
+        else:
+            prev_k = k - 1             # came right: deletion
+        prev_x = v[prev_k + base]
+        mid_x = prev_x if prev_k == k + 1 else prev_x + 1
+        if x > mid_x:                  # the diagonal (matching run) after the edit
+            blocks.append((mid_x, mid_x - k, x - mid_x))
+        x, y = prev_x, prev_x - prev_k
+    if x > 0:                          # the initial run from (0, 0)
+        blocks.append((0, 0, x))
+    blocks.reverse()
+    return blocks
+
+
+def _change(i1, i2, j1, j2):
+    tag = 'replace' if i1 < i2 and j1 < j2 else ('delete' if i1 < i2 else 'insert')
+    return (tag, i1, i2, j1, j2)
+
+
+def _opcodes_from_blocks(blocks, n, m):
+    ops = []
+    i = j = 0
+    for bi, bj, size in blocks + [(n, m, 0)]:
+        if i < bi or j < bj:
+            ops.append(_change(i, bi, j, bj))
+        if size:
+            ops.append(('equal', bi, bi + size, bj, bj + size))
+        i, j = bi + size, bj + size
+    return ops
+
+
+def _merge(ops):
+    """Join adjacent equal ops and adjacent change ops (delete+insert -> replace)."""
+    out = []
+    for op in ops:
+        if op[1] == op[2] and op[3] == op[4]:
+            continue
+        if out and (out[-1][0] == 'equal') == (op[0] == 'equal'):
+            i1, j1 = out[-1][1], out[-1][3]
+            out[-1] = (('equal', i1, op[2], j1, op[4]) if op[0] == 'equal'
+                       else _change(i1, op[2], j1, op[4]))
+        else:
+            out.append(op)
+    return out
+
+
+def _char_opcodes(a, b, i0=0, j0=0):
+    return [(tag, i1 + i0, i2 + i0, j1 + j0, j2 + j0)
+            for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b).get_opcodes()]
+
+
+def diff_opcodes(a, b, budget=None):
+    """
+    SequenceMatcher-style opcodes [(tag, i1, i2, j1, j2), ...] turning string
+    a into string b, computed size-adaptively within `budget` comparison cells
+    (see the module docstring). Tags: equal / replace / delete / insert.
+    """
+    budget = configured_budget() if budget is None else budget
+    if len(a) * len(b) <= SMALL_CELLS:
+        return _char_opcodes(a, b)
+
+    # Trim the common prefix / suffix: most edits touch a small part of a section.
+    n, m = len(a), len(b)
+    pre = 0
+    while pre < n and pre < m and a[pre] == b[pre]:
+        pre += 1
+    suf = 0
+    while suf < n - pre and suf < m - pre and a[n - 1 - suf] == b[m - 1 - suf]:
+        suf += 1
+    ops = [('equal', 0, pre, 0, pre)]
+    mid_a, mid_b = a[pre:n - suf], b[pre:m - suf]
+
+    ta, tb = tokenize(mid_a), tokenize(mid_b)
+    blocks = None
+    if ta and tb:
+        ids = {}
+        width = len(ta) + len(tb)
+        blocks = _myers_blocks([ids.setdefault(t, len(ids)) for t in ta],
+                               [ids.setdefault(t, len(ids)) for t in tb],
+                               budget // width)
+        if blocks is not None:
+            edits = width - 2 * sum(size for _, _, size in blocks)
+            budget -= width * (edits + 1)
+    if blocks is None:
+        # Over budget (or one side empty): one coarse replace / insert / delete.
+        ops.append(_change(pre, n - suf, pre, m - suf))
+    else:
+        # Token offsets -> character offsets.
+        pos_a = [pre]
+        for t in ta:
+            pos_a.append(pos_a[-1] + len(t))
+        pos_b = [pre]
+        for t in tb:
+            pos_b.append(pos_b[-1] + len(t))
+        for tag, i1, i2, j1, j2 in _opcodes_from_blocks(blocks, len(ta), len(tb)):
+            ca1, ca2, cb1, cb2 = pos_a[i1], pos_a[i2], pos_b[j1], pos_b[j2]
+            cost = (ca2 - ca1) * (cb2 - cb1)
+            if tag == 'replace' and cost <= budget:
+                budget -= cost
+                ops.extend(_char_opcodes(a[ca1:ca2], b[cb1:cb2], ca1, cb1))
+            else:
+                ops.append((tag, ca1, ca2, cb1, cb2))
+    ops.append(('equal', n - suf, n, m - suf, m))
+    return _merge(ops)
+
+
+def compact_diff(a, b, budget=None):
+    """
+    The diff from a to b in the compact form stored in the *_diff fields:
+    a list walking through the NEW text b (which the record already holds),
+    where
+
+      * an int n        -- the next n characters of b are unchanged,
+      * ["+", n]        -- the next n characters of b were inserted,
+      * ["-", "text"]   -- "text" of a was deleted here.
+
+    Offsets count code points (Python str indices). Like the old HTML diffs,
+    a diff against an empty a is the whole of b unchanged (nothing to compare
+    against), and a diff to an empty b is empty.
+    """
+    if not a:
+        return [len(b)] if b else []
+    if not b:
+        return []
+    ops = []
+    for tag, i1, i2, j1, j2 in diff_opcodes(a, b, budget):
+        if tag == 'equal':
+            ops.append(j2 - j1)
+            continue
+        if i2 > i1:
+            ops.append(["-", a[i1:i2]])
+        if j2 > j1:
+            ops.append(["+", j2 - j1])
+    return ops
@@ -0,0 +1,196 @@
+"""
+throttle.py - Politeness and failure handling for every request to CDC.
+
+cdc_common.fetch routes each attempt through one process-wide AdaptiveLimiter
+and CircuitBreaker (get_limiter() / get_breaker() there), so the listing pages,
+viewer pages and PDF downloads of every pipeline worker share a single view of
+how the host is doing:
+
+  * TokenBucket -- the basic thread-safe rate limit (tokens/sec, small bursts).
+  * AdaptiveLimiter -- a TokenBucket whose rate moves AIMD-style: it creeps up
+    by a fixed step while responses are fast and clean, and is cut in half on
+    a 429/5xx/connection error or when latency (EWMA) climbs past the target.
+    A Retry-After (or retry backoff) pauses ALL callers until it has passed,
+    not just the request that got it.
+  * CircuitBreaker -- after `threshold` consecutive failures the host is
+    considered down: requests fail fast with CircuitOpenError for `cooldown`
+    seconds, then a single trial request decides whether to close it again.
+
+Tunables come from the environment: SCRAPER_RATE (starting requests/sec,
+default 2.0), SCRAPER_MIN_RATE / SCRAPER_MAX_RATE (defaults 0.2 / 8.0),
+SCRAPER_LATENCY_TARGET (seconds, default 2.0), BREAKER_THRESHOLD (default 8)
+and BREAKER_COOLDOWN (seconds, default 60).
+"""
+import os
+import time
+import logging
+import threading
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE = 2.0
+DEFAULT_MIN_RATE = 0.2
+DEFAULT_MAX_RATE = 8.0
+DEFAULT_LATENCY_TARGET = 2.0
+DEFAULT_BREAKER_THRESHOLD = 8
+DEFAULT_BREAKER_COOLDOWN = 60.0
+
+
+def _env_float(name, default):
+    try:
+        value = float(os.environ.get(name, default))
+    except ValueError:
+        return default
+    return value if value > 0 else default
+
+
+def configured_rate():
+    """Starting request rate (per second) from SCRAPER_RATE (> 0)."""
+    return _env_float("SCRAPER_RATE", DEFAULT_RATE)
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of sending a request while the circuit breaker is open."""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills at `rate` tokens/sec up to `capacity`.
+
+    acquire() blocks until a token is available, so any number of worker
+    threads sharing one bucket collectively stay under `rate` requests/sec
+    (with short bursts of at most `capacity`).
+    """
+
+    def __init__(self, rate, capacity=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Reservation style: take the token now (the balance may go negative)
+        # and sleep off the debt outside the lock, so waiters queue up fairly.
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity,
+                               self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            self._sleep(wait)
+
+
+class AdaptiveLimiter(TokenBucket):
+    """TokenBucket with an AIMD-controlled rate and a shared pause (Retry-After)."""
+
+    def __init__(self, rate=None, min_rate=None, max_rate=None, latency_target=None,
+                 step=0.1, clock=time.monotonic, sleep=time.sleep):
+        rate = configured_rate() if rate is None else rate
+        super().__init__(rate, clock=clock, sleep=sleep)
+        self.min_rate = _env_float("SCRAPER_MIN_RATE", DEFAULT_MIN_RATE) if min_rate is None else min_rate
+        self.max_rate = max(rate, _env_float("SCRAPER_MAX_RATE", DEFAULT_MAX_RATE)
+                            if max_rate is None else max_rate)
+        self.latency_target = (_env_float("SCRAPER_LATENCY_TARGET", DEFAULT_LATENCY_TARGET)
+                               if latency_target is None else latency_target)
+        self.step = step
+        self.latency = None      # EWMA of response time, seconds
+        self.error_rate = 0.0    # EWMA of failed attempts
+        self.throttled = 0
+        self._paused_until = 0.0
+
+    def acquire(self):
+        with self._lock:
+            wait = self._paused_until - self._clock()
+        if wait > 0:
+            self._sleep(wait)
+        super().acquire()
+
+    def _observe(self, failed, latency=None):
+        # Caller holds self._lock.
+        self.error_rate = 0.8 * self.error_rate + (0.2 if failed else 0.0)
+        if latency is not None:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+
+    def record_success(self, latency):
+        with self._lock:
+            self._observe(False, latency)
+            if self.latency > self.latency_target:
+                self.rate = max(self.min_rate, self.rate * 0.9)   # slowing down: ease off
+            else:
+                self.rate = min(self.max_rate, self.rate + self.step)
+
+    def record_failure(self, pause=None):
+        """A 429/5xx/connection error: halve the rate and pause everyone for `pause` s."""
+        with self._lock:
+            self._observe(True)
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate * 0.5)
+            if pause:
+                self._paused_until = max(self._paused_until, self._clock() + pause)
+
+    def summary(self):
+        latency = f"{self.latency:.2f}s" if self.latency is not None else "n/a"
+        return (f"Rate limiter: {self.rate:.2f} req/s, latency EWMA {latency}, "
+                f"error rate {self.error_rate:.0%}, {self.throttled} backoffs")
+
+
+class CircuitBreaker:
+    """closed -> (threshold consecutive failures) -> open -> (cooldown) -> half-open."""
+
+    def __init__(self, threshold=None, cooldown=None, clock=time.monotonic):
+        self.threshold = int(_env_float("BREAKER_THRESHOLD", DEFAULT_BREAKER_THRESHOLD)
+                             if threshold is None else threshold)
+        self.cooldown = (_env_float("BREAKER_COOLDOWN", DEFAULT_BREAKER_COOLDOWN)
+                         if cooldown is None else cooldown)
+        self.trips = 0
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at < self.cooldown:
+            return "open"
+        return "half-open"
+
+    def before_request(self):
+        """Raise CircuitOpenError unless a request may be sent right now."""
+        with self._lock:
+            state = self._state()
+            if state == "open" or (state == "half-open" and self._trial_in_flight):
+                raise CircuitOpenError(
+                    f"circuit open after {self._failures} consecutive failures")
+            if state == "half-open":
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            trial_failed = self._trial_in_flight
+            self._trial_in_flight = False
+            if trial_failed or (self._opened_at is None and self._failures >= self.threshold):
+                self.trips += 1
+                self._opened_at = self._clock()
+                logger.warning("Circuit breaker open: %d consecutive failures; "
+                               "pausing requests for %ss.", self._failures, self.cooldown)